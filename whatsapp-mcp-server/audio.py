@@ -1,41 +1,196 @@
+import asyncio
+import json
 import os
 import subprocess
 import tempfile
+import threading
+import time
+import warnings
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Tuple
 
-def convert_to_opus_ogg(input_file, output_file=None, bitrate="32k", sample_rate=24000):
+import stats
+from cache import DiskCache
+
+# Converted clips are cached here, keyed by input content and encoding parameters
+AUDIO_CACHE_DIR = os.getenv('AUDIO_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'whatsapp-mcp-audio'))
+
+# Total size of the conversion cache; least recently used clips are evicted first
+AUDIO_CACHE_MAX_BYTES = int(os.getenv('AUDIO_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+
+# Concurrent ffmpeg processes in a ConversionPool (ffmpeg's Opus encoder is
+# single-threaded, so one per core saturates the machine)
+FFMPEG_WORKERS = int(os.getenv('FFMPEG_WORKERS', str(os.cpu_count() or 1)))
+
+# Seconds before a conversion is killed
+FFMPEG_TIMEOUT = float(os.getenv('FFMPEG_TIMEOUT', '300'))
+
+# Extensions picked up when a directory is converted from the command line
+AUDIO_EXTENSIONS = {
+    ".mp3", ".wav", ".m4a", ".aac", ".flac", ".ogg", ".opus", ".oga", ".webm",
+    ".mka", ".wma", ".amr", ".3gp", ".mp4", ".aiff", ".aif"
+}
+
+# Bump when the ffmpeg arguments change so stale conversions are not reused
+ENCODER_VERSION = 2
+
+@dataclass
+class AudioInfo:
+    container: str
+    codec: Optional[str]
+    sample_rate: Optional[int]
+    channels: Optional[int]
+
+    @property
+    def is_ogg_opus(self) -> bool:
+        return self.codec == "opus" and self.container == "ogg"
+
+
+def probe_audio(input_file, timeout=30) -> Optional[AudioInfo]:
+    """
+    Inspect a file's container and first audio stream with ffprobe.
+
+    Returns:
+        Optional[AudioInfo]: None if ffprobe is missing or cannot read the file
+    """
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "a:0",
+        "-show_entries", "format=format_name:stream=codec_name,sample_rate,channels",
+        "-of", "json",
+        input_file
+    ]
+    try:
+        with stats.timer(stats.AUDIO, "probe"):
+            process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                     timeout=timeout, check=True)
+        result = json.loads(process.stdout)
+    except (OSError, subprocess.SubprocessError, json.JSONDecodeError):
+        return None
+
+    streams = result.get("streams") or [{}]
+    stream = streams[0]
+    # format_name lists every name of the demuxer, e.g. "matroska,webm"
+    container = (result.get("format") or {}).get("format_name", "").split(",")[0]
+    return AudioInfo(
+        container=container,
+        codec=stream.get("codec_name"),
+        sample_rate=int(stream["sample_rate"]) if stream.get("sample_rate") else None,
+        channels=stream.get("channels")
+    )
+
+
+def _run_ffmpeg(cmd, timeout=None, cancel_event=None, stdout=subprocess.PIPE):
+    """
+    Run an ffmpeg command, killing it on timeout or when `cancel_event` is set.
+
+    Args:
+        stdout: Where ffmpeg's standard output goes, e.g. the open destination
+            file when the command writes to pipe:1
+
+    Raises:
+        RuntimeError: If ffmpeg fails, times out or is cancelled
+    """
+    deadline = time.monotonic() + timeout if timeout else None
+    process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=stdout, stderr=subprocess.PIPE, text=True)
+    while True:
+        try:
+            # Wake up periodically to honour cancellation
+            _, stderr = process.communicate(timeout=0.5 if cancel_event is not None else
+                                            (max(0.0, deadline - time.monotonic()) if deadline else None))
+            break
+        except subprocess.TimeoutExpired:
+            cancelled = cancel_event is not None and cancel_event.is_set()
+            if cancelled or (deadline and time.monotonic() >= deadline):
+                process.kill()
+                process.communicate()
+                raise RuntimeError("Audio conversion cancelled" if cancelled else
+                                   f"Audio conversion timed out after {timeout:.0f}s")
+    if process.returncode != 0:
+        raise RuntimeError(f"Failed to convert audio. You likely need to install ffmpeg {stderr}")
+
+
+def _output_path(input_file, output_dir=None):
+    """Where input_file's .ogg goes by default: next to it, or in output_dir."""
+    stem = os.path.splitext(os.path.basename(input_file))[0]
+    output_file = os.path.join(output_dir or os.path.dirname(input_file), stem + ".ogg")
+    if os.path.abspath(output_file) == os.path.abspath(input_file):
+        # ffmpeg cannot overwrite its own input
+        output_file = os.path.join(output_dir or os.path.dirname(input_file), stem + ".opus.ogg")
+    return output_file
+
+
+def _run_ffmpeg_to(cmd, input_file, output_file, stage, timeout=None, cancel_event=None):
+    """
+    Run an ffmpeg command that writes to pipe:1 and move its output to `output_file`.
+
+    ffmpeg writes to a temporary file next to the destination, which only
+    replaces `output_file` once the command succeeds; on failure it is
+    removed, so no partial file is left behind.
+
+    Raises:
+        ValueError: If `output_file` is the input file
+        RuntimeError: If ffmpeg fails, times out or is cancelled
+    """
+    if os.path.abspath(output_file) == os.path.abspath(input_file) or (
+            os.path.exists(output_file) and os.path.samefile(output_file, input_file)):
+        raise ValueError(f"Output file must differ from the input file: {output_file}")
+
+    # Ensure the output directory exists
+    output_dir = os.path.dirname(output_file)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    # Same prefix as DiskCache's temporary files, which it cleans up if left behind
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=output_dir or ".")
+    try:
+        with os.fdopen(fd, "wb") as output, stats.timer(stats.AUDIO, stage):
+            _run_ffmpeg(cmd, timeout, cancel_event, stdout=output)
+        os.replace(tmp_path, output_file)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return output_file
+
+
+def convert_to_opus_ogg(input_file, output_file=None, bitrate="32k", sample_rate=24000,
+                        timeout=None, cancel_event=None):
     """
     Convert an audio file to Opus format in an Ogg container.
     
     Args:
         input_file (str): Path to the input audio file
         output_file (str, optional): Path to save the output file. If None, replaces the
-                                    extension of input_file with .ogg
+                                    extension of input_file with .ogg (.opus.ogg if
+                                    input_file already ends in .ogg)
         bitrate (str, optional): Target bitrate for Opus encoding (default: "32k")
         sample_rate (int, optional): Sample rate for output (default: 24000)
+        timeout (float, optional): Seconds before ffmpeg is killed (default: no limit)
+        cancel_event (threading.Event, optional): Kills ffmpeg when set
     
     Returns:
         str: Path to the converted file
         
     Raises:
         FileNotFoundError: If the input file doesn't exist
-        RuntimeError: If the ffmpeg conversion fails
+        ValueError: If output_file is the input file
+        RuntimeError: If the ffmpeg conversion fails, times out or is cancelled
     """
     if not os.path.isfile(input_file):
         raise FileNotFoundError(f"Input file not found: {input_file}")
     
     # If no output file is specified, replace the extension with .ogg
     if output_file is None:
-        output_file = os.path.splitext(input_file)[0] + ".ogg"
-    
-    # Ensure the output directory exists
-    output_dir = os.path.dirname(output_file)
-    if output_dir and not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+        output_file = _output_path(input_file)
     
-    # Build the ffmpeg command
+    # Build the ffmpeg command. The input is read by path because MP4/M4A
+    # need seeking; the encoded stream is piped into a file next to output_file
     cmd = [
         "ffmpeg",
+        "-v", "error",
         "-i", input_file,
+        "-vn",                  # Drop cover art and video tracks
         "-c:a", "libopus",
         "-b:a", bitrate,
         "-ar", str(sample_rate),
@@ -43,68 +198,271 @@ def convert_to_opus_ogg(input_file, output_file=None, bitrate="32k", sample_rate
         "-vbr", "on",           # Variable bitrate
         "-compression_level", "10",  # Maximum compression
         "-frame_duration", "60",     # 60ms frames (good for voice)
-        "-y",                        # Overwrite output file if it exists
-        output_file
+        "-f", "ogg",
+        "pipe:1"
     ]
     
-    try:
-        # Run the ffmpeg command and capture output
-        process = subprocess.run(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=True
-        )
-        return output_file
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to convert audio. You likely need to install ffmpeg {e.stderr}")
+    return _run_ffmpeg_to(cmd, input_file, output_file, "encode", timeout, cancel_event)
 
 
-def convert_to_opus_ogg_temp(input_file, bitrate="32k", sample_rate=24000):
+def remux_to_ogg(input_file, output_file, timeout=None, cancel_event=None):
     """
-    Convert an audio file to Opus format in an Ogg container and store in a temporary file.
-    
+    Copy the first audio stream of an Opus file into an Ogg container without re-encoding.
+
+    Args:
+        input_file (str): Path to a file whose audio is already Opus (e.g. .webm, .mka)
+        output_file (str): Path to save the .ogg file
+
+    Returns:
+        str: Path to the remuxed file
+
+    Raises:
+        ValueError: If output_file is the input file
+        RuntimeError: If ffmpeg fails, times out or is cancelled
+    """
+    cmd = [
+        "ffmpeg",
+        "-v", "error",
+        "-i", input_file,
+        "-map", "0:a:0",
+        "-c:a", "copy",
+        "-f", "ogg",
+        "pipe:1"
+    ]
+    return _run_ffmpeg_to(cmd, input_file, output_file, "remux", timeout, cancel_event)
+
+
+_cache = DiskCache(AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES)
+
+
+def convert_to_opus_ogg_cached(input_file, bitrate="32k", sample_rate=24000):
+    """
+    Convert an audio file to Opus in an Ogg container, reusing earlier conversions.
+
+    The result is cached by the input's content hash and the encoding
+    parameters, so sending the same clip again skips ffmpeg entirely. The
+    returned file belongs to the cache: callers must not modify or delete it.
+
     Args:
         input_file (str): Path to the input audio file
         bitrate (str, optional): Target bitrate for Opus encoding (default: "32k")
         sample_rate (int, optional): Sample rate for output (default: 24000)
-    
+
     Returns:
-        str: Path to the temporary file with the converted audio
-        
+        str: Path to the converted file in AUDIO_CACHE_DIR
+
     Raises:
         FileNotFoundError: If the input file doesn't exist
         RuntimeError: If the ffmpeg conversion fails
     """
-    # Create a temporary file with .ogg extension
-    temp_file = tempfile.NamedTemporaryFile(suffix=".ogg", delete=False)
-    temp_file.close()
-    
+    if not os.path.isfile(input_file):
+        raise FileNotFoundError(f"Input file not found: {input_file}")
+
+    key = _cache.content_key(input_file, ENCODER_VERSION, bitrate, sample_rate)
+    return _cache.get_or_create(
+        key,
+        lambda tmp_path: convert_to_opus_ogg(input_file, tmp_path, bitrate, sample_rate),
+        suffix=".ogg"
+    )
+
+
+def prepare_voice_note(input_file, bitrate="32k", sample_rate=24000):
+    """
+    Return a path to an Ogg/Opus version of an audio file, doing as little work as possible.
+
+    The file is probed rather than judged by its extension: Ogg/Opus is
+    used as is, Opus in another container (.webm, .mka, ...) is remuxed
+    without re-encoding, and anything else, including Vorbis .ogg files,
+    is transcoded. Remuxes and transcodes go through the conversion cache.
+
+    Args:
+        input_file (str): Path to the input audio file
+        bitrate (str, optional): Target bitrate when transcoding (default: "32k")
+        sample_rate (int, optional): Sample rate when transcoding (default: 24000)
+
+    Returns:
+        str: input_file itself, or a path in AUDIO_CACHE_DIR
+
+    Raises:
+        FileNotFoundError: If the input file doesn't exist
+        RuntimeError: If the ffmpeg conversion fails
+    """
+    if not os.path.isfile(input_file):
+        raise FileNotFoundError(f"Input file not found: {input_file}")
+
+    info = probe_audio(input_file)
+    if info is not None and info.is_ogg_opus:
+        return input_file
+    if info is not None and info.codec == "opus":
+        key = _cache.content_key(input_file, ENCODER_VERSION, "remux")
+        return _cache.get_or_create(key, lambda tmp_path: remux_to_ogg(input_file, tmp_path), suffix=".ogg")
+    # Unknown (no ffprobe) or another codec: transcode
+    return convert_to_opus_ogg_cached(input_file, bitrate, sample_rate)
+
+
+class ConversionJob:
+    """A conversion submitted to a ConversionPool."""
+
+    def __init__(self, input_file, output_file, future: Future, cancel_event: threading.Event):
+        self.input_file = input_file
+        self.output_file = output_file
+        self.future = future
+        self._cancel_event = cancel_event
+
+    def result(self, timeout=None):
+        """Wait for the converted file's path; re-raises the conversion's error."""
+        return self.future.result(timeout)
+
+    def cancel(self):
+        """Drop the job if it is still queued, or kill its ffmpeg process."""
+        self._cancel_event.set()
+        self.future.cancel()
+
+
+class ConversionPool:
+    """
+    Runs up to `workers` ffmpeg conversions at a time.
+
+    Jobs are submitted from any thread and return a ConversionJob; asyncio
+    callers await `convert`, which kills ffmpeg if the awaiting task is
+    cancelled.
+    """
+
+    def __init__(self, workers=FFMPEG_WORKERS, timeout=FFMPEG_TIMEOUT):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ffmpeg")
+
+    def submit(self, input_file, output_file=None, bitrate="32k", sample_rate=24000, timeout=None) -> ConversionJob:
+        """Queue one conversion (same arguments as convert_to_opus_ogg)."""
+        if output_file is None:
+            output_file = _output_path(input_file)
+        cancel_event = threading.Event()
+        future = self._executor.submit(
+            convert_to_opus_ogg, input_file, output_file, bitrate, sample_rate,
+            timeout or self.timeout, cancel_event
+        )
+        return ConversionJob(input_file, output_file, future, cancel_event)
+
+    def convert_many(self, jobs: Iterable[Tuple[str, Optional[str]]], bitrate="32k", sample_rate=24000,
+                     timeout=None) -> Iterator[Tuple[ConversionJob, Optional[Exception]]]:
+        """
+        Convert (input_file, output_file) pairs, yielding (job, error) as each one finishes.
+
+        If the caller stops iterating (or is interrupted), pending jobs are cancelled.
+        """
+        submitted = {}
+        for input_file, output_file in jobs:
+            job = self.submit(input_file, output_file, bitrate, sample_rate, timeout)
+            submitted[job.future] = job
+        try:
+            for future in as_completed(submitted):
+                yield submitted[future], future.exception()
+        finally:
+            for job in submitted.values():
+                job.cancel()
+
+    async def convert(self, input_file, output_file=None, bitrate="32k", sample_rate=24000, timeout=None) -> str:
+        """Async convert_to_opus_ogg on the pool."""
+        job = self.submit(input_file, output_file, bitrate, sample_rate, timeout)
+        try:
+            return await asyncio.wrap_future(job.future)
+        except asyncio.CancelledError:
+            job.cancel()
+            raise
+
+    def shutdown(self, cancel=True):
+        self._executor.shutdown(wait=True, cancel_futures=cancel)
+
+
+def _collect_inputs(paths: List[str]) -> List[str]:
+    """Expand directories (non-recursively) into the audio files they contain."""
+    inputs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                full = os.path.join(path, name)
+                if os.path.isfile(full) and os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS:
+                    inputs.append(full)
+        else:
+            inputs.append(path)
+    return inputs
+
+
+def _plan(argv=None):
+    """Parse the command line into the options and the (input_file, output_file) pairs to convert."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Convert audio files to Opus/Ogg voice notes in parallel.",
+        usage="%(prog)s [options] inputs [inputs ...]\n       %(prog)s input_file --output output_file"
+    )
+    parser.add_argument("inputs", nargs="+", help="audio files or directories of audio files")
+    parser.add_argument("-o", "--output-dir", help="where to write the .ogg files (default: next to each input)")
+    parser.add_argument("--output", help="output file when converting a single input file")
+    parser.add_argument("-j", "--jobs", type=int, default=FFMPEG_WORKERS,
+                        help=f"concurrent ffmpeg processes (default: {FFMPEG_WORKERS})")
+    parser.add_argument("--bitrate", default="32k", help="Opus bitrate (default: 32k)")
+    parser.add_argument("--sample-rate", type=int, default=24000, help="output sample rate (default: 24000)")
+    parser.add_argument("--timeout", type=float, default=FFMPEG_TIMEOUT,
+                        help=f"seconds before a conversion is killed (default: {FFMPEG_TIMEOUT:.0f})")
+    args = parser.parse_args(argv)
+
+    # The old single-file form, `audio.py input_file output_file`. Only taken
+    # when output_file does not exist yet, so an existing file is never
+    # overwritten by mistake: two existing files are converted side by side
+    if (args.output is None and args.output_dir is None and len(args.inputs) == 2
+            and os.path.isfile(args.inputs[0]) and not os.path.exists(args.inputs[1])):
+        warnings.warn(
+            "'audio.py input_file output_file' is deprecated, use 'audio.py input_file --output output_file'",
+            DeprecationWarning, stacklevel=2
+        )
+        args.inputs, args.output = args.inputs[:1], args.inputs[1]
+
+    if args.output is not None:
+        if args.output_dir is not None:
+            parser.error("--output and --output-dir cannot be combined")
+        if len(args.inputs) != 1 or os.path.isdir(args.inputs[0]):
+            parser.error("--output needs exactly one input file")
+        return args, [(args.inputs[0], args.output)]
+    inputs = _collect_inputs(args.inputs)
+    return args, [(input_file, _output_path(input_file, args.output_dir)) for input_file in inputs]
+
+
+def main(argv=None):
+    args, jobs = _plan(argv)
+    if not jobs:
+        print("No audio files found")
+        return 1
+
+    pool = ConversionPool(args.jobs, args.timeout)
+    converted = failed = 0
+    input_bytes = 0
+    start = time.perf_counter()
     try:
-        # Convert the audio
-        convert_to_opus_ogg(input_file, temp_file.name, bitrate, sample_rate)
-        return temp_file.name
-    except Exception as e:
-        # Clean up the temporary file if conversion fails
-        if os.path.exists(temp_file.name):
-            os.unlink(temp_file.name)
-        raise e
+        for job, error in pool.convert_many(jobs, args.bitrate, args.sample_rate):
+            if error is None:
+                converted += 1
+                input_bytes += os.path.getsize(job.input_file)
+                print(f"{job.input_file} -> {job.output_file}")
+            else:
+                failed += 1
+                print(f"Error converting {job.input_file}: {error}")
+    except KeyboardInterrupt:
+        print("Interrupted, cancelling pending conversions")
+    finally:
+        pool.shutdown()
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Converted {converted} file(s), {failed} failed, in {elapsed:.1f}s with {pool.workers} worker(s): "
+        f"{converted / elapsed if elapsed else 0:.1f} files/s, "
+        f"{input_bytes / 1024 / 1024 / elapsed if elapsed else 0:.1f} MiB/s of input"
+    )
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
-    # Example usage
     import sys
-    
-    if len(sys.argv) < 2:
-        print("Usage: python audio.py input_file [output_file]")
-        sys.exit(1)
-    
-    input_file = sys.argv[1]
-    
-    try:
-        result = convert_to_opus_ogg_temp(input_file)
-        print(f"Successfully converted to: {result}")
-    except Exception as e:
-        print(f"Error: {e}")
-        sys.exit(1)
+
+    sys.exit(main())
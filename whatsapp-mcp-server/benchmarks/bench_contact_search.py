@@ -0,0 +1,113 @@
+"""Benchmark of search_contacts over the trigram contact index.
+
+Builds a synthetic whatsapp.db with N contacts (accented Spanish names) in a
+temporary store directory and reports index build time plus p50/p99 lookup
+latency for a fixed mix of queries (prefixes, full names, typos, misses).
+Above FUZZY_SCAN_BUDGET contacts the fuzzy pass is approximate; "same as
+exact" counts the queries whose results match a scan of every contact.
+
+Needs the `bench` extra (fuzzywuzzy, for the --linear baseline).
+
+Usage:
+    uv run --extra bench benchmarks/bench_contact_search.py [--sizes 10000 100000 1000000] [--linear]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+from fuzzywuzzy import fuzz as fuzzywuzzy_fuzz, process as fuzzywuzzy_process
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import contact_index
+from fixtures import contact_name
+
+QUERIES = ["jose", "maria perez", "nunez", "begona ibanez", "jsus", "lucia castano",
+           "martinez", "pedro gomez", "joaqin", "xyzzy", "carmen rrochi", "inés bamagué"]
+
+def build_store(store_dir: str, size: int):
+    rng = random.Random(size)
+    conn = sqlite3.connect(os.path.join(store_dir, "whatsapp.db"))
+    conn.execute("""
+        CREATE TABLE whatsmeow_contacts (
+            our_jid TEXT, their_jid TEXT, first_name TEXT, full_name TEXT,
+            push_name TEXT, business_name TEXT, PRIMARY KEY (our_jid, their_jid)
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO whatsmeow_contacts VALUES ('me@s.whatsapp.net', ?, NULL, ?, NULL, NULL)",
+        ((f"{5491100000000 + i}@s.whatsapp.net",
+          contact_name(rng, i))
+         for i in range(size))
+    )
+    conn.commit()
+    conn.close()
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def linear_search(wc, query, limit=25):
+    """Pre-index search path: substring check + fuzzywuzzy over every name."""
+    normalized_query = wc.normalize(query)
+    candidates = [entry.normalized for entry in wc._contact_index.entries(False)
+                  if normalized_query not in entry.normalized]
+    return fuzzywuzzy_process.extract(normalized_query, candidates, scorer=fuzzywuzzy_fuzz.partial_ratio, limit=limit * 2)
+
+def run(size: int, rounds: int, linear: bool):
+    with tempfile.TemporaryDirectory() as store_dir:
+        build_store(store_dir, size)
+        os.environ["WHATSAPP_STORE_DIR"] = store_dir
+        sys.modules.pop("whatsapp_contacts", None)
+        import whatsapp_contacts as wc
+        budget = contact_index.FUZZY_SCAN_BUDGET
+
+        start = time.perf_counter()
+        wc._contact_index.refresh(force=True)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        samples = []
+        for _ in range(rounds):
+            for query in QUERIES:
+                start = time.perf_counter()
+                wc.search_contacts(query)
+                samples.append((time.perf_counter() - start) * 1000)
+
+        results = [wc.search_contacts(query) for query in QUERIES]
+        contact_index.FUZZY_SCAN_BUDGET = 0
+        exact = [wc.search_contacts(query) for query in QUERIES]
+        contact_index.FUZZY_SCAN_BUDGET = budget
+        same = sum(found == expected for found, expected in zip(results, exact))
+
+        line = (f"{size:>9} contacts  build {build_ms:9.1f} ms  "
+                f"p50 {statistics.median(samples):7.2f} ms  p99 {percentile(samples, 99):7.2f} ms  "
+                f"same as exact {same}/{len(QUERIES)}")
+
+        if linear:
+            linear_samples = []
+            for query in QUERIES:
+                start = time.perf_counter()
+                linear_search(wc, query)
+                linear_samples.append((time.perf_counter() - start) * 1000)
+            line += f"  linear p50 {statistics.median(linear_samples):9.2f} ms"
+
+        print(line)
+        wc._contact_index.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--linear", action="store_true", help="also time the pre-index linear scan")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        run(size, args.rounds, args.linear)
+
+if __name__ == "__main__":
+    main()
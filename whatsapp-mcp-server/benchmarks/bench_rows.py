@@ -0,0 +1,128 @@
+"""Benchmark of Message row decoding: eager dataclasses vs lazy slotted records.
+
+Builds N synthetic message rows (as selected with MESSAGE_COLUMNS) in an
+in-memory SQLite database, then compares the previous representation (a
+@dataclass with a __dict__, timestamp parsed on construction) with the
+slotted Message record built by its row factory. Reports CPU time to fetch
+and decode every row, to decode already-fetched rows, the bytes each decoded
+row adds (tracemalloc) and the cost of serializing the rows for a tool
+result.
+
+Usage:
+    python benchmarks/bench_rows.py [--rows 100000] [--rounds 5]
+"""
+import argparse
+import gc
+import os
+import sqlite3
+import statistics
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from whatsapp_contacts import MESSAGE_COLUMNS, Message
+
+@dataclass
+class EagerMessage:
+    """Message as it was before records.py."""
+    timestamp: datetime
+    sender: str
+    content: str
+    is_from_me: bool
+    chat_jid: str
+    id: str
+    chat_name: Optional[str] = None
+    media_type: Optional[str] = None
+    is_context: bool = False
+
+def eager_from_row(row) -> EagerMessage:
+    timestamp, sender, chat_name, content, is_from_me, chat_jid, msg_id, media_type = row
+    try:
+        timestamp = datetime.fromisoformat(timestamp)
+    except ValueError:
+        timestamp = datetime.now()
+    return EagerMessage(timestamp=timestamp, sender=sender, content=content, is_from_me=bool(is_from_me),
+                        chat_jid=chat_jid, id=msg_id, chat_name=chat_name, media_type=media_type)
+
+def eager_to_dict(message: EagerMessage) -> dict:
+    result = dict(message.__dict__)
+    result["timestamp"] = message.timestamp.isoformat()
+    return result
+
+def build_db(rows: int) -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE chats (jid TEXT PRIMARY KEY, name TEXT)")
+    conn.execute("""
+        CREATE TABLE messages (id TEXT, chat_jid TEXT, sender TEXT, content TEXT, timestamp TIMESTAMP,
+                               is_from_me BOOLEAN, media_type TEXT, PRIMARY KEY (id, chat_jid))
+    """)
+    conn.executemany("INSERT INTO chats VALUES (?, ?)", ((f"1203630{i:04}@g.us", f"Grupo {i}") for i in range(100)))
+    start = datetime(2024, 1, 1)
+    conn.executemany(
+        "INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?)",
+        ((f"MSG{i:08}", f"1203630{i % 100:04}@g.us", str(5491100000000 + i % 500),
+          "hola, ¿nos vemos mañana para la reunión del proyecto?",
+          (start + timedelta(seconds=17 * i)).isoformat(" ") + "-03:00", i % 3 == 0,
+          "image" if i % 20 == 0 else None)
+         for i in range(rows))
+    )
+    return conn
+
+def fetch(conn: sqlite3.Connection, row_factory=None):
+    cursor = conn.cursor()
+    cursor.row_factory = row_factory
+    return cursor.execute(f"""
+        SELECT {MESSAGE_COLUMNS} FROM messages JOIN chats ON messages.chat_jid = chats.jid
+    """).fetchall()
+
+def decode(rows, row_factory):
+    return [row_factory(None, row) for row in rows]
+
+def retained_bytes(rows, row_factory) -> int:
+    """Bytes allocated by decoding rows (the column values themselves are shared)."""
+    gc.collect()
+    tracemalloc.start()
+    messages = decode(rows, row_factory)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del messages
+    return size
+
+def timed(func, rounds: int) -> float:
+    samples = []
+    for _ in range(rounds):
+        gc.collect()
+        start = time.process_time()
+        func()
+        samples.append((time.process_time() - start) * 1000)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    conn = build_db(args.rows)
+    rows = fetch(conn)
+    variants = [
+        ("eager dataclass", lambda cursor, row: eager_from_row(row), eager_to_dict),
+        ("lazy record", Message.from_row, Message.to_dict),
+    ]
+    print(f"{args.rows} rows, median of {args.rounds} rounds (CPU time)")
+    for name, row_factory, to_dict in variants:
+        fetch_ms = timed(lambda: fetch(conn, row_factory), args.rounds)
+        decode_ms = timed(lambda: decode(rows, row_factory), args.rounds)
+        bytes_per_row = retained_bytes(rows, row_factory) / args.rows
+        messages = decode(rows, row_factory)
+        serialize_ms = timed(lambda: [to_dict(message) for message in messages], args.rounds)
+        print(f"{name:>16}  fetch {fetch_ms:7.1f} ms  decode {decode_ms:7.1f} ms  "
+              f"{bytes_per_row:5.0f} B/row  to_dict {serialize_ms:7.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""Benchmark of the whatsapp_contacts functions behind every read-only MCP tool.
+
+Builds a synthetic store with fixtures.py (or reuses one given with
+--store), creates the messages.db indexes and brings the sidecar up to
+date, then times each case: search_contacts, smart_search_contacts,
+list_messages with every combination of the chat / sender / date range /
+query filters plus cursor paging, get_message_context(s), list_chats,
+get_chat and get_contact_chats. Each case reports p50/p99 latency over
+--rounds calls and the peak Python memory of one call (tracemalloc; SQLite's
+own page cache is not included).
+
+--save writes the results as a JSON baseline; --compare prints the change
+against one and exits with status 1 if any case's p50 regressed by more
+than --threshold.
+
+Usage:
+    python benchmarks/bench_tools.py [--messages 100000] [--contacts 10000] [--groups 200]
+                                     [--store DIR] [--rounds 30] [--only PATTERN]
+                                     [--save baseline.json] [--compare baseline.json]
+"""
+import argparse
+import fnmatch
+import itertools
+import json
+import os
+import platform
+import resource
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fixtures
+
+CONTACT_QUERIES = ["jose", "maria perez", "nunez", "begona ibanez", "jsus", "xyzzy"]
+MESSAGE_QUERY = "reunión"
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def prepare_store(args) -> Tuple[str, Dict[str, float]]:
+    """Store directory to benchmark, plus the time spent building it (if it was built)."""
+    store = args.store or tempfile.mkdtemp(prefix="whatsapp-bench-")
+    timings = {}
+    if not os.path.exists(os.path.join(store, "messages.db")):
+        start = time.perf_counter()
+        fixtures.build_store(store, args.messages, args.contacts, args.groups, seed=args.seed)
+        timings["fixture_s"] = time.perf_counter() - start
+    return store, timings
+
+def warm_up(wc, migrations) -> Dict[str, float]:
+    """Create indexes, backfill the sidecar and load the contact index, timing each step."""
+    timings = {}
+    start = time.perf_counter()
+    migrations.ensure_indexes(wc.MESSAGES_DB_PATH)
+    timings["indexes_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    wc._sidecar.sync()
+    timings["sidecar_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    wc._contact_index.refresh(force=True)
+    timings["contact_index_s"] = time.perf_counter() - start
+    return timings
+
+def pick_targets(conn: sqlite3.Connection) -> Dict[str, Any]:
+    """Chats, sender, date window and message IDs the cases query, chosen from the store."""
+    def busiest(pattern: str) -> str:
+        return conn.execute("""
+            SELECT chat_jid FROM messages WHERE chat_jid LIKE ?
+            GROUP BY chat_jid ORDER BY COUNT(*) DESC LIMIT 1
+        """, (pattern,)).fetchone()[0]
+
+    group, direct = busiest("%@g.us"), busiest("%@s.whatsapp.net")
+    sender = conn.execute("""
+        SELECT sender FROM messages WHERE chat_jid = ? AND NOT is_from_me
+        GROUP BY sender ORDER BY COUNT(*) DESC LIMIT 1
+    """, (group,)).fetchone()[0]
+    count = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    middle = conn.execute("SELECT timestamp FROM messages ORDER BY timestamp LIMIT 1 OFFSET ?",
+                          (count // 2,)).fetchone()[0]
+    # A week from the middle of the history, in the store's own offset
+    day, offset = middle[:10], middle[19:]
+    after = f"{day}T00:00:00{offset}"
+    before = conn.execute("SELECT datetime(?, '+7 days')", (f"{day} 00:00:00",)).fetchone()[0].replace(" ", "T") + offset
+    message_ids = [row[0] for row in conn.execute(
+        "SELECT id FROM messages WHERE chat_jid = ? ORDER BY timestamp DESC LIMIT 20", (group,)
+    )]
+    return {"group": group, "direct": direct, "sender": sender, "after": after, "before": before,
+            "message_ids": message_ids}
+
+def build_cases(wc, targets: Dict[str, Any]) -> List[Tuple[str, Callable[[], Any]]]:
+    cases = []
+    for query in CONTACT_QUERIES:
+        cases.append((f"search_contacts[{query}]", lambda query=query: wc.search_contacts(query)))
+    for query in CONTACT_QUERIES:
+        cases.append((f"smart_search_contacts[{query}]", lambda query=query: wc.smart_search_contacts(query)))
+
+    # Every non-empty combination of filters, with the tool's default context
+    filters = {
+        "chat": {"chat_jid": targets["group"]},
+        "sender": {"sender_phone_number": targets["sender"]},
+        "range": {"after": targets["after"], "before": targets["before"]},
+        "query": {"query": MESSAGE_QUERY},
+    }
+    for size in range(1, len(filters) + 1):
+        for combination in itertools.combinations(filters, size):
+            kwargs = {key: value for name in combination for key, value in filters[name].items()}
+            cases.append((f"list_messages[{'+'.join(combination)}]",
+                          lambda kwargs=kwargs: wc.list_messages(include_context=True, **kwargs)))
+    cases.append(("list_messages[force_load]", lambda: wc.list_messages(force_load=True, include_context=True)))
+    cases.append(("list_messages[direct]", lambda: wc.list_messages(chat_jid=targets["direct"], include_context=True)))
+    cases.append(("list_messages[query,relevance]",
+                  lambda: wc.list_messages(query=MESSAGE_QUERY, sort_by="relevance", include_context=True)))
+    page = wc.list_messages_page(chat_jid=targets["group"], limit=50)
+    cases.append(("list_messages[chat,cursor]",
+                  lambda: wc.list_messages(chat_jid=targets["group"], limit=50, cursor=page.next_cursor)))
+
+    message_ids = targets["message_ids"]
+    cases.append(("get_message_context", lambda: wc.get_message_context(message_ids[-1])))
+    cases.append(("get_message_contexts[20]", lambda: wc.get_message_contexts(message_ids)))
+
+    cases.append(("list_chats", lambda: wc.list_chats()))
+    cases.append(("list_chats[query]", lambda: wc.list_chats(query="familia")))
+    cases.append(("list_chats[name]", lambda: wc.list_chats(sort_by="name")))
+    cases.append(("get_chat", lambda: wc.get_chat(targets["group"])))
+    cases.append(("get_contact_chats", lambda: wc.get_contact_chats(targets["sender"])))
+    return cases
+
+def measure(func: Callable[[], Any], rounds: int) -> Dict[str, float]:
+    func()  # warm caches and the statement cache once
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "p50_ms": statistics.median(samples),
+        "p99_ms": percentile(samples, 99),
+        "peak_kib": peak / 1024,
+        "results": len(result) if hasattr(result, "__len__") else int(result is not None),
+    }
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Print the p50 change of each case against the baseline; returns the regressed cases."""
+    regressed = []
+    print(f"\n{'case':44} {'base p50':>10} {'p50':>10} {'change':>8}")
+    for name, result in results.items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:44} {'-':>10} {result['p50_ms']:10.2f} {'new':>8}")
+            continue
+        ratio = result["p50_ms"] / base["p50_ms"] if base["p50_ms"] else 1.0
+        # Sub-millisecond cases are too noisy to fail on
+        flag = ratio > threshold and result["p50_ms"] - base["p50_ms"] > 0.5
+        if flag:
+            regressed.append(name)
+        print(f"{name:44} {base['p50_ms']:10.2f} {result['p50_ms']:10.2f} {ratio - 1:+8.0%}{'  REGRESSED' if flag else ''}")
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--contacts", type=int, default=10_000)
+    parser.add_argument("--groups", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--store", help="store directory to reuse (built there if it has no messages.db)")
+    parser.add_argument("--rounds", type=int, default=30)
+    parser.add_argument("--only", help="run only the cases matching this glob, e.g. 'list_messages*'")
+    parser.add_argument("--save", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", help="JSON baseline to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="p50 ratio that counts as a regression")
+    args = parser.parse_args()
+
+    store, setup = prepare_store(args)
+    # Point the server at the store before it reads its configuration
+    os.environ["WHATSAPP_STORE_DIR"] = store
+    os.environ["MESSAGES_DB_NAME"] = "messages.db"
+    os.environ["SIDECAR_DB_PATH"] = os.path.join(store, "mcp_sidecar.db")
+    import migrations
+    import whatsapp_contacts as wc
+
+    setup.update(warm_up(wc, migrations))
+    conn = sqlite3.connect(wc.MESSAGES_DB_PATH)
+    targets = pick_targets(conn)
+    sizes = {
+        "messages": conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0],
+        "chats": conn.execute("SELECT COUNT(*) FROM chats").fetchone()[0],
+        "contacts": len(wc._contact_index.entries(True)),
+    }
+    conn.close()
+    print(f"store {store}: {sizes['messages']} messages, {sizes['chats']} chats, {sizes['contacts']} contacts")
+    print("setup " + ", ".join(f"{name} {seconds:.1f}" for name, seconds in setup.items()))
+
+    results = {}
+    print(f"\n{'case':44} {'p50 ms':>9} {'p99 ms':>9} {'peak KiB':>10} {'rows':>6}")
+    for name, func in build_cases(wc, targets):
+        if args.only and not fnmatch.fnmatch(name, args.only):
+            continue
+        result = results[name] = measure(func, args.rounds)
+        print(f"{name:44} {result['p50_ms']:9.2f} {result['p99_ms']:9.2f} {result['peak_kib']:10.0f} {result['results']:6}")
+    print(f"\nmax RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "sizes": sizes,
+                "rounds": args.rounds,
+                "setup": setup,
+                "results": results,
+            }, f, indent=2)
+        print(f"saved baseline to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("sizes") != sizes:
+            print(f"WARNING: baseline was taken on a different store: {baseline.get('sizes')}")
+        regressed = compare(results, baseline, args.threshold)
+        if regressed:
+            print(f"\n{len(regressed)} case(s) regressed: {', '.join(regressed)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""Synthetic WhatsApp stores for benchmarks.
+
+Writes a `messages.db` with the bridge's chats/messages schema and a
+`whatsapp.db` with whatsmeow's contact table, deterministic for a given
+seed and sized by argument:
+
+- contacts with accented Spanish names (a few common first/last names plus
+  generated long-tail surnames), some with only a push name;
+- direct chats with a subset of the contacts and named groups whose
+  members are drawn from the contacts;
+- messages spread over the `--days` before 2025-01-01 with Zipf-like chat activity (a few chats
+  hold most of the history), ~35% sent by me, ~8% media with file
+  metadata, timestamps in the bridge's "YYYY-MM-DD HH:MM:SS-03:00" format.
+
+Rows are generated and inserted in batches, so 10M-message stores build
+with flat memory.
+
+Usage:
+    python benchmarks/fixtures.py OUTPUT_DIR [--messages 1000000] [--contacts 100000] [--groups 500]
+"""
+import argparse
+import bisect
+import hashlib
+import itertools
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+FIRST_NAMES = ["José", "María", "Ángel", "Lucía", "Jesús", "Sofía", "Raúl", "Inés", "Martín",
+               "Begoña", "Juan", "Ana", "Pedro", "Carmen", "Joaquín", "Nuria", "Óscar", "Elena"]
+LAST_NAMES = ["Pérez", "Gómez", "Núñez", "Álvarez", "Muñoz", "Fernández", "Castaño", "Ibáñez",
+              "López", "Martínez", "Sánchez", "Díaz", "Hernández", "Ruiz", "Jiménez", "Peña"]
+SYLLABLES = ["ba", "ca", "da", "fe", "go", "ja", "lo", "ma", "ne", "ño", "pa", "que", "ri",
+             "sa", "ta", "va", "za", "rro", "lle", "chi", "tí", "ró", "gué", "bel"]
+GROUP_WORDS = ["Familia", "Trabajo", "Fútbol", "Vecinos", "Cumpleaños", "Viaje", "Colegio",
+               "Asado", "Proyecto", "Amigos", "Reunión", "Pádel"]
+WORDS = ["hola", "gracias", "mañana", "reunión", "proyecto", "café", "niño", "canción", "factura",
+         "entrega", "después", "también", "qué", "cómo", "sí", "día", "año", "está", "acá", "llegué",
+         "mirá", "dale", "perfecto", "foto", "audio", "precio", "envío", "pedido", "ahora", "tarde"]
+MEDIA = [("image", ".jpg"), ("image", ".jpg"), ("audio", ".ogg"), ("video", ".mp4"), ("document", ".pdf")]
+
+SELF_JID = "5491100000000@s.whatsapp.net"
+PHONE_BASE = 5491100000001
+GROUP_BASE = 120363000000000000
+TZ = timezone(timedelta(hours=-3))
+# Fixed so a seed always produces the same store
+END = datetime(2025, 1, 1, tzinfo=TZ)
+BATCH_ROWS = 50000
+
+def synthetic_surname(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+
+def contact_name(rng: random.Random, i: int) -> str:
+    """Realistic-ish mix: common first/last names plus long-tail generated surnames."""
+    last = rng.choice(LAST_NAMES) if rng.random() < 0.4 else synthetic_surname(rng)
+    second = synthetic_surname(rng) if rng.random() < 0.5 else ""
+    return " ".join(part for part in (rng.choice(FIRST_NAMES), last, second) if part)
+
+def phone(i: int) -> str:
+    return str(PHONE_BASE + i)
+
+def build_whatsapp_db(path: str, contacts: int, seed: int = 0) -> List[str]:
+    """
+    Write whatsmeow_contacts with `contacts` entries.
+
+    Returns:
+        List[str]: The contact names, by contact number
+    """
+    rng = random.Random(seed)
+    names = [contact_name(rng, i) for i in range(contacts)]
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS whatsmeow_contacts (
+            our_jid TEXT, their_jid TEXT, first_name TEXT, full_name TEXT,
+            push_name TEXT, business_name TEXT, PRIMARY KEY (our_jid, their_jid)
+        )
+    """)
+    # Most contacts are saved in the address book; some only have the name they chose
+    conn.executemany(
+        "INSERT INTO whatsmeow_contacts VALUES (?, ?, ?, ?, ?, NULL)",
+        ((SELF_JID, f"{phone(i)}@s.whatsapp.net",
+          name.split()[0] if saved else None, name if saved else None, None if saved else name)
+         for i, name in enumerate(names)
+         for saved in (rng.random() < 0.85,))
+    )
+    conn.commit()
+    conn.close()
+    return names
+
+def _chats(rng: random.Random, names: List[str], groups: int) -> List[Tuple[str, str, List[str]]]:
+    """(jid, name, possible senders) of every chat: direct chats with up to half the contacts, then groups."""
+    chats = []
+    direct = min(len(names), max(1, len(names) // 2))
+    for i in rng.sample(range(len(names)), direct):
+        chats.append((f"{phone(i)}@s.whatsapp.net", names[i], [phone(i)]))
+    for g in range(groups):
+        name = f"{rng.choice(GROUP_WORDS)} {rng.choice(LAST_NAMES)} {g}"
+        members = [phone(i) for i in rng.sample(range(len(names)), min(len(names), rng.randint(3, 60)))]
+        chats.append((f"{GROUP_BASE + g}@g.us", name, members))
+    rng.shuffle(chats)
+    return chats
+
+def build_messages_db(path: str, names: List[str], messages: int, groups: int, days: int = 365,
+                      seed: int = 0) -> Dict[str, int]:
+    """
+    Write chats and `messages` messages spread over `days`, oldest first.
+
+    Returns:
+        Dict[str, int]: Row counts ("chats", "messages")
+    """
+    rng = random.Random(seed + 1)
+    chats = _chats(rng, names, groups)
+    # Zipf-like activity: chat k gets weight 1/(k+1)
+    cumulative = list(itertools.accumulate(1 / (k + 1) for k in range(len(chats))))
+    total_weight = cumulative[-1]
+    start = END - timedelta(days=days)
+    step = days * 86400 / max(messages, 1)
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS chats (
+            jid TEXT PRIMARY KEY,
+            name TEXT,
+            last_message_time TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            id TEXT,
+            chat_jid TEXT,
+            sender TEXT,
+            content TEXT,
+            timestamp TIMESTAMP,
+            is_from_me BOOLEAN,
+            media_type TEXT,
+            filename TEXT,
+            url TEXT,
+            media_key BLOB,
+            file_sha256 BLOB,
+            file_enc_sha256 BLOB,
+            file_length INTEGER,
+            PRIMARY KEY (id, chat_jid),
+            FOREIGN KEY (chat_jid) REFERENCES chats(jid)
+        );
+    """)
+
+    last_time: Dict[str, str] = {}
+
+    def rows(lower: int, upper: int):
+        for n in range(lower, upper):
+            jid, _, members = chats[bisect.bisect_left(cumulative, rng.random() * total_weight)]
+            timestamp = (start + timedelta(seconds=int(n * step))).strftime("%Y-%m-%d %H:%M:%S-03:00")
+            last_time[jid] = timestamp
+            from_me = rng.random() < 0.35
+            sender = SELF_JID.split("@")[0] if from_me else rng.choice(members)
+            message_id = hashlib.md5(f"{seed}:{n}".encode()).hexdigest()[:20].upper()
+            if rng.random() < 0.08:
+                media_type, extension = rng.choice(MEDIA)
+                length = rng.randint(2_000, 5_000_000)
+                caption = " ".join(rng.choices(WORDS, k=rng.randint(0, 6)))
+                yield (message_id, jid, sender, caption, timestamp, from_me, media_type,
+                       f"{media_type}_{n}{extension}", f"https://mmg.whatsapp.net/{message_id}",
+                       rng.randbytes(32), rng.randbytes(32), rng.randbytes(32), length)
+            else:
+                content = " ".join(rng.choices(WORDS, k=rng.randint(1, 18)))
+                yield (message_id, jid, sender, content, timestamp, from_me, None, None, None, None, None, None, None)
+
+    for lower in range(0, messages, BATCH_ROWS):
+        with conn:
+            conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             rows(lower, min(messages, lower + BATCH_ROWS)))
+    with conn:
+        conn.executemany("INSERT INTO chats VALUES (?, ?, ?)",
+                         ((jid, name, last_time.get(jid)) for jid, name, _ in chats))
+    conn.close()
+    return {"chats": len(chats), "messages": messages}
+
+def build_store(directory: str, messages: int, contacts: int, groups: int, days: int = 365, seed: int = 0):
+    """Write messages.db and whatsapp.db into `directory` (which must not already hold them)."""
+    os.makedirs(directory, exist_ok=True)
+    for name in ("messages.db", "whatsapp.db"):
+        if os.path.exists(os.path.join(directory, name)):
+            raise FileExistsError(os.path.join(directory, name))
+    names = build_whatsapp_db(os.path.join(directory, "whatsapp.db"), contacts, seed)
+    return build_messages_db(os.path.join(directory, "messages.db"), names, messages, groups, days, seed)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output", help="store directory to create the databases in")
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--contacts", type=int, default=100_000)
+    parser.add_argument("--groups", type=int, default=500)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    try:
+        counts = build_store(args.output, args.messages, args.contacts, args.groups, args.days, args.seed)
+    except FileExistsError as e:
+        print(f"Error: {e} already exists")
+        return 1
+    print(f"Wrote {counts['messages']} messages in {counts['chats']} chats and {args.contacts} contacts "
+          f"to {args.output} in {time.perf_counter() - started:.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+import stats
+
+# Seconds to wait for a TCP connection to the bridge
+CONNECT_TIMEOUT = float(os.getenv('BRIDGE_CONNECT_TIMEOUT', '5'))
+
+# Seconds to wait for the bridge's reply, per endpoint. Sends and downloads
+# move media to and from WhatsApp's servers, so they get much longer limits
+READ_TIMEOUT = float(os.getenv('BRIDGE_READ_TIMEOUT', '30'))
+ENDPOINT_TIMEOUTS: Dict[str, float] = {
+    'send': float(os.getenv('BRIDGE_SEND_TIMEOUT', '120')),
+    'download': float(os.getenv('BRIDGE_DOWNLOAD_TIMEOUT', '120')),
+}
+
+# Endpoints that are safe to call twice. /send is not: a retry after a read
+# timeout could deliver the message twice
+IDEMPOTENT_ENDPOINTS = {'download'}
+
+# Extra attempts for idempotent calls, with full-jitter exponential backoff
+RETRIES = int(os.getenv('BRIDGE_RETRIES', '2'))
+RETRY_BACKOFF = 0.2
+
+# Consecutive failures that open the circuit, and seconds before a probe
+BREAKER_THRESHOLD = int(os.getenv('BRIDGE_BREAKER_THRESHOLD', '5'))
+BREAKER_RESET_TIMEOUT = float(os.getenv('BRIDGE_BREAKER_RESET', '30'))
+
+# Keep-alive connections held open to the bridge
+POOL_SIZE = 16
+
+class BridgeUnavailable(Exception):
+    """Raised instead of calling the bridge while the circuit is open."""
+
+class CircuitBreaker:
+    """Fail fast while the bridge is down.
+
+    After `threshold` consecutive failures the circuit opens and calls are
+    refused for `reset_timeout` seconds. Then it half-opens: a single probe
+    call goes through and closes the circuit on success or re-opens it on
+    failure; other calls keep being refused until the probe finishes.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def acquire(self) -> bool:
+        """Return True if a call may go through now.
+
+        A True result in the half-open state makes the caller the probe, and
+        it must then call record_success, record_failure or release.
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def retry_after(self) -> float:
+        """Seconds until the next probe is allowed."""
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        """Give up a probe without an outcome (e.g. the call was cancelled)."""
+        with self._lock:
+            self._probing = False
+
+class BridgeClient:
+    """Client for the Go bridge's REST API.
+
+    Blocking callers share a pooled requests.Session and async callers a
+    pooled httpx.AsyncClient, so connections to the bridge are kept alive
+    and reused instead of opened per request. Both go through the same
+    circuit breaker and per-endpoint timeouts; only IDEMPOTENT_ENDPOINTS
+    are retried.
+    """
+
+    def __init__(self, base_url: str, breaker: Optional[CircuitBreaker] = None, retries: int = RETRIES):
+        self.base_url = base_url.rstrip('/')
+        self.breaker = breaker or CircuitBreaker()
+        self.retries = retries
+        self._session: Optional[requests.Session] = None
+        self._session_lock = threading.Lock()
+        self._async_client: Optional[httpx.AsyncClient] = None
+
+    def url(self, endpoint: str) -> str:
+        return f"{self.base_url}/{endpoint.lstrip('/')}"
+
+    def timeout(self, endpoint: str) -> Tuple[float, float]:
+        """(connect, read) timeouts in seconds for an endpoint."""
+        return CONNECT_TIMEOUT, ENDPOINT_TIMEOUTS.get(endpoint.strip('/'), READ_TIMEOUT)
+
+    def post(self, endpoint: str, payload: Dict[str, Any]) -> requests.Response:
+        """POST a JSON payload to a bridge endpoint (e.g. "send") and block for the reply.
+
+        Raises:
+            BridgeUnavailable: If the circuit is open
+            requests.RequestException: If the bridge could not be reached
+        """
+        session = self._get_session()
+        attempts = self._attempts(endpoint)
+        for attempt in range(attempts):
+            self._acquire()
+            start = time.perf_counter()
+            try:
+                response = session.post(self.url(endpoint), json=payload, timeout=self.timeout(endpoint))
+            except requests.RequestException:
+                self._observe(endpoint, start, "error")
+                self.breaker.record_failure()
+                if attempt + 1 == attempts:
+                    raise
+            except BaseException:
+                self.breaker.release()
+                raise
+            else:
+                failed = self._record(response.status_code)
+                self._observe(endpoint, start, "server_error" if failed else "ok")
+                if not failed or attempt + 1 == attempts:
+                    return response
+            time.sleep(self._backoff(attempt))
+
+    async def apost(self, endpoint: str, payload: Dict[str, Any]) -> httpx.Response:
+        """Async variant of post.
+
+        Raises:
+            BridgeUnavailable: If the circuit is open
+            httpx.HTTPError: If the bridge could not be reached
+        """
+        client = self._get_async_client()
+        connect, read = self.timeout(endpoint)
+        attempts = self._attempts(endpoint)
+        for attempt in range(attempts):
+            self._acquire()
+            start = time.perf_counter()
+            try:
+                response = await client.post(self.url(endpoint), json=payload,
+                                             timeout=httpx.Timeout(read, connect=connect))
+            except httpx.TransportError:
+                self._observe(endpoint, start, "error")
+                self.breaker.record_failure()
+                if attempt + 1 == attempts:
+                    raise
+            except BaseException:
+                self.breaker.release()
+                raise
+            else:
+                failed = self._record(response.status_code)
+                self._observe(endpoint, start, "server_error" if failed else "ok")
+                if not failed or attempt + 1 == attempts:
+                    return response
+            await asyncio.sleep(self._backoff(attempt))
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def _attempts(self, endpoint: str) -> int:
+        return 1 + (self.retries if endpoint.strip('/') in IDEMPOTENT_ENDPOINTS else 0)
+
+    def _acquire(self):
+        if not self.breaker.acquire():
+            raise BridgeUnavailable(
+                f"WhatsApp bridge at {self.base_url} is not responding; "
+                f"retrying in {self.breaker.retry_after():.0f}s"
+            )
+
+    def _record(self, status_code: int) -> bool:
+        """Feed a reply to the breaker; True if it was a server error."""
+        # 4xx replies mean the bridge is up and rejected the request
+        if status_code >= 500:
+            self.breaker.record_failure()
+            return True
+        self.breaker.record_success()
+        return False
+
+    @staticmethod
+    def _observe(endpoint: str, start: float, status: str):
+        """Record one request attempt's latency in stats."""
+        if stats.ENABLED:
+            stats.BRIDGE.observe(time.perf_counter() - start, endpoint.strip('/'), status)
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        return random.uniform(0, RETRY_BACKOFF * 2 ** attempt)
+
+    def _get_session(self) -> requests.Session:
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+        return self._session
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None or self._async_client.is_closed:
+            self._async_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE)
+            )
+        return self._async_client
@@ -0,0 +1,182 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+_MISSING = object()
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire `ttl` seconds after being stored.
+
+    Thread-safe; `None` is a valid cached value, so lookups that found
+    nothing can be cached too.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def get_many(self, keys: Iterable[Hashable]) -> Tuple[Dict[Hashable, Any], list]:
+        """Return (cached values, keys that are missing or expired)."""
+        found, missing = {}, []
+        for key in keys:
+            value = self.get(key, _MISSING)
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        return found, missing
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """Drop one entry, or every entry if no key is given."""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's content, read in 1 MiB chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class DiskCache:
+    """
+    Size-bounded directory of files, evicted least recently used first.
+
+    Entries are written to a temporary file in the cache directory and
+    published with an atomic rename, so readers never see a partial file.
+    Hits refresh the entry's mtime, which drives LRU eviction once the
+    directory grows past `max_bytes`.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        # (path, size, mtime_ns) -> content digest, so repeat lookups skip hashing
+        self._digests: Dict[Tuple[str, int, int], str] = {}
+
+    def content_key(self, input_file: str, *params) -> str:
+        """Cache key for an input file's content plus parameters of what is derived from it."""
+        stat = os.stat(input_file)
+        identity = (os.path.abspath(input_file), stat.st_size, stat.st_mtime_ns)
+        digest = self._digests.get(identity)
+        if digest is None:
+            digest = file_digest(input_file)
+            if len(self._digests) >= 4096:
+                self._digests.clear()
+            self._digests[identity] = digest
+        return hashlib.sha256(repr((digest,) + params).encode()).hexdigest()
+
+    def path(self, key: str, suffix: str = "") -> str:
+        return os.path.join(self.directory, key + suffix)
+
+    def lookup(self, key: str, suffix: str = "") -> Optional[str]:
+        """Return the entry's path and mark it as recently used, or None on a miss."""
+        path = self.path(key, suffix)
+        return path if self._touch(path) else None
+
+    def get_or_create(self, key: str, produce: Callable[[str], Any], suffix: str = "") -> str:
+        """
+        Return the cached file for `key`, calling `produce(tmp_path)` to create it on a miss.
+
+        Concurrent misses for the same key run `produce` only once.
+        """
+        path = self.lookup(key, suffix)
+        if path is not None:
+            return path
+        path = self.path(key, suffix)
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if self._touch(path):
+                return path
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=suffix, dir=self.directory)
+            os.close(fd)
+            try:
+                produce(tmp_path)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+            finally:
+                with self._lock:
+                    self._key_locks.pop(key, None)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep: Optional[str] = None):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        now = time.time()
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if entry.name.startswith(".tmp-"):
+                    # Left behind by a crashed producer
+                    if now - stat.st_mtime > 3600:
+                        self._unlink(entry.path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            self._unlink(path)
+            total -= size
+
+    @staticmethod
+    def _touch(path):
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
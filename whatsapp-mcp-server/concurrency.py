@@ -0,0 +1,66 @@
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+# Worker threads for blocking SQLite reads (each keeps its own pooled connections)
+DB_WORKERS = int(os.getenv('MCP_DB_WORKERS', '8'))
+
+# Worker threads for media work (ffmpeg conversions, large file I/O); kept
+# separate so slow conversions cannot starve database reads
+MEDIA_WORKERS = int(os.getenv('MCP_MEDIA_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+
+def get_executor(pool: str) -> ThreadPoolExecutor:
+    """Return the bounded executor for a pool ('db' or 'media'), creating it on first use."""
+    executor = _executors.get(pool)
+    if executor is None:
+        workers = MEDIA_WORKERS if pool == 'media' else DB_WORKERS
+        executor = _executors.setdefault(pool, ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"mcp-{pool}"))
+    return executor
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking call (SQLite, CPU-bound search) on the database pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor('db'), functools.partial(func, *args, **kwargs))
+
+async def run_media(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking media call (ffmpeg, file hashing) on the media pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor('media'), functools.partial(func, *args, **kwargs))
+
+def shutdown(wait: bool = False):
+    """Stop every executor."""
+    for executor in _executors.values():
+        executor.shutdown(wait=wait)
+    _executors.clear()
+
+class AsyncTokenBucket:
+    """Rate limiter for coroutines: `rate` tokens per second, bursts of up to `burst`.
+
+    Waiters are served in arrival order.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1.0):
+        """Wait until `tokens` are available and take them."""
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
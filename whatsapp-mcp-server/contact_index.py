@@ -0,0 +1,422 @@
+import heapq
+import os
+import sqlite3
+import threading
+from array import array
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from rapidfuzz import fuzz, process
+from rapidfuzz.distance import Indel, Levenshtein
+from rapidfuzz.utils import default_process
+
+import db
+
+# Prioridad de cada fuente de nombres (menor = preferida)
+SOURCE_PRIORITY = {'whatsapp': 0, 'chat': 1}
+
+# Longitud de los q-gramas del índice invertido
+GRAM_SIZE = 3
+
+# Máximo de nombres que puntúa la pasada fuzzy de search_contacts (0 = todos).
+# Con más contactos se puntúan los que comparten los trigramas más raros de la
+# consulta, y un nombre parecido que no comparta ninguno puede quedar afuera
+FUZZY_SCAN_BUDGET = int(os.getenv('FUZZY_SCAN_BUDGET', '5000'))
+
+def trigrams(text: str) -> set:
+    """Devuelve el conjunto de trigramas de un texto ya normalizado."""
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+def sort_tokens(processed: str) -> str:
+    """Ordena los tokens de un texto ya procesado (base de token_sort_ratio)."""
+    return " ".join(sorted(processed.split()))
+
+def legacy_partial_ratio(query: str, choice: str) -> int:
+    """partial_ratio en la escala de fuzzywuzzy, con la que se calibró search_contacts.
+
+    fuzzywuzzy solo prueba las ventanas de la cadena larga alineadas con un
+    bloque coincidente de la corta y redondea a entero; rapidfuzz prueba todas
+    las ventanas (también las parciales en los bordes) y puntúa más alto, lo que
+    desordena los resultados respecto de los substrings. Espera textos ya
+    procesados con default_process.
+    """
+    if query == choice:
+        return 100
+    if not query or not choice:
+        return 0
+    shorter, longer = (query, choice) if len(query) <= len(choice) else (choice, query)
+    best = 0.0
+    for block in Levenshtein.opcodes(shorter, longer).as_matching_blocks():
+        start = max(0, block.b - block.a)
+        ratio = Indel.normalized_similarity(shorter, longer[start:start + len(shorter)])
+        if ratio > .995:
+            return 100
+        best = max(best, ratio)
+    return int(round(100 * best))
+
+def score_batch(query: str, choices: Sequence[str], scorer, score_cutoff: float,
+                limit: Optional[int]) -> List[Tuple[int, float]]:
+    """Puntúa todos los candidatos en una sola llamada a rapidfuzz (en C).
+
+    Los candidatos por debajo de score_cutoff se descartan sin terminar de
+    calcularse. Devuelve (índice en choices, score) ordenados por score
+    descendente y, a igualdad, por índice; el índice permite volver al
+    contacto sin buscarlo por nombre (los homónimos no se pierden).
+    """
+    if not query or not choices:
+        return []
+    results = process.extract(query, choices, scorer=scorer, processor=None,
+                              score_cutoff=score_cutoff, limit=limit)
+    return [(index, score) for _, score, index in results]
+
+@dataclass(frozen=True)
+class ContactEntry:
+    jid: str
+    name: str
+    normalized: str
+    processed: str
+    sorted_tokens: str
+    source: str
+    priority: int
+    is_group: bool
+
+@dataclass(frozen=True)
+class ContactSnapshot:
+    """Una generación completa del índice.
+
+    refresh() arma una nueva y la publica con una sola asignación; nunca se
+    modifica una ya publicada, así que una consulta que toma la snapshot una
+    vez ve listas, trigramas y posiciones de la misma generación aunque otro
+    hilo recargue el índice mientras tanto.
+    """
+    entries: List[ContactEntry]
+    contacts: List[ContactEntry]
+    entry_tokens: List[str]
+    contact_tokens: List[str]
+    entry_processed: List[str]
+    contact_processed: List[str]
+    grams: Dict[str, array]
+    by_length: array
+
+    @classmethod
+    def build(cls, entries: List[ContactEntry]) -> "ContactSnapshot":
+        # Las listas de posiciones quedan ordenadas por longitud del nombre
+        by_length = array('I', sorted(range(len(entries)), key=lambda p: (len(entries[p].normalized), p)))
+        grams: Dict[str, array] = {}
+        for position in by_length:
+            for gram in trigrams(entries[position].normalized):
+                postings = grams.get(gram)
+                if postings is None:
+                    postings = grams[gram] = array('I')
+                postings.append(position)
+
+        contacts = [entry for entry in entries if not entry.is_group]
+        return cls(
+            entries=entries,
+            contacts=contacts,
+            entry_tokens=[entry.sorted_tokens for entry in entries],
+            contact_tokens=[entry.sorted_tokens for entry in contacts],
+            entry_processed=[entry.processed for entry in entries],
+            contact_processed=[entry.processed for entry in contacts],
+            grams=grams,
+            by_length=by_length
+        )
+
+    def select(self, include_groups: bool = False) -> List[ContactEntry]:
+        """Las entradas con o sin grupos."""
+        return self.entries if include_groups else self.contacts
+
+    def substring_matches(self, normalized_query: str, include_groups: bool = False) -> Iterator[Tuple[int, ContactEntry]]:
+        """Entradas cuyo nombre normalizado contiene la consulta, como (posición, entrada).
+
+        Se recorren de la más corta a la más larga para que el llamador pueda
+        cortar en cuanto ningún nombre restante pueda puntuar mejor. Todo
+        substring contiene todos los trigramas de la consulta, así que basta con
+        verificar la lista de posiciones más corta; las consultas de menos de
+        GRAM_SIZE caracteres recorren todo el índice.
+        """
+        entries = self.entries
+        query_grams = trigrams(normalized_query)
+        if query_grams:
+            positions = min((self.grams.get(gram, ()) for gram in query_grams), key=len)
+        else:
+            positions = self.by_length
+
+        for position in positions:
+            entry = entries[position]
+            if normalized_query in entry.normalized and (include_groups or not entry.is_group):
+                yield position, entry
+
+    def fuzzy_candidates(self, normalized_query: str, include_groups: bool = False,
+                         budget: int = 0) -> Tuple[List[ContactEntry], List[str]]:
+        """Entradas (y sus nombres procesados) que puntúa la pasada fuzzy, en el orden del índice.
+
+        Son todas mientras no pasen de `budget` (0 = sin límite). Si no, se
+        juntan hasta `budget` posiciones recorriendo los trigramas de la
+        consulta del más raro al más común (cada lista, de los nombres más
+        cortos a los más largos), sin contar trigramas compartidos: son
+        rebanadas de listas ya armadas. Sin trigramas conocidos se usan los
+        nombres más cortos.
+        """
+        if include_groups:
+            entries, choices = self.entries, self.entry_processed
+        else:
+            entries, choices = self.contacts, self.contact_processed
+        if not budget or len(choices) <= budget:
+            return entries, choices
+
+        postings = sorted((self.grams[gram] for gram in trigrams(normalized_query) if gram in self.grams), key=len)
+        selected = set()
+        for positions in postings or [self.by_length]:
+            selected.update(positions[:budget - len(selected)])
+            if len(selected) >= budget:
+                break
+        candidates = [self.entries[position] for position in sorted(selected)]
+        if not include_groups:
+            candidates = [entry for entry in candidates if not entry.is_group]
+        return candidates, [entry.processed for entry in candidates]
+
+    def partial_ratio_matches(self, normalized_query: str, include_groups: bool = False,
+                              score_cutoff: float = 0, limit: Optional[int] = None,
+                              budget: Optional[int] = None) -> List[Tuple[ContactEntry, int]]:
+        """partial_ratio (escala fuzzywuzzy) contra las entradas que no contienen la consulta.
+
+        Se puntúan las de fuzzy_candidates: todas mientras el índice no supere
+        `budget` (por defecto FUZZY_SCAN_BUDGET). Que un nombre llegue al corte
+        de 70 no exige que comparta ningún trigrama (ni bigrama, en consultas
+        de menos de 16 caracteres) con la consulta, así que por encima del
+        presupuesto el resultado es aproximado: no hay cota que descarte
+        nombres sin puntuarlos.
+
+        El partial_ratio de rapidfuzz nunca queda más de medio punto por debajo
+        del de fuzzywuzzy, así que una sola pasada en C sobre los candidatos
+        descarta los que no pueden llegar al corte sin perder ninguno; solo los
+        que quedan se puntúan con legacy_partial_ratio, de la mejor cota a la
+        peor, hasta que ninguno restante puede entrar entre los `limit` mejores.
+        Se devuelven por score descendente y, a igualdad, en el orden del
+        índice, como un recorrido lineal.
+        """
+        entries, choices = self.fuzzy_candidates(normalized_query, include_groups,
+                                                 FUZZY_SCAN_BUDGET if budget is None else budget)
+        query = default_process(normalized_query)
+        bounds = score_batch(query, choices, fuzz.partial_ratio, max(score_cutoff - 0.5, 0), None)
+
+        best = []  # min-heap de (score, -índice) con los `limit` mejores
+        for index, bound in bounds:
+            ceiling = int(bound + 0.5)
+            if limit is not None and len(best) >= limit and (ceiling, -index) <= best[0]:
+                if ceiling < best[0][0]:
+                    break
+                continue
+            # Los que contienen la consulta ya salieron como substring
+            if normalized_query in entries[index].normalized:
+                continue
+            score = legacy_partial_ratio(query, choices[index])
+            if score < score_cutoff:
+                continue
+            if limit is None or len(best) < limit:
+                heapq.heappush(best, (score, -index))
+            elif (score, -index) > best[0]:
+                heapq.heapreplace(best, (score, -index))
+        best.sort(reverse=True)
+        return [(entries[-negative_index], score) for score, negative_index in best]
+
+    def token_sort_matches(self, processed_query: str, include_groups: bool = False,
+                           score_cutoff: float = 0, limit: Optional[int] = None) -> List[Tuple[ContactEntry, float]]:
+        """token_sort_ratio contra todas las entradas en una sola llamada en C.
+
+        Los tokens ordenados de cada nombre están precalculados, así que basta
+        con un ratio simple contra los tokens ordenados de la consulta.
+        """
+        if include_groups:
+            entries, choices = self.entries, self.entry_tokens
+        else:
+            entries, choices = self.contacts, self.contact_tokens
+        matches = score_batch(sort_tokens(processed_query), choices, fuzz.ratio, score_cutoff, limit)
+        return [(entries[index], score) for index, score in matches]
+
+class ContactIndex:
+    """Índice de contactos residente en memoria.
+
+    Se construye una sola vez y solo se vuelve a leer cuando cambia alguna de
+    las BDs (PRAGMA data_version + mtime/tamaño del archivo y de su -wal).
+    La normalización de nombres se reutiliza entre recargas, así que solo se
+    normalizan los nombres nuevos o modificados, y si los contactos leídos no
+    cambiaron (whatsapp.db también guarda sesiones) no se reconstruye nada.
+
+    Mantiene además un índice invertido de trigramas sobre los nombres
+    normalizados para encontrar los que contienen la consulta sin recorrerlos
+    todos. Las consultas corren en varios hilos a la vez: cada una debe tomar
+    snapshot() una sola vez y consultar esa generación.
+    """
+
+    def __init__(self, whatsapp_db_path: str, messages_db_path: str, normalizer: Callable[[str], str]):
+        self.whatsapp_db_path = whatsapp_db_path
+        self.messages_db_path = messages_db_path
+        self._normalize = normalizer
+        self._lock = threading.Lock()
+        self._connections: Dict[str, Tuple[int, sqlite3.Connection]] = {}
+        self._signature = None
+        self._normalized: Dict[str, Tuple[str, str, str]] = {}
+        self._rows: List[Tuple[str, str, str]] = []
+        self._snapshot = ContactSnapshot.build([])
+
+    def snapshot(self) -> ContactSnapshot:
+        """La generación actual del índice, recargándolo antes si las BDs cambiaron."""
+        self.refresh()
+        return self._snapshot
+
+    def entries(self, include_groups: bool = False) -> List[ContactEntry]:
+        """Devuelve las entradas del índice, recargándolo si las BDs cambiaron."""
+        return self.snapshot().select(include_groups)
+
+    def refresh(self, force: bool = False) -> bool:
+        """Recarga el índice si cambió alguna BD. Devuelve True si se recargó."""
+        with self._lock:
+            signature = (self._db_signature(self.whatsapp_db_path), self._db_signature(self.messages_db_path))
+            if not force and signature == self._signature:
+                return False
+
+            rows = self._load_rows()
+            self._signature = signature
+            if rows == self._rows and not force:
+                return False
+
+            normalized = {}
+            entries = []
+            for jid, name, source in rows:
+                forms = self._normalized.get(name)
+                if forms is None:
+                    norm = self._normalize(name)
+                    processed = default_process(norm)
+                    forms = (norm, processed, sort_tokens(processed))
+                normalized[name] = forms
+                entries.append(ContactEntry(
+                    jid=jid,
+                    name=name,
+                    normalized=forms[0],
+                    processed=forms[1],
+                    sorted_tokens=forms[2],
+                    source=source,
+                    priority=SOURCE_PRIORITY[source],
+                    is_group=jid.endswith('@g.us')
+                ))
+
+            self._normalized = normalized
+            self._rows = rows
+            # Una sola asignación: los lectores ven la generación vieja o la nueva, nunca una mezcla
+            self._snapshot = ContactSnapshot.build(entries)
+            return True
+
+    def substring_matches(self, normalized_query: str, include_groups: bool = False) -> Iterator[Tuple[int, ContactEntry]]:
+        """ContactSnapshot.substring_matches sobre la generación actual."""
+        return self.snapshot().substring_matches(normalized_query, include_groups)
+
+    def partial_ratio_matches(self, normalized_query: str, include_groups: bool = False,
+                              score_cutoff: float = 0, limit: Optional[int] = None,
+                              budget: Optional[int] = None) -> List[Tuple[ContactEntry, int]]:
+        """ContactSnapshot.partial_ratio_matches sobre la generación actual."""
+        return self.snapshot().partial_ratio_matches(normalized_query, include_groups, score_cutoff, limit, budget)
+
+    def token_sort_matches(self, processed_query: str, include_groups: bool = False,
+                           score_cutoff: float = 0, limit: Optional[int] = None) -> List[Tuple[ContactEntry, float]]:
+        """ContactSnapshot.token_sort_matches sobre la generación actual."""
+        return self.snapshot().token_sort_matches(processed_query, include_groups, score_cutoff, limit)
+
+    def invalidate(self):
+        """Fuerza la recarga en la próxima consulta."""
+        with self._lock:
+            self._signature = None
+
+    def close(self):
+        """Cierra las conexiones que mantiene el índice."""
+        with self._lock:
+            for _, conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
+            self._signature = None
+
+    def _connection(self, path: str) -> Optional[sqlite3.Connection]:
+        try:
+            inode = os.stat(path).st_ino
+        except OSError:
+            return None
+        cached = self._connections.get(path)
+        if cached is not None:
+            cached_inode, conn = cached
+            if cached_inode == inode:
+                return conn
+            # El bridge recreó el archivo: la conexión vieja apunta al archivo anterior
+            conn.close()
+        conn = db.open_readonly(path, check_same_thread=False)
+        self._connections[path] = (inode, conn)
+        return conn
+
+    def _db_signature(self, path: str) -> Optional[Tuple]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        try:
+            wal = os.stat(path + '-wal')
+            wal_signature = (wal.st_mtime_ns, wal.st_size)
+        except OSError:
+            wal_signature = None
+        try:
+            data_version = self._connection(path).execute("PRAGMA data_version").fetchone()[0]
+        except sqlite3.Error:
+            data_version = None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size, wal_signature, data_version)
+
+    def _load_rows(self) -> List[Tuple[str, str, str]]:
+        """Lee (jid, display_name, source) de ambas BDs, priorizando whatsapp.db."""
+        rows = []
+        contact_jids = set()
+
+        try:
+            conn = self._connection(self.whatsapp_db_path)
+            if conn is not None:
+                # Nombres reales de WhatsApp DB (nombres personalizados)
+                cursor = conn.execute("""
+                    SELECT
+                        their_jid,
+                        COALESCE(
+                            NULLIF(TRIM(full_name), ''),
+                            NULLIF(TRIM(first_name), ''),
+                            NULLIF(TRIM(push_name), '')
+                        ) as display_name
+                    FROM whatsmeow_contacts
+                    WHERE their_jid IS NOT NULL AND (
+                        (full_name IS NOT NULL AND TRIM(full_name) != '') OR
+                        (first_name IS NOT NULL AND TRIM(first_name) != '') OR
+                        (push_name IS NOT NULL AND TRIM(push_name) != '')
+                    )
+                """)
+                for jid, display_name in cursor.fetchall():
+                    if jid not in contact_jids:
+                        rows.append((jid, display_name, 'whatsapp'))
+                        contact_jids.add(jid)
+        except Exception as e:
+            print(f"Error accessing WhatsApp contacts DB: {e}")
+
+        try:
+            conn = self._connection(self.messages_db_path)
+            if conn is not None:
+                # Chats de Messages DB (nombres de chat/grupo)
+                cursor = conn.execute("""
+                    SELECT DISTINCT
+                        jid,
+                        name
+                    FROM chats
+                    WHERE jid != '0@s.whatsapp.net'
+                    AND name IS NOT NULL
+                    AND TRIM(name) != ''
+                """)
+                for jid, name in cursor.fetchall():
+                    if jid not in contact_jids: # Evitar duplicados de la fuente anterior
+                        rows.append((jid, name, 'chat'))
+                        contact_jids.add(jid)
+        except Exception as e:
+            print(f"Error accessing Messages DB: {e}")
+
+        return rows
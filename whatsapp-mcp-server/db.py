@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, Tuple
+
+import stats
+
+# Read-only connection tuning
+MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+CACHE_SIZE_KIB = int(os.getenv('SQLITE_CACHE_SIZE_KIB', str(64 * 1024)))
+STATEMENT_CACHE_SIZE = 256
+BUSY_TIMEOUT_MS = 5000
+
+_local = threading.local()
+
+def use_store(messages_db_path: str):
+    """
+    Point whatsapp_contacts at the store holding another messages.db (command-line tools).
+
+    whatsapp_contacts reads the store location from the environment once, at
+    import, and binds its contact index and sidecar to it; setting it here
+    first keeps every path it uses (whatsapp.db, the sidecar) in that store.
+
+    Raises:
+        RuntimeError: If whatsapp_contacts was already imported
+    """
+    if "whatsapp_contacts" in sys.modules:
+        raise RuntimeError("use_store() must be called before whatsapp_contacts is imported")
+    store_dir = os.path.dirname(os.path.abspath(messages_db_path))
+    os.environ["WHATSAPP_STORE_DIR"] = store_dir
+    os.environ["MESSAGES_DB_NAME"] = os.path.basename(messages_db_path)
+    os.environ["SIDECAR_DB_PATH"] = os.path.join(store_dir, "mcp_sidecar.db")
+
+def readonly_uri(path: str) -> str:
+    """Build a `file:` URI that opens the database read-only."""
+    return Path(path).resolve().as_uri() + "?mode=ro"
+
+def open_readonly(path: str, check_same_thread: bool = True) -> sqlite3.Connection:
+    """
+    Open a tuned read-only connection to a SQLite database.
+
+    The bridge owns the databases, so connections are opened with `mode=ro`
+    and `query_only`; they never create a missing file or take write locks.
+
+    Args:
+        path (str): Path to the database file
+        check_same_thread (bool, optional): Passed through to sqlite3.connect
+
+    Returns:
+        sqlite3.Connection: The configured connection
+
+    Raises:
+        sqlite3.OperationalError: If the database cannot be opened
+    """
+    conn = sqlite3.connect(
+        readonly_uri(path),
+        uri=True,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=check_same_thread,
+        # Times every statement when MCP_STATS_SQL is on
+        factory=stats.connection_factory()
+    )
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA query_only = ON")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    return conn
+
+def _file_identity(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return (stat.st_dev, stat.st_ino)
+
+def get_connection(path: str) -> sqlite3.Connection:
+    """
+    Return this thread's long-lived read-only connection to a database.
+
+    Connections are kept per thread and reused across tool calls, so the
+    schema and page cache stay warm. If the bridge recreates the file (its
+    device/inode changes) the stale connection is closed and reopened.
+
+    Raises:
+        FileNotFoundError: If the database file does not exist
+        sqlite3.OperationalError: If the database cannot be opened
+    """
+    connections: Dict[str, Tuple[Tuple[int, int], sqlite3.Connection]] = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    identity = _file_identity(path)
+    cached = connections.get(path)
+    if cached is not None:
+        cached_identity, conn = cached
+        if cached_identity == identity:
+            return conn
+        conn.close()
+
+    conn = open_readonly(path)
+    connections[path] = (identity, conn)
+    return conn
+
+def attach_readonly(conn: sqlite3.Connection, alias: str, path: str) -> bool:
+    """
+    Attach another database read-only to a connection, once.
+
+    Returns:
+        bool: True if the database is attached under `alias`
+    """
+    attached = {row[1] for row in conn.execute("PRAGMA database_list")}
+    if alias in attached:
+        return True
+    if not os.path.exists(path):
+        return False
+    try:
+        conn.execute("ATTACH DATABASE ? AS " + alias, (readonly_uri(path),))
+    except sqlite3.OperationalError as e:
+        print(f"Error attaching {path}: {e}")
+        return False
+    return True
+
+def close_connections():
+    """Close every pooled connection owned by the calling thread."""
+    connections = getattr(_local, 'connections', None)
+    if connections:
+        for _, conn in connections.values():
+            conn.close()
+        connections.clear()
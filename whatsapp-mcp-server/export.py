@@ -0,0 +1,295 @@
+"""Streaming export of messages to JSONL or CSV.
+
+Rows are read from messages.db in keyset-ordered chunks with `fetchmany`
+and written batch by batch, so memory stays flat however large the chat
+is, and each chunk is a short read transaction that never holds back the
+bridge's WAL checkpoints. A checkpoint file next to the output records
+the last exported row and the output size at that point; an interrupted
+export run again with the same arguments truncates the file back to that
+size and continues from there.
+
+    python export.py OUTPUT [--chat JID] [--sender PHONE] [--after DATE] [--before DATE]
+                     [--format jsonl|csv] [--gzip] [--no-resume] [--db PATH]
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional
+
+import db
+
+# whatsapp_contacts is imported where it is used: it binds the store paths
+# at import, and main() may point them at another store first (--db)
+
+# Rows per fetchmany() call, and per keyset query (one read transaction)
+FETCH_ROWS = 1000
+CHUNK_ROWS = 50000
+
+# Output is made durable and the checkpoint advanced every this many rows
+CHECKPOINT_ROWS = 50000
+
+FORMATS = ("jsonl", "csv")
+
+# One encoder for every row: json.dumps with options builds a new one per call
+_encode_json = json.JSONEncoder(ensure_ascii=False, check_circular=False).encode
+
+COLUMNS = ["id", "chat_jid", "chat_name", "timestamp", "sender", "sender_name", "is_from_me",
+           "content", "media_type", "filename"]
+
+@dataclass
+class ExportResult:
+    path: str
+    format: str
+    compressed: bool
+    rows: int
+    bytes: int
+    seconds: float
+    resumed_from: int = 0
+
+def iter_message_rows(order: "whatsapp_contacts.TimeOrder", where_clauses: List[str], params: list,
+                      position: Optional[list] = None) -> Iterator[List[tuple]]:
+    """
+    Yield batches of message rows, oldest first in `order`, starting after `position`.
+
+    Rows are (timestamp, id, chat_jid, chat_name, sender, is_from_me, content,
+    media_type, filename, time, key); timestamps are passed through as
+    stored and the last two columns are the row's position in `order`.
+    """
+    import whatsapp_contacts
+
+    conn = db.get_connection(whatsapp_contacts.MESSAGES_DB_PATH)
+    time_column, key_column = order.column(order.time), order.column(order.key)
+    while True:
+        clauses, chunk_params = list(where_clauses), list(params)
+        if position is not None:
+            clause, keyset_params = whatsapp_contacts.keyset_clause(time_column, key_column, position, False)
+            clauses.append(clause)
+            chunk_params.extend(keyset_params)
+        cursor = conn.execute(f"""
+            SELECT messages.timestamp, messages.id, messages.chat_jid, chats.name, messages.sender,
+                   messages.is_from_me, messages.content, messages.media_type, messages.filename,
+                   {time_column}, {key_column}
+            FROM messages
+            LEFT JOIN chats ON messages.chat_jid = chats.jid
+            {order.join}
+            {"WHERE " + " AND ".join(clauses) if clauses else ""}
+            ORDER BY {time_column}, {key_column}
+            LIMIT ?
+        """, chunk_params + [CHUNK_ROWS])
+        fetched = 0
+        try:
+            while True:
+                rows = cursor.fetchmany(FETCH_ROWS)
+                if not rows:
+                    break
+                fetched += len(rows)
+                position = [rows[-1][9], rows[-1][10]]
+                yield rows
+        finally:
+            cursor.close()
+        if fetched < CHUNK_ROWS:
+            return
+
+def _records(rows: List[tuple]) -> List[list]:
+    """Turn a batch of rows into output records in COLUMNS order."""
+    import whatsapp_contacts
+
+    names = whatsapp_contacts.get_sender_names(row[4] for row in rows if not row[5])
+    return [
+        [row[1], row[2], row[3], row[0], row[4], "Me" if row[5] else names.get(row[4], row[4]),
+         bool(row[5]), row[6], row[7] or None, row[8] or None]
+        for row in rows
+    ]
+
+def _encode(records: List[list], format: str) -> bytes:
+    if format == "jsonl":
+        return "".join(
+            _encode_json(dict(zip(COLUMNS, record))) + "\n" for record in records
+        ).encode("utf-8")
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(records)
+    return buffer.getvalue().encode("utf-8")
+
+def _header(format: str) -> bytes:
+    if format == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(COLUMNS)
+        return buffer.getvalue().encode("utf-8")
+    return b""
+
+class _Output:
+    """Output file written in segments that can be committed and resumed.
+
+    With compression every segment is a complete gzip member (a gzip file
+    may hold several), so the file can be truncated at any committed
+    offset and appended to.
+    """
+
+    def __init__(self, path: str, offset: int, compress: bool):
+        self.compress = compress
+        self.raw = open(path, "r+b" if offset else "wb")
+        self.raw.truncate(offset)
+        self.raw.seek(offset)
+        self._sink = None
+
+    def write(self, data: bytes):
+        if self._sink is None:
+            self._sink = gzip.GzipFile(fileobj=self.raw, mode="wb", compresslevel=6) if self.compress else self.raw
+        self._sink.write(data)
+
+    def commit(self) -> int:
+        """Make everything written so far durable; returns the committed size."""
+        if self._sink is not None and self._sink is not self.raw:
+            self._sink.close()
+        self._sink = None
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+        return self.raw.tell()
+
+    def close(self):
+        self.raw.close()
+
+def _checkpoint_path(path: str) -> str:
+    return path + ".checkpoint"
+
+def _load_checkpoint(path: str, job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    try:
+        with open(_checkpoint_path(path)) as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if checkpoint.get("job") != job or not os.path.exists(path) or os.path.getsize(path) < checkpoint["offset"]:
+        return None
+    return checkpoint
+
+def _save_checkpoint(path: str, checkpoint: Dict[str, Any]):
+    tmp_path = _checkpoint_path(path) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, _checkpoint_path(path))
+
+def export_chat(
+    output_path: str,
+    chat_jid: Optional[str] = None,
+    sender_phone_number: Optional[str] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    format: Optional[str] = None,
+    compress: Optional[bool] = None,
+    resume: bool = True
+) -> ExportResult:
+    """
+    Export messages, oldest first, to a JSONL or CSV file.
+
+    Args:
+        output_path (str): File to write
+        chat_jid, sender_phone_number, after, before: Filters, as in list_messages
+        format (str, optional): "jsonl" or "csv" (default: from the file
+            extension, else jsonl)
+        compress (bool, optional): gzip the output (default: if the path ends in .gz)
+        resume (bool, optional): Continue an interrupted export of the same
+            query instead of starting over (default True)
+
+    Returns:
+        ExportResult: Where and how much was written
+    """
+    import whatsapp_contacts
+
+    output_path = os.path.abspath(output_path)
+    stem = output_path[:-3] if output_path.endswith(".gz") else output_path
+    if compress is None:
+        compress = output_path.endswith(".gz")
+    if format is None:
+        format = "csv" if stem.endswith(".csv") else "jsonl"
+    if format not in FORMATS:
+        raise ValueError(f"Unknown export format: {format}. Use one of {', '.join(FORMATS)}.")
+
+    job = {"chat_jid": chat_jid, "sender": sender_phone_number, "after": after, "before": before,
+           "format": format, "compress": compress}
+    checkpoint = _load_checkpoint(output_path, job) if resume else None
+    if checkpoint is None:
+        checkpoint = {"job": job, "offset": 0, "rows": 0, "order": None, "position": None}
+    resumed_from = checkpoint["rows"]
+
+    # Same time order, filters and keyset as list_messages; a resumed export
+    # continues in the order it started in when it can
+    conn = db.get_connection(whatsapp_contacts.MESSAGES_DB_PATH)
+    order, position = whatsapp_contacts.time_order_after(conn, checkpoint.get("order", "timestamp"),
+                                                         checkpoint["position"])
+    where_clauses, params = whatsapp_contacts.message_filters(order, after, before, sender_phone_number, chat_jid)
+    checkpoint.update(order=order.cursor_kind, position=position)
+
+    start = time.perf_counter()
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    output = _Output(output_path, checkpoint["offset"], compress)
+    try:
+        if checkpoint["offset"] == 0:
+            output.write(_header(format))
+        rows = checkpoint["rows"]
+        pending = 0
+        for batch in iter_message_rows(order, where_clauses, params, position):
+            output.write(_encode(_records(batch), format))
+            rows += len(batch)
+            pending += len(batch)
+            if pending >= CHECKPOINT_ROWS:
+                checkpoint.update(offset=output.commit(), rows=rows, position=[batch[-1][9], batch[-1][10]])
+                _save_checkpoint(output_path, checkpoint)
+                pending = 0
+        size = output.commit()
+    finally:
+        output.close()
+
+    # Complete: a later run with the same arguments starts over
+    try:
+        os.unlink(_checkpoint_path(output_path))
+    except FileNotFoundError:
+        pass
+    return ExportResult(
+        path=output_path,
+        format=format,
+        compressed=compress,
+        rows=rows,
+        bytes=size,
+        seconds=time.perf_counter() - start,
+        resumed_from=resumed_from
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Export WhatsApp messages to JSONL or CSV.")
+    parser.add_argument("output", help="file to write (.jsonl, .csv, optionally with .gz)")
+    parser.add_argument("--chat", help="only this chat JID")
+    parser.add_argument("--sender", help="only messages from this phone number")
+    parser.add_argument("--after", help="only messages after this ISO-8601 date")
+    parser.add_argument("--before", help="only messages before this ISO-8601 date")
+    parser.add_argument("--format", choices=FORMATS, help="default: from the file extension")
+    parser.add_argument("--gzip", action="store_true", default=None, help="compress the output")
+    parser.add_argument("--no-resume", action="store_true", help="start over even if a checkpoint exists")
+    parser.add_argument("--db", help="path to messages.db (default: the configured store)")
+    args = parser.parse_args()
+
+    if args.db:
+        db.use_store(args.db)
+
+    try:
+        result = export_chat(args.output, args.chat, args.sender, args.after, args.before,
+                             args.format, args.gzip, resume=not args.no_resume)
+    except (ValueError, OSError, sqlite3.Error) as e:
+        print(f"Error: {e}")
+        return 1
+
+    rate = (result.rows - result.resumed_from) / result.seconds if result.seconds else 0
+    resumed = f" (resumed after {result.resumed_from})" if result.resumed_from else ""
+    print(f"Exported {result.rows} message(s){resumed} to {result.path}: "
+          f"{result.bytes / 1024 / 1024:.1f} MiB in {result.seconds:.1f}s, {rate:,.0f} rows/s")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
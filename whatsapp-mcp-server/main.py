@@ -1,27 +1,40 @@
+from dataclasses import asdict
 from typing import List, Dict, Any, Optional
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
+import stats
+from concurrency import run_blocking
+from export import export_chat as whatsapp_export_chat
 from whatsapp_contacts import (
     search_contacts as whatsapp_search_contacts,
     search_contacts_enhanced as whatsapp_search_contacts_enhanced,
     smart_search_contacts as whatsapp_smart_search_contacts,
     smart_search_contacts_enhanced as whatsapp_smart_search_contacts_enhanced,
-    list_messages as whatsapp_list_messages,
+    list_messages_page as whatsapp_list_messages_page,
     list_chats as whatsapp_list_chats,
     get_chat as whatsapp_get_chat,
     get_direct_chat_by_contact as whatsapp_get_direct_chat_by_contact,
     get_contact_chats as whatsapp_get_contact_chats,
     get_message_context as whatsapp_get_message_context,
-    send_message as whatsapp_send_message,
-    send_file as whatsapp_send_file,
-    send_audio_message as whatsapp_send_audio_message,
-    download_media as whatsapp_download_media
+    get_message_contexts as whatsapp_get_message_contexts,
+    send_message_async as whatsapp_send_message,
+    send_file_async as whatsapp_send_file,
+    send_audio_message_async as whatsapp_send_audio_message,
+    download_media_async as whatsapp_download_media,
+    send_messages_batch as whatsapp_send_messages_batch,
+    prefetch_media as whatsapp_prefetch_media,
+    start_background_indexing
 )
 
 # Initialize FastMCP server
 mcp = FastMCP("whatsapp")
 
-@mcp.tool()
-def search_contacts(query: str, limit: int = 25, include_groups: bool = False) -> List[Dict[str, Any]]:
+def tool():
+    """mcp.tool() that also records each call's latency in stats."""
+    register = mcp.tool()
+    return lambda func: register(stats.timed(func))
+
+@tool()
+async def search_contacts(query: str, limit: int = 25, include_groups: bool = False) -> List[Dict[str, Any]]:
     """Search WhatsApp contacts by name or phone number with advanced fuzzy matching.
     
     Args:
@@ -31,7 +44,7 @@ def search_contacts(query: str, limit: int = 25, include_groups: bool = False) -
     """
     # Try enhanced search first (using real WhatsApp contact names)
     try:
-        contacts = whatsapp_search_contacts_enhanced(query, limit, include_groups)
+        contacts = await run_blocking(whatsapp_search_contacts_enhanced, query, limit, include_groups)
         if contacts:
             return [
                 {
@@ -45,7 +58,7 @@ def search_contacts(query: str, limit: int = 25, include_groups: bool = False) -
         print(f"Enhanced search failed, falling back to basic search: {e}")
     
     # Fallback to basic search
-    contacts = whatsapp_search_contacts(query, limit, include_groups)
+    contacts = await run_blocking(whatsapp_search_contacts, query, limit, include_groups)
     return [
         {
             "phone_number": contact.phone_number,
@@ -55,8 +68,8 @@ def search_contacts(query: str, limit: int = 25, include_groups: bool = False) -
         for contact in contacts
     ]
 
-@mcp.tool()
-def smart_search_contacts(query: str, limit: int = 25, include_groups: bool = False, similarity_threshold: float = 0.6) -> List[Dict[str, Any]]:
+@tool()
+async def smart_search_contacts(query: str, limit: int = 25, include_groups: bool = False, similarity_threshold: float = 0.6) -> List[Dict[str, Any]]:
     """Advanced contact search with AI-like similarity matching and typo tolerance.
     
     This function provides intelligent search capabilities:
@@ -73,7 +86,7 @@ def smart_search_contacts(query: str, limit: int = 25, include_groups: bool = Fa
     """
     # Try enhanced smart search first (using real WhatsApp contact names)
     try:
-        contacts = whatsapp_smart_search_contacts_enhanced(query, limit, include_groups, similarity_threshold)
+        contacts = await run_blocking(whatsapp_smart_search_contacts_enhanced, query, limit, include_groups, similarity_threshold)
         if contacts:
             return [
                 {
@@ -87,7 +100,7 @@ def smart_search_contacts(query: str, limit: int = 25, include_groups: bool = Fa
         print(f"Enhanced smart search failed, falling back to basic smart search: {e}")
     
     # Fallback to basic smart search
-    contacts = whatsapp_smart_search_contacts(query, limit, include_groups, similarity_threshold)
+    contacts = await run_blocking(whatsapp_smart_search_contacts, query, limit, include_groups, similarity_threshold)
     return [
         {
             "phone_number": contact.phone_number,
@@ -97,8 +110,8 @@ def smart_search_contacts(query: str, limit: int = 25, include_groups: bool = Fa
         for contact in contacts
     ]
 
-@mcp.tool()
-def list_messages(
+@tool()
+async def list_messages(
     after: Optional[str] = None,
     before: Optional[str] = None,
     sender_phone_number: Optional[str] = None,
@@ -110,8 +123,10 @@ def list_messages(
     context_before: int = 1,
     context_after: int = 1,
     max_results: int = 100,
-    force_load: bool = False
-) -> List[Dict[str, Any]]:
+    force_load: bool = False,
+    sort_by: str = "timestamp",
+    cursor: Optional[str] = None
+) -> Dict[str, Any]:
     """Get WhatsApp messages matching specified criteria with optional context.
     
     Args:
@@ -119,35 +134,52 @@ def list_messages(
         before: Optional ISO-8601 formatted string to only return messages before this date
         sender_phone_number: Optional phone number to filter messages by sender
         chat_jid: Optional chat JID to filter messages by chat
-        query: Optional search term to filter messages by content
+        query: Optional search term to filter messages by content (words match as prefixes, "quoted text" as an exact phrase)
         limit: Maximum number of messages to return (default 20)
-        page: Page number for pagination (default 0)
+        page: Page number for pagination (default 0); prefer cursor for deep history
         include_context: Whether to include messages before and after matches (default True)
         context_before: Number of messages to include before each match (default 1)
         context_after: Number of messages to include after each match (default 1)
         max_results: Maximum number of total results to return (default 100)
         force_load: Force loading messages even without filters (default False)
+        sort_by: "timestamp" for newest first or "relevance" to rank query matches (default "timestamp")
+        cursor: Optional next_cursor from a previous call, to fetch the following page
+    
+    Returns a dictionary with "messages" and "next_cursor" (None on the last page),
+    or success False and a message if a date or the cursor is invalid.
     
     Note: To prevent loading entire history, at least one filter must be specified or force_load=True.
     """
-    messages = whatsapp_list_messages(
-        after=after,
-        before=before,
-        sender_phone_number=sender_phone_number,
-        chat_jid=chat_jid,
-        query=query,
-        limit=limit,
-        page=page,
-        include_context=include_context,
-        context_before=context_before,
-        context_after=context_after,
-        max_results=max_results,
-        force_load=force_load
-    )
-    return messages
+    try:
+        result = await run_blocking(
+            whatsapp_list_messages_page,
+            after=after,
+            before=before,
+            sender_phone_number=sender_phone_number,
+            chat_jid=chat_jid,
+            query=query,
+            limit=limit,
+            page=page,
+            include_context=include_context,
+            context_before=context_before,
+            context_after=context_after,
+            max_results=max_results,
+            force_load=force_load,
+            sort_by=sort_by,
+            cursor=cursor
+        )
+    except ValueError as e:
+        return {
+            "success": False,
+            "message": str(e)
+        }
+    return {
+        "messages": [message.to_dict() for message in result.messages],
+        "next_cursor": result.next_cursor
+    }
 
-@mcp.tool()
-def get_message_context(
+@tool()
+async def get_message_context(
     message_id: str,
     before: int = 5,
     after: int = 5
@@ -159,11 +191,31 @@ def get_message_context(
         before: Number of messages to include before the target message (default 5)
         after: Number of messages to include after the target message (default 5)
     """
-    context = whatsapp_get_message_context(message_id, before, after)
-    return context
+    context = await run_blocking(whatsapp_get_message_context, message_id, before, after)
+    return context.to_dict() if context else None
+
+@tool()
+async def get_message_contexts(
+    message_ids: List[str],
+    before: int = 5,
+    after: int = 5
+) -> Dict[str, Any]:
+    """Get context around many WhatsApp messages in a single call.
+    
+    Prefer this over calling get_message_context once per message.
+    
+    Args:
+        message_ids: The IDs of the messages to get context for
+        before: Number of messages to include before each target message (default 5)
+        after: Number of messages to include after each target message (default 5)
+    
+    Returns a dictionary mapping each found message ID to its context.
+    """
+    contexts = await run_blocking(whatsapp_get_message_contexts, message_ids, before, after)
+    return {message_id: context.to_dict() for message_id, context in contexts.items()}
 
-@mcp.tool()
-def send_message(
+@tool()
+async def send_message(
     recipient: str,
     message: str
 ) -> Dict[str, Any]:
@@ -185,14 +237,43 @@ def send_message(
         }
     
     # Call the whatsapp_send_message function with the unified recipient parameter
-    success, status_message = whatsapp_send_message(recipient, message)
+    success, status_message = await whatsapp_send_message(recipient, message)
     return {
         "success": success,
         "message": status_message
     }
 
-@mcp.tool()
-def send_file(recipient: str, media_path: str) -> Dict[str, Any]:
+@tool()
+async def send_messages_batch(
+    items: List[Dict[str, Any]],
+    concurrency: Optional[int] = None,
+    rate_per_second: Optional[float] = None
+) -> Dict[str, Any]:
+    """Send many WhatsApp messages in one call, e.g. the same notice to many recipients.
+    
+    Messages to the same recipient are delivered in the order given; different
+    recipients are sent to concurrently. Prefer this over calling send_message in a loop.
+    
+    Args:
+        items: List of objects with "recipient" (phone number or JID) and "message", and/or
+               "media_path" (absolute path; the message becomes its caption). Set "as_audio": true
+               to send the media as a voice message
+        concurrency: Maximum messages being sent at once (default 8)
+        rate_per_second: Maximum messages started per second, 0 for no limit (default 5)
+    
+    Returns:
+        A dictionary with the number of messages sent and failed, and one result per item in input order
+    """
+    results = await whatsapp_send_messages_batch(items, concurrency, rate_per_second)
+    sent = sum(1 for result in results if result["success"])
+    return {
+        "sent": sent,
+        "failed": len(results) - sent,
+        "results": results
+    }
+
+@tool()
+async def send_file(recipient: str, media_path: str) -> Dict[str, Any]:
     """Send a file such as a picture, raw audio, video or document via WhatsApp to the specified recipient. For group messages use the JID.
     
     Args:
@@ -205,32 +286,32 @@ def send_file(recipient: str, media_path: str) -> Dict[str, Any]:
     """
     
     # Call the whatsapp_send_file function
-    success, status_message = whatsapp_send_file(recipient, media_path)
+    success, status_message = await whatsapp_send_file(recipient, media_path)
     return {
         "success": success,
         "message": status_message
     }
 
-@mcp.tool()
-def send_audio_message(recipient: str, media_path: str) -> Dict[str, Any]:
+@tool()
+async def send_audio_message(recipient: str, media_path: str) -> Dict[str, Any]:
     """Send any audio file as a WhatsApp audio message to the specified recipient. For group messages use the JID. If it errors due to ffmpeg not being installed, use send_file instead.
     
     Args:
         recipient: The recipient - either a phone number with country code but no + or other symbols,
                  or a JID (e.g., "123456789@s.whatsapp.net" or a group JID like "123456789@g.us")
-        media_path: The absolute path to the audio file to send (will be converted to Opus .ogg if it's not a .ogg file)
+        media_path: The absolute path to the audio file to send (converted to Opus .ogg unless it already is Opus in an Ogg container)
     
     Returns:
         A dictionary containing success status and a status message
     """
-    success, status_message = whatsapp_send_audio_message(recipient, media_path)
+    success, status_message = await whatsapp_send_audio_message(recipient, media_path)
     return {
         "success": success,
         "message": status_message
     }
 
-@mcp.tool()
-def download_media(message_id: str, chat_jid: str) -> Dict[str, Any]:
+@tool()
+async def download_media(message_id: str, chat_jid: str) -> Dict[str, Any]:
     """Download media from a WhatsApp message and get the local file path.
     
     Args:
@@ -240,7 +321,7 @@ def download_media(message_id: str, chat_jid: str) -> Dict[str, Any]:
     Returns:
         A dictionary containing success status, a status message, and the file path if successful
     """
-    file_path = whatsapp_download_media(message_id, chat_jid)
+    file_path = await whatsapp_download_media(message_id, chat_jid)
     
     if file_path:
         return {
@@ -254,6 +335,108 @@ def download_media(message_id: str, chat_jid: str) -> Dict[str, Any]:
             "message": "Failed to download media"
         }
 
+@tool()
+async def prefetch_media(
+    ctx: Context,
+    chat_jid: Optional[str] = None,
+    media_type: Optional[str] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = 200,
+    concurrency: Optional[int] = None
+) -> Dict[str, Any]:
+    """Download the media of many messages at once, e.g. all images of a chat, and get their local paths.
+    
+    Files downloaded before are not fetched again, so an interrupted prefetch can simply be re-run.
+    
+    Args:
+        chat_jid: Optional chat JID to only fetch media from this chat
+        media_type: Optional media type to fetch ("image", "video", "audio" or "document")
+        after: Optional ISO-8601 formatted string to only fetch media sent after this date
+        before: Optional ISO-8601 formatted string to only fetch media sent before this date
+        limit: Maximum number of messages to fetch, newest first (default 200)
+        concurrency: Parallel downloads (default 4)
+    
+    Returns:
+        A dictionary with counts per status ("cached", "downloaded", "failed") and one result per message
+    """
+    async def report(done: int, total: int):
+        await ctx.report_progress(done, total)
+
+    results = await whatsapp_prefetch_media(chat_jid, media_type, after, before, limit, concurrency, report)
+    counts = {"cached": 0, "downloaded": 0, "failed": 0}
+    for result in results:
+        counts[result["status"]] += 1
+    return {
+        **counts,
+        "results": results
+    }
+
+@tool()
+async def export_chat(
+    output_path: str,
+    chat_jid: Optional[str] = None,
+    sender_phone_number: Optional[str] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    format: Optional[str] = None,
+    compress: Optional[bool] = None
+) -> Dict[str, Any]:
+    """Export a whole chat (or any messages matching the filters) to a file, oldest first.
+    
+    Use this instead of paging list_messages to get complete histories. If an export
+    is interrupted, calling it again with the same arguments continues where it stopped.
+    
+    Args:
+        output_path: Absolute path of the file to write (.jsonl or .csv, add .gz to compress)
+        chat_jid: Optional chat JID to export
+        sender_phone_number: Optional phone number to only export messages from this sender
+        after: Optional ISO-8601 formatted string to only export messages after this date
+        before: Optional ISO-8601 formatted string to only export messages before this date
+        format: Optional "jsonl" or "csv" (default: from the file extension, else jsonl)
+        compress: Optional gzip compression (default: if output_path ends in .gz)
+    
+    Returns:
+        A dictionary with the output path, format, number of messages and bytes written
+    """
+    try:
+        result = await run_blocking(
+            whatsapp_export_chat, output_path, chat_jid, sender_phone_number, after, before, format, compress
+        )
+    except (ValueError, OSError) as e:
+        return {
+            "success": False,
+            "message": str(e)
+        }
+    return {
+        "success": True,
+        **asdict(result)
+    }
+
+@tool()
+async def server_stats(top_statements: int = 10, reset: bool = False) -> Dict[str, Any]:
+    """Latency statistics of this server since it started (or since the last reset).
+    
+    Use this when tools feel slow to see where the time goes: each MCP tool, the
+    WhatsApp bridge HTTP calls, ffmpeg conversions and, if MCP_STATS_SQL is on,
+    each SQL statement.
+    
+    Args:
+        top_statements: Number of SQL statements to return, slowest (by total time) first (default 10)
+        reset: Clear the statistics after reading them (default False)
+    
+    Returns:
+        A dictionary with call counts, status counts and mean/p50/p90/p99/max latencies
+        in milliseconds per tool, bridge endpoint and audio operation, plus the SQL statements
+    """
+    result = stats.snapshot(top_statements)
+    if reset:
+        stats.reset()
+    return result
+
 if __name__ == "__main__":
-    # Initialize and run the server
+    # Initialize and run the server; tools run on the event loop and hand
+    # SQLite reads and ffmpeg work to the bounded pools in concurrency.py
+    start_background_indexing()
+    stats.start_file_dump()
     mcp.run(transport='stdio')
@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from cache import DiskCache
+
+@dataclass
+class MediaInfo:
+    message_id: str
+    chat_jid: str
+    media_type: str
+    filename: Optional[str]
+    file_sha256: Optional[bytes]
+    file_length: Optional[int]
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one in-flight call.
+
+    Works across threads and coroutines: whoever arrives first runs the call
+    and everyone else waits for its result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+
+    def _join(self, key: Hashable) -> Tuple[Future, bool]:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def _finish(self, key: Hashable, future: Future, result: Any = None, error: Optional[BaseException] = None):
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = func()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def ado(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        future, leader = self._join(key)
+        if not leader:
+            # shield: a cancelled follower must not cancel the shared call
+            return await asyncio.shield(asyncio.wrap_future(future))
+        try:
+            result = await func()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+class MediaMismatch(Exception):
+    """A downloaded file does not match the length/SHA-256 recorded for its message."""
+
+def verify_media(path: str, info: MediaInfo) -> bool:
+    """Check a file against the file_length and file_sha256 stored with its message.
+
+    Messages stored without that metadata are accepted as they are.
+    """
+    if info.file_length and os.path.getsize(path) != info.file_length:
+        return False
+    if info.file_sha256:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        if digest.digest() != info.file_sha256:
+            return False
+    return True
+
+def _move(src: str, dst: str):
+    """Move a file over an existing one; a rename when both are on the same disk."""
+    try:
+        os.replace(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+        os.unlink(src)
+
+class MediaCache:
+    """Downloaded media, keyed by (message_id, chat_jid).
+
+    Files fetched by the bridge are verified and moved into a size-bounded
+    DiskCache, so hits never reach the bridge and disk usage stays bounded.
+    Entries are verified in full when stored; hits only re-check the length.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.disk = DiskCache(directory, max_bytes)
+
+    @staticmethod
+    def key(info: MediaInfo) -> str:
+        return hashlib.sha256(f"{info.chat_jid}\0{info.message_id}".encode()).hexdigest()
+
+    @staticmethod
+    def suffix(info: MediaInfo) -> str:
+        # Keep the bridge's file name so the extension (and the agent's view) is unchanged
+        return "-" + os.path.basename(info.filename) if info.filename else ""
+
+    def get(self, info: MediaInfo) -> Optional[str]:
+        """Path of the cached file, or None if it is missing or truncated."""
+        path = self.disk.lookup(self.key(info), self.suffix(info))
+        if path is None:
+            return None
+        if info.file_length and os.path.getsize(path) != info.file_length:
+            os.unlink(path)
+            return None
+        return path
+
+    def put(self, info: MediaInfo, downloaded_path: str) -> str:
+        """Verify a file downloaded by the bridge and move it into the cache.
+
+        Raises:
+            MediaMismatch: If the file fails verification (it is deleted)
+        """
+        if not verify_media(downloaded_path, info):
+            os.unlink(downloaded_path)
+            raise MediaMismatch(f"Downloaded file does not match message {info.message_id}: {downloaded_path}")
+        return self.disk.get_or_create(
+            self.key(info),
+            lambda tmp_path: _move(downloaded_path, tmp_path),
+            self.suffix(info)
+        )
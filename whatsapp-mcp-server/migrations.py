@@ -0,0 +1,200 @@
+"""Secondary indexes for the bridge's messages.db.
+
+The bridge creates `messages` with only its (id, chat_jid) primary key, so
+every time-ordered listing, sender filter and last-message join scans the
+table. `ensure_indexes` adds the indexes those queries need; it is
+idempotent and can be run offline, with the bridge stopped:
+
+    python migrations.py [--db path/to/messages.db] [--explain]
+
+At server startup they are only built in the background while messages.db
+is below AUTO_INDEX_MAX_BYTES. Building an index locks the database, and
+the bridge's writes give up after SQLite's default 5 s busy timeout, so on
+a larger store incoming messages would be lost.
+
+`--explain` prints EXPLAIN QUERY PLAN for the statements that
+whatsapp_contacts actually runs against the database.
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+import db
+
+# (name, table, columns): each one is justified by a query in whatsapp_contacts
+INDEXES: List[Tuple[str, str, str]] = [
+    # Chat history, message context windows and the last-message join
+    ('idx_messages_chat_timestamp', 'messages', 'chat_jid, timestamp'),
+    # sender_phone_number filters and contact lookups
+    ('idx_messages_sender_timestamp', 'messages', 'sender, timestamp'),
+    # Unfiltered newest-first listings; id is the keyset tiebreak
+    ('idx_messages_timestamp', 'messages', 'timestamp, id'),
+    # Media listings and prefetching
+    ('idx_messages_media_timestamp', 'messages', 'media_type, timestamp'),
+    # list_chats ordered by activity
+    ('idx_chats_last_message_time', 'chats', 'last_message_time, jid'),
+]
+
+# Largest messages.db whose missing indexes are built while the bridge runs;
+# around 64 MiB each index takes about a second to build
+AUTO_INDEX_MAX_BYTES = int(os.getenv('AUTO_INDEX_MAX_BYTES', str(64 * 1024 * 1024)))
+
+_started = False
+_started_lock = threading.Lock()
+_attempted = threading.Event()
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    # mode=rw: never create messages.db before the bridge does
+    return sqlite3.connect(Path(db_path).resolve().as_uri() + "?mode=rw", uri=True,
+                           timeout=db.BUSY_TIMEOUT_MS / 1000)
+
+def _missing(conn: sqlite3.Connection) -> List[Tuple[str, str, str]]:
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return [index for index in INDEXES if index[0] not in existing and index[1] in tables]
+
+def missing_indexes(db_path: str) -> List[str]:
+    """Names of the indexes from INDEXES that messages.db does not have yet."""
+    conn = _connect(db_path)
+    try:
+        return [name for name, _, _ in _missing(conn)]
+    finally:
+        conn.close()
+
+def ensure_indexes(db_path: str) -> List[str]:
+    """
+    Create any missing index from INDEXES.
+
+    Each build locks messages.db; on a large store run it with the bridge stopped.
+
+    Args:
+        db_path (str): Path to messages.db
+
+    Returns:
+        List[str]: Names of the indexes that were created
+    """
+    conn = _connect(db_path)
+    try:
+        created = []
+        for name, table, columns in _missing(conn):
+            # One index per transaction so the bridge's writers wait for one build at most
+            with conn:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+            created.append(name)
+        if created:
+            conn.execute("PRAGMA optimize")
+        return created
+    finally:
+        conn.close()
+
+def ensure_indexes_in_background(db_path: str, retry_interval: float = 30.0) -> threading.Event:
+    """
+    Run ensure_indexes in a daemon thread, retrying until messages.db exists.
+
+    Stores larger than AUTO_INDEX_MAX_BYTES are left alone: their missing
+    indexes are reported, to be built offline with `python migrations.py`.
+
+    Returns:
+        threading.Event: Set once an attempt has finished, so work that needs
+        the indexes (the sidecar backfill) can wait for them
+    """
+    global _started
+    with _started_lock:
+        if _started:
+            return _attempted
+        _started = True
+
+    def run():
+        while True:
+            if Path(db_path).exists():
+                try:
+                    size = os.path.getsize(db_path)
+                    missing = missing_indexes(db_path) if size > AUTO_INDEX_MAX_BYTES else None
+                    if missing:
+                        print(f"{db_path} is {size / 1024 / 1024:.0f} MiB, too large to index while the bridge "
+                              f"is running; missing indexes: {', '.join(missing)}. Stop the bridge and run "
+                              f"'python migrations.py' to create them.")
+                    else:
+                        ensure_indexes(db_path)
+                    return
+                except sqlite3.Error as e:
+                    print(f"Error creating indexes on {db_path}: {e}")
+                finally:
+                    _attempted.set()
+            time.sleep(retry_interval)
+
+    threading.Thread(target=run, name='ensure-indexes', daemon=True).start()
+    return _attempted
+
+def explain_queries() -> List[Tuple[str, List[str]]]:
+    """
+    Capture the SELECTs whatsapp_contacts runs for typical calls and explain them.
+
+    Runs against the store whatsapp_contacts is configured for; to explain
+    another one, call db.use_store() before it is imported.
+
+    Returns:
+        List[Tuple[str, List[str]]]: (statement, query plan lines) pairs
+    """
+    import whatsapp_contacts
+
+    conn = db.get_connection(whatsapp_contacts.MESSAGES_DB_PATH)
+    sample = conn.execute("SELECT id, chat_jid, sender, timestamp FROM messages ORDER BY rowid DESC LIMIT 1").fetchone()
+    if sample is None:
+        return []
+    message_id, chat_jid, sender, timestamp = sample
+
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        whatsapp_contacts.list_messages(chat_jid=chat_jid)
+        whatsapp_contacts.list_messages(sender_phone_number=sender)
+        whatsapp_contacts.list_messages(after=timestamp[:10])
+        page = whatsapp_contacts.list_messages_page(force_load=True)
+        whatsapp_contacts.list_messages_page(force_load=True, cursor=page.next_cursor)
+        whatsapp_contacts.get_message_context(message_id)
+        whatsapp_contacts.list_chats()
+        whatsapp_contacts.get_chat(chat_jid)
+        whatsapp_contacts.get_contact_chats(sender)
+    finally:
+        conn.set_trace_callback(None)
+
+    plans = []
+    for statement in dict.fromkeys(statements):
+        if not statement.lstrip().upper().startswith("SELECT"):
+            continue
+        rows = conn.execute("EXPLAIN QUERY PLAN " + statement).fetchall()
+        plans.append((statement, [row[3] for row in rows]))
+    return plans
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Create the messages.db indexes used by the MCP server. Stop the bridge first: "
+                    "index builds lock the database and the bridge's writes would fail meanwhile."
+    )
+    parser.add_argument("--db", help="path to messages.db (default: the configured store)")
+    parser.add_argument("--explain", action="store_true", help="print query plans after migrating")
+    args = parser.parse_args()
+
+    if args.db:
+        db.use_store(args.db)
+    import whatsapp_contacts
+    db_path = whatsapp_contacts.MESSAGES_DB_PATH
+
+    start = time.perf_counter()
+    created = ensure_indexes(db_path)
+    elapsed = time.perf_counter() - start
+    print(f"Created {len(created)} index(es) in {elapsed:.1f}s: {', '.join(created) or 'none missing'}")
+
+    if args.explain:
+        for statement, plan in explain_queries():
+            print("\n" + " ".join(statement.split()))
+            for line in plan:
+                print("    " + line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Compact records for rows read from messages.db.
+
+Tool results can hold thousands of messages, most of which are only
+serialized once. Records are slotted (no per-instance __dict__) and keep
+timestamps as the strings SQLite returned: a timestamp becomes a datetime
+only when code reads it, and to_dict() emits the stored string in ISO-8601
+form after validating it, without building and re-formatting a datetime.
+The stored value stays available (e.g. `raw_timestamp`) for keyset
+cursors, which compare against the column as stored.
+"""
+from datetime import datetime
+from operator import attrgetter
+from typing import Any, Callable, Dict, Optional, Tuple
+
+def parse_timestamp(value, fallback_now: bool = False) -> Optional[datetime]:
+    """Parse a stored timestamp; malformed values become None (or now() with fallback_now)."""
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return datetime.now() if fallback_now else None
+    return value
+
+class LazyTimestamp:
+    """Descriptor exposing the timestamp stored in slot `raw` as a datetime.
+
+    Parsing is cheap next to building the record, so values are parsed on
+    each access rather than cached in another slot.
+    """
+
+    def __init__(self, raw: str, fallback_now: bool = False):
+        self.raw = raw
+        self.fallback_now = fallback_now
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return parse_timestamp(getattr(obj, self.raw), self.fallback_now)
+
+    def __set__(self, obj, value):
+        setattr(obj, self.raw, value)
+
+    def serialize(self, raw) -> Optional[str]:
+        """ISO-8601 string for a stored value, as datetime.isoformat() would give for it."""
+        if isinstance(raw, str):
+            try:
+                datetime.fromisoformat(raw)
+            except ValueError:
+                return datetime.now().isoformat() if self.fallback_now else None
+            # SQLite stores "YYYY-MM-DD HH:MM:SS..."; isoformat() separates with "T"
+            return raw[:10] + "T" + raw[11:] if raw[10:11] == " " else raw
+        return raw.isoformat() if raw is not None else None
+
+class Record:
+    """Base for slotted records: field-wise equality, repr and to_dict.
+
+    Subclasses declare their slots, list their public fields in `_fields`
+    and write an explicit __init__ (a generic one would cost more per row
+    than the record itself).
+    """
+
+    __slots__ = ()
+    _fields: Tuple[str, ...] = ()
+    _values: Callable[["Record"], tuple]
+    _stored: Callable[["Record"], tuple]
+    _timestamps: Tuple[Tuple[str, LazyTimestamp], ...] = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        timestamps = {name: getattr(cls, name) for name in cls._fields
+                      if isinstance(getattr(cls, name, None), LazyTimestamp)}
+        cls._timestamps = tuple(timestamps.items())
+        # One C-level call reads every field; _stored reads timestamps unparsed
+        cls._values = staticmethod(_getter(cls._fields))
+        cls._stored = staticmethod(_getter(
+            [timestamps[name].raw if name in timestamps else name for name in cls._fields]
+        ))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Fields as JSON-ready values (timestamps as ISO-8601 strings)."""
+        result = dict(zip(self._fields, self._stored(self)))
+        for name, timestamp in self._timestamps:
+            result[name] = timestamp.serialize(result[name])
+        return result
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._values(self) == other._values(other)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={value!r}" for name, value in zip(self._fields, self._values(self)))
+        return f"{self.__class__.__name__}({fields})"
+
+def _getter(names) -> Callable[[Any], tuple]:
+    """attrgetter that always returns a tuple (it returns a bare value for one name)."""
+    getter = attrgetter(*names)
+    return getter if len(names) > 1 else lambda obj: (getter(obj),)
@@ -0,0 +1,478 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import db
+
+# Rows of messages.db copied per sidecar transaction; keeps each read of the
+# bridge's database short so its writers are never blocked for long
+SYNC_BATCH_ROWS = 50000
+
+# Largest lag behind messages.db at which a materialization stays ready while
+# the background thread catches up; further behind, readers fall back to
+# plain queries until it has
+CATCH_UP_ROWS = 5000
+
+# Seconds between background sync passes
+SYNC_INTERVAL = float(os.getenv('SIDECAR_SYNC_INTERVAL', '5'))
+
+# Alias under which the sidecar is attached to pooled messages.db connections
+ATTACH_ALIAS = 'side'
+
+class Materialization:
+    """A table in the sidecar derived incrementally from messages.db rows.
+
+    `schema` creates the table(s), `sync` applies the rows whose rowid lies in
+    (lower, upper] of the attached `src.messages` table, and `clear` (one or
+    more statements separated by ";") empties them when the source database
+    is replaced. `batch_rows` caps the rowid range per transaction. Bumping
+    `version` when the stored layout changes rebuilds the table from scratch.
+    """
+
+    def __init__(self, name: str, schema: str, sync: Callable[[sqlite3.Connection, int, int], None], clear: str,
+                 batch_rows: int = SYNC_BATCH_ROWS, version: int = 1):
+        self.name = name
+        self.schema = schema
+        self.sync = sync
+        self.clear = clear
+        self.batch_rows = batch_rows
+        self.version = version
+
+def _sync_fts(conn: sqlite3.Connection, lower: int, upper: int):
+    conn.execute("""
+        INSERT OR REPLACE INTO messages_fts (rowid, content)
+        SELECT rowid, content FROM src.messages
+        WHERE rowid > ? AND rowid <= ? AND content IS NOT NULL AND content != ''
+    """, (lower, upper))
+
+MESSAGES_FTS = Materialization(
+    name='messages_fts',
+    # remove_diacritics 2 folds accents like normalize() does for contacts
+    schema="""
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            content,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    """,
+    sync=_sync_fts,
+    clear="DELETE FROM messages_fts"
+)
+
+def _sync_chat_summary(conn: sqlite3.Connection, lower: int, upper: int):
+    # The bridge re-stores messages with INSERT OR REPLACE (new rowid, old row
+    # gone), so the messages already counted are kept in chat_summary_messages:
+    # a new row whose (chat, id) is there replaces it and its old values are
+    # taken out of the totals. unanswered_count moves with the batch while my
+    # last message stays put; otherwise it is counted again from that message
+    conn.execute("""
+        INSERT INTO chat_summary (chat_jid, message_count, from_me_count, unanswered_count)
+        WITH batch AS MATERIALIZED (
+            SELECT new.chat_jid, new.timestamp, new.is_from_me, old.chat_jid IS NOT NULL AS restored,
+                   old.timestamp AS old_timestamp, old.is_from_me AS old_is_from_me
+            FROM src.messages AS new
+            LEFT JOIN chat_summary_messages AS old ON old.chat_jid = new.chat_jid AND old.id = new.id
+            WHERE new.rowid > :lower AND new.rowid <= :upper AND new.chat_jid IS NOT NULL AND new.id IS NOT NULL
+        )
+        SELECT batch.chat_jid,
+               COUNT(*) - COUNT(*) FILTER (WHERE restored),
+               COUNT(*) FILTER (WHERE is_from_me != 0) - COUNT(*) FILTER (WHERE restored AND old_is_from_me != 0),
+               COUNT(*) FILTER (WHERE NOT is_from_me AND timestamp > COALESCE(summary.last_from_me_time, ''))
+               - COUNT(*) FILTER (WHERE restored AND NOT old_is_from_me
+                                  AND old_timestamp > COALESCE(summary.last_from_me_time, ''))
+        FROM batch
+        LEFT JOIN chat_summary AS summary ON summary.chat_jid = batch.chat_jid
+        WHERE true
+        GROUP BY batch.chat_jid
+        ON CONFLICT (chat_jid) DO UPDATE SET
+            message_count = message_count + excluded.message_count,
+            from_me_count = from_me_count + excluded.from_me_count,
+            unanswered_count = unanswered_count + excluded.unanswered_count
+    """, {"lower": lower, "upper": upper})
+    conn.execute("""
+        INSERT OR REPLACE INTO chat_summary_messages (chat_jid, id, timestamp, is_from_me)
+        SELECT chat_jid, id, timestamp, is_from_me FROM src.messages
+        WHERE rowid > ? AND rowid <= ? AND chat_jid IS NOT NULL AND id IS NOT NULL
+    """, (lower, upper))
+    # The latest message and my latest one are the top of the chat's index
+    conn.execute("""
+        INSERT OR REPLACE INTO chat_summary (
+            chat_jid, last_message_id, last_timestamp, last_content, last_sender, last_is_from_me,
+            message_count, from_me_count, last_from_me_time, unanswered_count
+        )
+        WITH touched AS MATERIALIZED (
+            SELECT summary.*,
+                   (SELECT m.id FROM chat_summary_messages AS m WHERE m.chat_jid = summary.chat_jid
+                    ORDER BY m.timestamp DESC, m.id DESC LIMIT 1) AS latest_id,
+                   (SELECT m.timestamp FROM chat_summary_messages AS m WHERE m.chat_jid = summary.chat_jid
+                    AND m.is_from_me ORDER BY m.timestamp DESC, m.id DESC LIMIT 1) AS from_me_time
+            FROM chat_summary AS summary
+            WHERE summary.chat_jid IN (SELECT chat_jid FROM src.messages WHERE rowid > :lower AND rowid <= :upper)
+        )
+        SELECT touched.chat_jid, last.id, last.timestamp, last.content, last.sender, last.is_from_me,
+               touched.message_count, touched.from_me_count, touched.from_me_time,
+               CASE WHEN touched.from_me_time IS touched.last_from_me_time THEN touched.unanswered_count
+                    ELSE (SELECT COUNT(*) FROM chat_summary_messages AS m
+                          WHERE m.chat_jid = touched.chat_jid AND NOT m.is_from_me
+                          AND m.timestamp > COALESCE(touched.from_me_time, ''))
+               END
+        FROM touched
+        LEFT JOIN src.messages AS last ON last.id = touched.latest_id AND last.chat_jid = touched.chat_jid
+    """, {"lower": lower, "upper": upper})
+
+CHAT_SUMMARY = Materialization(
+    name='chat_summary',
+    # unanswered_count: messages from others since my last message in the chat
+    schema="""
+        CREATE TABLE IF NOT EXISTS chat_summary (
+            chat_jid TEXT PRIMARY KEY,
+            last_message_id TEXT,
+            last_timestamp TIMESTAMP,
+            last_content TEXT,
+            last_sender TEXT,
+            last_is_from_me BOOLEAN,
+            message_count INTEGER NOT NULL,
+            from_me_count INTEGER NOT NULL,
+            last_from_me_time TIMESTAMP,
+            unanswered_count INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS chat_summary_messages (
+            chat_jid TEXT NOT NULL,
+            id TEXT NOT NULL,
+            timestamp TIMESTAMP,
+            is_from_me BOOLEAN,
+            PRIMARY KEY (chat_jid, id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS chat_summary_messages_time
+            ON chat_summary_messages (chat_jid, timestamp, id, is_from_me);
+    """,
+    sync=_sync_chat_summary,
+    clear="DELETE FROM chat_summary; DELETE FROM chat_summary_messages",
+    version=2
+)
+
+def _sync_participation(conn: sqlite3.Connection, lower: int, upper: int):
+    # Like chat_summary, the messages counted are kept (participation_messages)
+    # so a re-stored one moves out of the pair it was counted in. First and
+    # last seen go by epoch milliseconds, as text only orders within one UTC
+    # offset, and are read from the ends of each touched pair's index
+    params = {"lower": lower, "upper": upper}
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS participation_touched (sender, chat_jid, PRIMARY KEY (sender, chat_jid))")
+    conn.execute("DELETE FROM participation_touched")
+    conn.execute("""
+        INSERT OR IGNORE INTO participation_touched (sender, chat_jid)
+        SELECT new.sender, new.chat_jid FROM src.messages AS new
+        WHERE new.rowid > :lower AND new.rowid <= :upper AND new.sender IS NOT NULL
+        AND new.chat_jid IS NOT NULL AND new.id IS NOT NULL
+        UNION
+        SELECT old.sender, old.chat_jid FROM src.messages AS new
+        JOIN participation_messages AS old ON old.chat_jid = new.chat_jid AND old.id = new.id
+        WHERE new.rowid > :lower AND new.rowid <= :upper AND old.sender IS NOT NULL
+    """, params)
+    conn.execute("""
+        INSERT INTO participation (sender, chat_jid, message_count)
+        WITH batch AS MATERIALIZED (
+            SELECT new.sender, new.chat_jid, old.chat_jid IS NOT NULL AS restored, old.sender AS old_sender
+            FROM src.messages AS new
+            LEFT JOIN participation_messages AS old ON old.chat_jid = new.chat_jid AND old.id = new.id
+            WHERE new.rowid > :lower AND new.rowid <= :upper AND new.chat_jid IS NOT NULL AND new.id IS NOT NULL
+        ),
+        changes AS (
+            SELECT sender, chat_jid, 1 AS delta FROM batch WHERE sender IS NOT NULL
+            UNION ALL
+            SELECT old_sender, chat_jid, -1 FROM batch WHERE restored AND old_sender IS NOT NULL
+        )
+        SELECT sender, chat_jid, SUM(delta) FROM changes
+        WHERE true
+        GROUP BY sender, chat_jid
+        ON CONFLICT (sender, chat_jid) DO UPDATE SET message_count = message_count + excluded.message_count
+    """, params)
+    conn.execute(f"""
+        INSERT OR REPLACE INTO participation_messages (chat_jid, id, sender, ts_ms, timestamp)
+        SELECT chat_jid, id, sender, {epoch_ms("timestamp")}, timestamp FROM src.messages
+        WHERE rowid > :lower AND rowid <= :upper AND chat_jid IS NOT NULL AND id IS NOT NULL
+    """, params)
+    conn.execute("""
+        DELETE FROM participation
+        WHERE message_count = 0 AND (sender, chat_jid) IN (SELECT sender, chat_jid FROM participation_touched)
+    """)
+    conn.execute("""
+        UPDATE participation SET
+            first_seen = (SELECT m.timestamp FROM participation_messages AS m
+                          WHERE m.sender = participation.sender AND m.chat_jid = participation.chat_jid
+                          AND m.ts_ms IS NOT NULL ORDER BY m.ts_ms, m.id LIMIT 1),
+            last_seen = (SELECT m.timestamp FROM participation_messages AS m
+                         WHERE m.sender = participation.sender AND m.chat_jid = participation.chat_jid
+                         AND m.ts_ms IS NOT NULL ORDER BY m.ts_ms DESC, m.id DESC LIMIT 1)
+        WHERE (sender, chat_jid) IN (SELECT sender, chat_jid FROM participation_touched)
+    """)
+
+PARTICIPATION = Materialization(
+    name='participation',
+    schema="""
+        CREATE TABLE IF NOT EXISTS participation (
+            sender TEXT NOT NULL,
+            chat_jid TEXT NOT NULL,
+            first_seen TIMESTAMP,
+            last_seen TIMESTAMP,
+            message_count INTEGER NOT NULL,
+            PRIMARY KEY (sender, chat_jid)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS participation_messages (
+            chat_jid TEXT NOT NULL,
+            id TEXT NOT NULL,
+            sender TEXT,
+            ts_ms INTEGER,
+            timestamp TIMESTAMP,
+            PRIMARY KEY (chat_jid, id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS participation_messages_sender
+            ON participation_messages (sender, chat_jid, ts_ms, id);
+    """,
+    sync=_sync_participation,
+    clear="DELETE FROM participation; DELETE FROM participation_messages",
+    version=2
+)
+
+def epoch_ms(expression: str) -> str:
+    """SQL for the stored timestamp `expression` as integer epoch milliseconds (NULL if unparseable).
+
+    julianday() understands the "+HH:MM" offsets and any fractional digits
+    the bridge writes, so values from different offsets compare correctly.
+    """
+    return f"CAST(ROUND((julianday({expression}) - 2440587.5) * 86400000) AS INTEGER)"
+
+def _sync_message_ts(conn: sqlite3.Connection, lower: int, upper: int):
+    # A message re-stored with INSERT OR REPLACE gets a new rowid; drop the
+    # entry of the row it replaced (same chat and time, rowid gone from src)
+    conn.execute(f"""
+        DELETE FROM message_ts WHERE rowid IN (
+            SELECT stale.rowid
+            FROM src.messages AS new
+            JOIN message_ts AS stale ON stale.chat_jid = new.chat_jid AND stale.ts_ms = {epoch_ms("new.timestamp")}
+            WHERE new.rowid > :lower AND new.rowid <= :upper
+            AND NOT EXISTS (SELECT 1 FROM src.messages WHERE rowid = stale.rowid)
+        )
+    """, {"lower": lower, "upper": upper})
+    conn.execute(f"""
+        INSERT OR REPLACE INTO message_ts (rowid, chat_jid, ts_ms)
+        SELECT rowid, chat_jid, {epoch_ms("timestamp")} FROM src.messages
+        WHERE rowid > ? AND rowid <= ?
+    """, (lower, upper))
+
+MESSAGE_TS = Materialization(
+    name='message_ts',
+    # rowid is the messages.db rowid; (ts_ms, rowid) is the time order of
+    # messages, which both indexes deliver without a sort
+    schema="""
+        CREATE TABLE IF NOT EXISTS message_ts (
+            rowid INTEGER PRIMARY KEY,
+            chat_jid TEXT NOT NULL,
+            ts_ms INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS message_ts_chat ON message_ts (chat_jid, ts_ms);
+        CREATE INDEX IF NOT EXISTS message_ts_time ON message_ts (ts_ms);
+    """,
+    sync=_sync_message_ts,
+    clear="DELETE FROM message_ts"
+)
+
+class Sidecar:
+    """Sidecar database with indexes derived from the bridge's messages.db.
+
+    The bridge owns messages.db, so everything the server derives from it
+    lives in a separate file. Each materialization keeps a rowid watermark
+    (persisted in sync_state) and only copies rows added since the last
+    pass. All syncing happens on a background thread, never on a read, so
+    readers see each table as of the last pass and fall back to plain queries
+    until a materialization has caught up (`is_ready`).
+    """
+
+    def __init__(self, messages_db_path: str, path: str, materializations: List[Materialization]):
+        self.messages_db_path = messages_db_path
+        self.path = path
+        self.materializations = materializations
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._watermarks: Dict[str, int] = {}
+        self._ready = set()
+        self._thread: Optional[threading.Thread] = None
+        self._disabled = False
+
+    def is_ready(self, name: str) -> bool:
+        """True if a materialization was at most CATCH_UP_ROWS behind messages.db at the last pass.
+
+        Readiness comes from the watermarks stored in sync_state, so after a
+        restart a table that was filled before is ready again as soon as the
+        first pass has caught up on the rows added meanwhile.
+        """
+        return name in self._ready
+
+    def attach(self, conn: sqlite3.Connection) -> bool:
+        """Attach the sidecar read-only to a pooled messages.db connection."""
+        return db.attach_readonly(conn, ATTACH_ALIAS, self.path)
+
+    def watermark_sql(self, name: str) -> str:
+        """SQL for the last messages.db rowid in `name`, as committed in the attached sidecar.
+
+        Reading it in the same statement as the table keeps both from the
+        same sidecar commit, which the in-memory watermarks would not.
+        """
+        return f"COALESCE((SELECT watermark FROM {ATTACH_ALIAS}.sync_state WHERE name = '{name}'), 0)"
+
+    def covers(self, conn: sqlite3.Connection, name: str) -> bool:
+        """True if `name` in the sidecar attached to `conn` has every messages.db row `conn` sees."""
+        return conn.execute(
+            f"SELECT {self.watermark_sql(name)} >= (SELECT COALESCE(MAX(rowid), 0) FROM messages)"
+        ).fetchone()[0] == 1
+
+    def ensure_fresh(self):
+        """Make sure the background thread is keeping the sidecar in sync before a read.
+
+        Reads never sync themselves: a pass holds a read transaction on the
+        bridge's messages.db, which is not in WAL mode and would block its
+        writers for the length of the request.
+        """
+        self.start_background_sync()
+
+    def start_background_sync(self, interval: float = SYNC_INTERVAL, wait_for: Optional[threading.Event] = None):
+        """Start the daemon thread that keeps the sidecar in sync.
+
+        Args:
+            interval (float, optional): Seconds between sync passes
+            wait_for (threading.Event, optional): Event to wait for before the
+                first pass (e.g. messages.db indexes being created)
+        """
+        if self._thread is not None or self._disabled:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, args=(interval, wait_for), name='sidecar-sync', daemon=True)
+            self._thread.start()
+
+    def sync(self, blocking: bool = True) -> bool:
+        """Copy new messages.db rows into every materialization.
+
+        A materialization more than CATCH_UP_ROWS behind stops being ready
+        until the pass has caught it up.
+
+        Args:
+            blocking (bool, optional): Wait for a pass already running
+
+        Returns:
+            bool: False if the pass was skipped (busy, disabled or no source DB)
+        """
+        if self._disabled or not self._lock.acquire(blocking):
+            return False
+        try:
+            conn = self._connection()
+            if conn is None:
+                return False
+
+            head = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM src.messages").fetchone()[0]
+            for materialization in self.materializations:
+                name = materialization.name
+                watermark = self._watermarks.get(name, 0)
+                version_key = f"{name}:version"
+                if head < watermark or self._watermarks.get(version_key, 1) != materialization.version:
+                    # messages.db was recreated (rowids no longer line up) or
+                    # the table is stored differently now: start over
+                    with conn:
+                        for statement in materialization.clear.split(";"):
+                            conn.execute(statement)
+                        self._set_watermark(conn, name, 0)
+                        self._set_watermark(conn, version_key, materialization.version)
+                    self._ready.discard(name)
+                    watermark = 0
+                if head - watermark > CATCH_UP_ROWS:
+                    self._ready.discard(name)
+
+                while watermark < head:
+                    upper = min(head, watermark + materialization.batch_rows)
+                    with conn:
+                        materialization.sync(conn, watermark, upper)
+                        self._set_watermark(conn, name, upper)
+                    watermark = upper
+                self._ready.add(name)
+            return True
+        except sqlite3.Error as e:
+            print(f"Error syncing sidecar database: {e}")
+            return False
+        finally:
+            self._lock.release()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _run(self, interval: float, wait_for: Optional[threading.Event]):
+        if wait_for is not None:
+            wait_for.wait()
+        while not self._disabled:
+            self.sync()
+            time.sleep(interval)
+
+    def _set_watermark(self, conn: sqlite3.Connection, name: str, watermark: int):
+        conn.execute(
+            "INSERT OR REPLACE INTO sync_state (name, watermark) VALUES (?, ?)",
+            (name, watermark)
+        )
+        self._watermarks[name] = watermark
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """Writer connection with messages.db attached read-only as `src`."""
+        if self._conn is not None:
+            return self._conn
+        if not os.path.exists(self.messages_db_path):
+            return None
+
+        try:
+            conn = sqlite3.connect(Path(self.path).resolve().as_uri(), uri=True, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("ATTACH DATABASE ? AS src", (db.readonly_uri(self.messages_db_path),))
+            with conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS sync_state (
+                        name TEXT PRIMARY KEY,
+                        watermark INTEGER NOT NULL
+                    )
+                """)
+                for materialization in self.materializations:
+                    conn.executescript(materialization.schema)
+        except sqlite3.Error as e:
+            # e.g. SQLite built without FTS5: keep serving with plain queries
+            print(f"Sidecar database disabled: {e}")
+            self._disabled = True
+            return None
+
+        self._watermarks = dict(conn.execute("SELECT name, watermark FROM sync_state").fetchall())
+        self._conn = conn
+        return conn
+
+def fts_query(text: str) -> Optional[str]:
+    """
+    Translate a free-text search into an FTS5 MATCH expression.
+
+    Text outside double quotes is matched as one phrase whose last word is a
+    prefix, which mirrors the contiguous `LIKE '%text%'` it replaces. Quoted
+    segments become exact phrases and all parts must match.
+
+    Returns:
+        Optional[str]: The MATCH expression, or None if nothing is searchable
+    """
+    parts = text.split('"')
+    terms = []
+    for i, part in enumerate(parts):
+        words = part.split()
+        if not words:
+            continue
+        phrase = '"' + " ".join(words) + '"'
+        # Odd segments were inside quotes (an unbalanced quote opens a phrase)
+        terms.append(phrase if i % 2 else phrase + "*")
+    return " AND ".join(terms) if terms else None
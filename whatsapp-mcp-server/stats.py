@@ -0,0 +1,417 @@
+"""In-process latency statistics for the MCP server.
+
+Records fixed-bucket histograms of MCP tool calls, bridge HTTP requests,
+ffmpeg runs and (optionally) every SQL statement run on a read-only
+connection. They are served by the server_stats tool and can be written
+periodically to a Prometheus text-format file (for node_exporter's
+textfile collector).
+
+When MCP_STATS is off, timed() returns tools unwrapped, timer() returns a
+shared no-op context manager and read-only connections are plain
+sqlite3.Connection objects, so instrumentation costs a flag check.
+"""
+import atexit
+import bisect
+import functools
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Tool, bridge and audio timings (a few microseconds per call)
+ENABLED = os.getenv('MCP_STATS', '1').lower() not in ('0', 'false', 'no', 'off')
+
+# Per-statement SQL timings; wraps every cursor, so it is off by default
+SQL_ENABLED = ENABLED and os.getenv('MCP_STATS_SQL', '0').lower() in ('1', 'true', 'yes', 'on')
+
+# Prometheus text file rewritten every MCP_STATS_FILE_INTERVAL seconds and at exit
+STATS_FILE = os.getenv('MCP_STATS_FILE')
+STATS_FILE_INTERVAL = float(os.getenv('MCP_STATS_FILE_INTERVAL', '15'))
+
+# Upper bounds of the histogram buckets, in seconds (a last +Inf bucket is implied)
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+           0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# Distinct SQL statements tracked; later ones are counted under OTHER_STATEMENT
+MAX_SQL_STATEMENTS = 500
+OTHER_STATEMENT = "(other)"
+
+_started = time.time()
+_NULL_TIMER = nullcontext()
+
+class Histogram:
+    """Count, sum, min, max and per-bucket counts of observed durations (seconds)."""
+
+    __slots__ = ("counts", "count", "sum", "min", "max", "extra")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        # Metric-specific totals, e.g. SQL fetch time and rows
+        self.extra: Dict[str, float] = {}
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other: "Histogram"):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        for key, value in other.extra.items():
+            self.extra[key] = self.extra.get(key, 0) + value
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating inside its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                # Observed extremes narrow the first and last buckets
+                lower = max(BUCKETS[i - 1] if i else 0.0, self.min)
+                upper = min(BUCKETS[i] if i < len(BUCKETS) else self.max, self.max)
+                return lower + (upper - lower) * max(0.0, rank - seen) / count
+            seen += count
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        """Milliseconds, rounded for tool output."""
+        ms = lambda seconds: round(seconds * 1000, 3)
+        return {
+            "calls": self.count,
+            "total_ms": ms(self.sum),
+            "mean_ms": ms(self.sum / self.count) if self.count else 0.0,
+            "p50_ms": ms(self.quantile(0.5)),
+            "p90_ms": ms(self.quantile(0.9)),
+            "p99_ms": ms(self.quantile(0.99)),
+            "max_ms": ms(self.max),
+        }
+
+class Metric:
+    """A histogram per combination of label values."""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._histograms: Dict[Tuple[str, ...], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, *values: str, **extra: float):
+        with self._lock:
+            histogram = self._histograms.get(values)
+            if histogram is None:
+                histogram = self._histograms[values] = Histogram()
+            histogram.observe(seconds)
+            for key, value in extra.items():
+                histogram.extra[key] = histogram.extra.get(key, 0) + value
+
+    def add(self, values: Tuple[str, ...], **extra: float):
+        """Add to a series' extra totals without observing a duration."""
+        with self._lock:
+            histogram = self._histograms.get(values)
+            if histogram is None:
+                histogram = self._histograms[values] = Histogram()
+            for key, value in extra.items():
+                histogram.extra[key] = histogram.extra.get(key, 0) + value
+
+    def __contains__(self, values: Tuple[str, ...]) -> bool:
+        return values in self._histograms
+
+    def __len__(self) -> int:
+        return len(self._histograms)
+
+    def series(self) -> List[Tuple[Tuple[str, ...], Histogram]]:
+        """A consistent copy of every (label values, histogram) pair."""
+        with self._lock:
+            copies = []
+            for values, histogram in self._histograms.items():
+                copy = Histogram()
+                copy.merge(histogram)
+                copies.append((values, copy))
+            return copies
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+TOOLS = Metric("mcp_tool_duration_seconds", "MCP tool call latency.", ("tool", "status"))
+BRIDGE = Metric("mcp_bridge_request_duration_seconds", "WhatsApp bridge HTTP request latency.",
+                ("endpoint", "status"))
+AUDIO = Metric("mcp_audio_duration_seconds", "ffmpeg/ffprobe run time.", ("operation", "status"))
+SQL = Metric("mcp_sql_duration_seconds", "SQL statement execute time on read-only connections.",
+             ("statement",))
+METRICS = (TOOLS, BRIDGE, AUDIO, SQL)
+
+class _Timer:
+    __slots__ = ("metric", "values", "start")
+
+    def __init__(self, metric: Metric, values: Tuple[str, ...]):
+        self.metric = metric
+        self.values = values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metric.observe(time.perf_counter() - self.start, *self.values, "error" if exc_type else "ok")
+        return False
+
+def timer(metric: Metric, *values: str):
+    """
+    Context manager timing a block into `metric`, with an "ok"/"error" status label.
+
+    Example:
+        with stats.timer(stats.AUDIO, "encode"):
+            run_ffmpeg(...)
+    """
+    return _Timer(metric, values) if ENABLED else _NULL_TIMER
+
+def timed(func: Callable) -> Callable:
+    """
+    Wrap an async MCP tool to record its latency under its name.
+
+    Calls that raise are labelled "error"; calls returning a dict with
+    "success": False are labelled "failed". Returns `func` itself when stats
+    are disabled.
+    """
+    if not ENABLED:
+        return func
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        status = "error"
+        try:
+            result = await func(*args, **kwargs)
+            status = "failed" if isinstance(result, dict) and result.get("success") is False else "ok"
+            return result
+        finally:
+            TOOLS.observe(time.perf_counter() - start, name, status)
+    return wrapper
+
+# Statements differ only in how many placeholders they were built with
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_TUPLE_LIST = re.compile(r"(\([^()]*\))(?:\s*,\s*\([^()]*\))+")
+_statement_labels: Dict[str, str] = {}
+
+def statement_label(sql: str) -> str:
+    """SQL text with collapsed whitespace and placeholder lists, used as the statement label."""
+    label = _statement_labels.get(sql)
+    if label is None:
+        label = _WHITESPACE.sub(" ", sql).strip()
+        label = _PLACEHOLDER_LIST.sub("?, ...", label)
+        label = _TUPLE_LIST.sub(r"\1, ...", label)
+        if len(_statement_labels) >= 4 * MAX_SQL_STATEMENTS:
+            _statement_labels.clear()
+        _statement_labels[sql] = label
+    return label
+
+def _sql_values(sql: str) -> Tuple[str]:
+    label = statement_label(sql)
+    if (label,) not in SQL and len(SQL) >= MAX_SQL_STATEMENTS:
+        label = OTHER_STATEMENT
+    return (label,)
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor recording execute() time per statement, plus time and rows of fetch*() calls.
+
+    Rows read by iterating the cursor are not timed (timing each row would
+    cost more than reading it); for most queries SQLite does its work in
+    the first step, which execute() includes.
+    """
+
+    _values: Optional[Tuple[str]] = None
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._values = _sql_values(sql)
+            SQL.observe(time.perf_counter() - start, *self._values)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._values = _sql_values(sql)
+            SQL.observe(time.perf_counter() - start, *self._values)
+
+    def _fetched(self, start: float, rows: int):
+        if self._values is not None:
+            SQL.add(self._values, fetch_seconds=time.perf_counter() - start, rows=rows)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows))
+        return rows
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors are TimedCursors."""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection's shortcuts create plain cursors internally
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def connection_factory():
+    """Factory to pass to sqlite3.connect: TimedConnection with SQL stats on, else the default."""
+    return TimedConnection if SQL_ENABLED else sqlite3.Connection
+
+def _summaries(metric: Metric) -> Dict[str, Dict[str, Any]]:
+    """Summary per first label value, merging statuses and counting each one."""
+    merged: Dict[str, Histogram] = {}
+    statuses: Dict[str, Dict[str, int]] = {}
+    for values, histogram in metric.series():
+        merged.setdefault(values[0], Histogram()).merge(histogram)
+        statuses.setdefault(values[0], {})[values[-1]] = histogram.count
+    return {key: {**histogram.summary(), "status": statuses[key]}
+            for key, histogram in sorted(merged.items())}
+
+def snapshot(top_statements: int = 10) -> Dict[str, Any]:
+    """
+    Current statistics, as returned by the server_stats tool.
+
+    Args:
+        top_statements (int, optional): SQL statements to include, by total time
+
+    Returns:
+        Dict[str, Any]: Latency summaries (milliseconds) per tool, bridge
+            endpoint and audio operation, and the slowest SQL statements
+    """
+    statements = []
+    for (label,), histogram in SQL.series():
+        if not histogram.count:
+            continue
+        fetch = histogram.extra.get("fetch_seconds", 0.0)
+        statements.append({
+            "statement": label,
+            **histogram.summary(),
+            "fetch_ms": round(fetch * 1000, 3),
+            "rows": int(histogram.extra.get("rows", 0)),
+            "_total": histogram.sum + fetch,
+        })
+    statements.sort(key=lambda statement: statement["_total"], reverse=True)
+    for statement in statements:
+        del statement["_total"]
+    return {
+        "enabled": ENABLED,
+        "sql_enabled": SQL_ENABLED,
+        "uptime_s": round(time.time() - _started, 1),
+        "tools": _summaries(TOOLS),
+        "bridge": _summaries(BRIDGE),
+        "audio": _summaries(AUDIO),
+        "sql_statements": len(statements),
+        "sql": statements[:max(0, top_statements)],
+    }
+
+def reset():
+    """Forget every recorded observation."""
+    for metric in METRICS:
+        metric.reset()
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_bound(bound: float) -> str:
+    return repr(float(bound))
+
+def prometheus_text() -> str:
+    """Every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        series = metric.series()
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} histogram")
+        for values, histogram in series:
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(metric.labels, values))
+            prefix = labels + "," if labels else ""
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f'{metric.name}_bucket{{{prefix}le="{_format_bound(bound)}"}} {cumulative}')
+            lines.append(f'{metric.name}_bucket{{{prefix}le="+Inf"}} {histogram.count}')
+            lines.append(f"{metric.name}_sum{{{labels}}} {histogram.sum!r}")
+            lines.append(f"{metric.name}_count{{{labels}}} {histogram.count}")
+        if metric is SQL:
+            for extra, name, help in (("fetch_seconds", "mcp_sql_fetch_seconds_total", "Time spent in fetch calls."),
+                                      ("rows", "mcp_sql_rows_total", "Rows returned by fetch calls.")):
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} counter")
+                for values, histogram in series:
+                    labels = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(metric.labels, values))
+                    lines.append(f"{name}{{{labels}}} {histogram.extra.get(extra, 0)!r}")
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path: str) -> bool:
+    """
+    Atomically write prometheus_text() to `path`.
+
+    Returns:
+        bool: True if the file was written
+    """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(prometheus_text())
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Error writing stats to {path}: {e}")
+        return False
+    return True
+
+_dump_thread: Optional[threading.Thread] = None
+
+def start_file_dump(path: Optional[str] = STATS_FILE, interval: float = STATS_FILE_INTERVAL):
+    """Rewrite the Prometheus file every `interval` seconds and at exit, if a path is configured."""
+    global _dump_thread
+    if not ENABLED or not path or _dump_thread is not None:
+        return
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            write_prometheus(path)
+
+    _dump_thread = threading.Thread(target=loop, name="mcp-stats-dump", daemon=True)
+    _dump_thread.start()
+    atexit.register(write_prometheus, path)
@@ -0,0 +1,48 @@
+"""Shared fixtures: a small synthetic store that whatsapp_contacts reads.
+
+The store is written with benchmarks/fixtures.py before any test module
+imports whatsapp_contacts, which reads its paths from the environment at
+import time.
+"""
+import os
+import shutil
+import tempfile
+
+import pytest
+
+import fixtures
+
+STORE_MESSAGES = 5000
+STORE_CONTACTS = 600
+STORE_GROUPS = 20
+
+STORE_DIR = tempfile.mkdtemp(prefix="whatsapp-mcp-test-")
+os.environ["WHATSAPP_STORE_DIR"] = STORE_DIR
+os.environ["MESSAGES_DB_NAME"] = "messages.db"
+os.environ["SIDECAR_DB_PATH"] = os.path.join(STORE_DIR, "mcp_sidecar.db")
+fixtures.build_store(STORE_DIR, STORE_MESSAGES, STORE_CONTACTS, STORE_GROUPS, days=60)
+
+@pytest.fixture(scope="session", autouse=True)
+def _remove_store():
+    yield
+    shutil.rmtree(STORE_DIR, ignore_errors=True)
+
+@pytest.fixture(scope="session")
+def store_dir() -> str:
+    return STORE_DIR
+
+@pytest.fixture(scope="session")
+def wc():
+    """whatsapp_contacts bound to the test store, with indexes and the sidecar built."""
+    import migrations
+    import whatsapp_contacts
+
+    migrations.ensure_indexes(whatsapp_contacts.MESSAGES_DB_PATH)
+    whatsapp_contacts._sidecar.sync()
+    return whatsapp_contacts
+
+@pytest.fixture
+def text_order(wc, monkeypatch):
+    """Make the sidecar look not ready, so messages are read in text timestamp order."""
+    monkeypatch.setattr(wc._sidecar, "is_ready", lambda name: False)
+    return wc
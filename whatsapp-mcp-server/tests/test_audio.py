@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+import audio
+
+@pytest.fixture
+def clips(tmp_path):
+    paths = []
+    for name in ("a.mp3", "b.wav"):
+        path = tmp_path / name
+        path.write_bytes(b"")
+        paths.append(str(path))
+    return paths
+
+def test_inputs_are_converted_next_to_themselves(clips):
+    _, jobs = audio._plan(clips)
+    assert jobs == [(clip, os.path.splitext(clip)[0] + ".ogg") for clip in clips]
+
+def test_directories_expand_into_the_output_dir(clips, tmp_path):
+    _, jobs = audio._plan([str(tmp_path), "-o", str(tmp_path / "out")])
+    assert jobs == [(clip, str(tmp_path / "out" / (os.path.splitext(os.path.basename(clip))[0] + ".ogg")))
+                    for clip in clips]
+
+def test_output_names_the_single_output_file(clips, tmp_path):
+    _, jobs = audio._plan([clips[0], "--output", str(tmp_path / "note.ogg")])
+    assert jobs == [(clips[0], str(tmp_path / "note.ogg"))]
+
+def test_old_input_output_form_still_works(clips, tmp_path):
+    with pytest.warns(DeprecationWarning, match="--output"):
+        _, jobs = audio._plan([clips[0], str(tmp_path / "note.ogg")])
+    assert jobs == [(clips[0], str(tmp_path / "note.ogg"))]
+
+def test_two_existing_files_are_two_inputs(clips, recwarn):
+    _, jobs = audio._plan(clips)
+    assert len(jobs) == 2
+    assert not recwarn.list
+
+@pytest.mark.parametrize("argv", [["--output", "x.ogg"], ["-o", "out", "--output", "x.ogg"]])
+def test_output_needs_one_input_file(clips, argv):
+    with pytest.raises(SystemExit):
+        audio._plan(clips + argv)
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path, monkeypatch):
+    """An ffmpeg on PATH that writes "encoded" to stdout, or fails halfway when FAKE_FFMPEG_FAIL is set."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    script = bin_dir / "ffmpeg"
+    script.write_text('#!/bin/sh\nprintf encoded\nif [ -n "$FAKE_FFMPEG_FAIL" ]; then exit 1; fi\n')
+    script.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return monkeypatch
+
+@pytest.fixture
+def voice(tmp_path):
+    path = tmp_path / "voice.ogg"
+    path.write_bytes(b"vorbis")
+    return path
+
+def test_ogg_input_is_not_overwritten_by_default(fake_ffmpeg, voice):
+    output = audio.convert_to_opus_ogg(str(voice))
+    assert output == str(voice.with_name("voice.opus.ogg"))
+    assert voice.read_bytes() == b"vorbis"
+    assert open(output, "rb").read() == b"encoded"
+
+    pool = audio.ConversionPool(1)
+    assert pool.submit(str(voice)).result() == output
+    pool.shutdown()
+    assert voice.read_bytes() == b"vorbis"
+
+def test_output_cannot_be_the_input(fake_ffmpeg, voice):
+    with pytest.raises(ValueError, match="differ"):
+        audio.convert_to_opus_ogg(str(voice), str(voice))
+    with pytest.raises(ValueError, match="differ"):
+        audio.remux_to_ogg(str(voice), str(voice))
+    assert voice.read_bytes() == b"vorbis"
+
+def test_failed_conversion_leaves_no_partial_output(fake_ffmpeg, voice, tmp_path):
+    output = tmp_path / "out" / "note.ogg"
+    fake_ffmpeg.setenv("FAKE_FFMPEG_FAIL", "1")
+    with pytest.raises(RuntimeError):
+        audio.convert_to_opus_ogg(str(voice), str(output))
+    assert os.listdir(output.parent) == []
+
+    output.write_bytes(b"earlier")
+    with pytest.raises(RuntimeError):
+        audio.convert_to_opus_ogg(str(voice), str(output))
+    assert output.read_bytes() == b"earlier"
+    assert os.listdir(output.parent) == ["note.ogg"]
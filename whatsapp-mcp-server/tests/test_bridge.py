@@ -0,0 +1,50 @@
+from bridge import CircuitBreaker
+
+def test_breaker_opens_after_threshold_failures():
+    breaker = CircuitBreaker(threshold=3, reset_timeout=60)
+    for _ in range(2):
+        assert breaker.acquire()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    assert breaker.acquire()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.acquire()
+    assert 0 < breaker.retry_after() <= 60
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker(threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_half_open_admits_a_single_probe():
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    assert breaker.acquire()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.acquire()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.acquire() and breaker.acquire()
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker(threshold=5, reset_timeout=0)
+    for _ in range(5):
+        breaker.record_failure()
+    assert breaker.acquire()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+def test_released_probe_lets_the_next_call_probe():
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.acquire()
+    breaker.release()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.acquire()
@@ -0,0 +1,68 @@
+import os
+import time
+
+from cache import DiskCache, TTLCache
+
+def _produce(size):
+    def write(path):
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+    return write
+
+def _age(cache, key, seconds):
+    path = cache.path(key)
+    when = time.time() - seconds
+    os.utime(path, (when, when))
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=250)
+    for age, key in ((30, "a"), (20, "b")):
+        cache.get_or_create(key, _produce(100))
+        _age(cache, key, age)
+
+    # A hit makes "a" the most recently used entry
+    assert cache.lookup("a") == cache.path("a")
+    cache.get_or_create("c", _produce(100))
+
+    assert cache.lookup("b") is None
+    assert cache.lookup("a") and cache.lookup("c")
+
+def test_disk_cache_keeps_the_new_entry_even_if_too_large(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=50)
+    cache.get_or_create("a", _produce(10))
+    path = cache.get_or_create("big", _produce(100))
+    assert os.path.exists(path)
+    assert cache.lookup("a") is None
+
+def test_disk_cache_produces_once_per_key(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1000)
+    calls = []
+
+    def produce(path):
+        calls.append(path)
+        _produce(10)(path)
+
+    assert cache.get_or_create("a", produce) == cache.get_or_create("a", produce)
+    assert len(calls) == 1
+
+def test_disk_cache_removes_stale_temporary_files(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1000)
+    stale, fresh = tmp_path / ".tmp-stale", tmp_path / ".tmp-fresh"
+    stale.write_bytes(b"x")
+    fresh.write_bytes(b"x")
+    when = time.time() - 7200
+    os.utime(stale, (when, when))
+    cache.evict()
+    assert not stale.exists() and fresh.exists()
+
+def test_ttl_cache_bounds_and_expiry():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", None)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get_many(["a", "b", "c"]) == ({"a": 1, "c": 3}, ["b"])
+
+    expired = TTLCache(maxsize=2, ttl=-1)
+    expired.put("a", 1)
+    assert expired.get("a", "missing") == "missing"
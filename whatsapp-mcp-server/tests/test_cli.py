@@ -0,0 +1,35 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import db
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _run(tmp_path, *args):
+    # The configured store is elsewhere: --db alone must select the test store
+    env = dict(os.environ, WHATSAPP_STORE_DIR=str(tmp_path / "configured"),
+               SIDECAR_DB_PATH=str(tmp_path / "configured" / "mcp_sidecar.db"))
+    return subprocess.run([sys.executable, *args], cwd=SERVER_DIR, env=env, capture_output=True, text=True,
+                          timeout=120, check=True).stdout
+
+def test_explain_reads_only_the_given_store(wc, store_dir, tmp_path):
+    output = _run(tmp_path, "migrations.py", "--db", os.path.join(store_dir, "messages.db"), "--explain")
+    assert "SELECT" in output and "SEARCH messages" in output
+    assert not (tmp_path / "configured").exists()
+
+def test_export_reads_only_the_given_store(wc, store_dir, tmp_path):
+    output_path = tmp_path / "out.jsonl"
+    _run(tmp_path, "export.py", str(output_path), "--db", os.path.join(store_dir, "messages.db"))
+    count = wc.db.get_connection(wc.MESSAGES_DB_PATH).execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    rows = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert len(rows) == count
+    assert any(row["sender_name"] != "Me" and not row["sender_name"].startswith("Contact (") for row in rows)
+    assert not (tmp_path / "configured").exists()
+
+def test_use_store_after_import_is_refused(wc):
+    with pytest.raises(RuntimeError):
+        db.use_store("/elsewhere/messages.db")
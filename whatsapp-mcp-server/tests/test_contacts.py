@@ -0,0 +1,98 @@
+import sqlite3
+
+import pytest
+
+from contact_index import ContactIndex, legacy_partial_ratio
+
+fuzzywuzzy_fuzz = pytest.importorskip("fuzzywuzzy.fuzz")
+fuzzywuzzy_process = pytest.importorskip("fuzzywuzzy.process")
+
+QUERIES = ["jose", "maria perez", "nunez", "núñez", "begona ibanez", "jsus", "xyzzy", "ana", "perez",
+           "gomez", "lucia", "martin", "martinez", "jo", "sofia lopez", "ruiz", "pena", "nuria",
+           "joaqin", "carmen rrochi", "inés bamagué", "pedro gomez", "lucia castano", "oscar",
+           "angel alvarez", "elena diaz", "familia", "trabajo", "futbol", "jesus sanchez",
+           "hernandez", "ibanez"]
+
+def reference_search(wc, query, limit, include_groups):
+    """search_contacts as it was before the contact index, scored by fuzzywuzzy.
+
+    Fuzzy hits are mapped back by position instead of by name, so homonyms
+    are kept (the only intended difference).
+    """
+    normalized_query = wc.normalize(query.strip())
+    exact, candidates = [], []
+    for entry in wc._contact_index.entries(include_groups):
+        name = entry.normalized
+        if normalized_query == name:
+            exact.append((entry, 100))
+        elif normalized_query in name:
+            pos = name.find(normalized_query)
+            if pos == 0:
+                score = 95 - (len(name) - len(normalized_query)) * 2
+            else:
+                score = 85 - pos * 2 - (len(name) - len(normalized_query))
+            exact.append((entry, max(score, 60)))
+        else:
+            candidates.append(entry)
+
+    fuzzy = []
+    if candidates and len(normalized_query) >= 2:
+        choices = {position: entry.normalized for position, entry in enumerate(candidates)}
+        for _, score, position in fuzzywuzzy_process.extract(normalized_query, choices,
+                                                             scorer=fuzzywuzzy_fuzz.partial_ratio, limit=limit * 2):
+            if score >= 70:
+                fuzzy.append((candidates[position], score))
+
+    matches = sorted(exact + fuzzy, key=lambda match: match[1], reverse=True)
+    return [(entry.jid, entry.name) for entry, _ in matches[:limit]]
+
+@pytest.mark.parametrize("include_groups", [False, True])
+@pytest.mark.parametrize("limit", [5, 25])
+def test_search_contacts_matches_fuzzywuzzy_ranking(wc, limit, include_groups):
+    for query in QUERIES:
+        found = [(contact.jid, contact.name) for contact in wc.search_contacts(query, limit, include_groups)]
+        assert found == reference_search(wc, query, limit, include_groups), query
+
+def test_legacy_partial_ratio_equals_fuzzywuzzy(wc):
+    names = [entry.processed for entry in wc._contact_index.entries(True)]
+    for query in QUERIES:
+        processed = wc.default_process(wc.normalize(query))
+        for name in names:
+            assert legacy_partial_ratio(processed, name) == fuzzywuzzy_fuzz.partial_ratio(processed, name), (query, name)
+
+def _write_contacts(path, names):
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS whatsmeow_contacts (their_jid TEXT PRIMARY KEY, full_name TEXT, "
+                     "first_name TEXT, push_name TEXT)")
+        conn.execute("DELETE FROM whatsmeow_contacts")
+        conn.executemany("INSERT INTO whatsmeow_contacts (their_jid, full_name) VALUES (?, ?)",
+                         ((f"{number}@s.whatsapp.net", name) for number, name in enumerate(names)))
+    conn.close()
+
+def test_a_query_keeps_its_snapshot_across_a_refresh(wc, tmp_path):
+    path = str(tmp_path / "whatsapp.db")
+    _write_contacts(path, ["Ana Gomez", "Jose Perez", "Josefina Ruiz"])
+    index = ContactIndex(path, str(tmp_path / "missing.db"), wc.normalize)
+    snapshot = index.snapshot()
+
+    # Fewer contacts, in another order: positions from the old generation would be out of range or wrong
+    _write_contacts(path, ["Josefa Diaz"])
+    assert index.refresh(force=True)
+    assert [entry.name for _, entry in snapshot.substring_matches("jose")] == ["Jose Perez", "Josefina Ruiz"]
+    assert [entry.name for entry, _ in snapshot.partial_ratio_matches("jsoe perez", score_cutoff=70)] == ["Jose Perez"]
+    assert [entry.name for _, entry in index.snapshot().substring_matches("jose")] == ["Josefa Diaz"]
+    index.close()
+
+def test_fuzzy_budget_scores_names_sharing_the_rarest_trigrams(wc, tmp_path):
+    path = str(tmp_path / "whatsapp.db")
+    _write_contacts(path, [f"Ana Gomez {number}" for number in range(20)] + ["Jose Perez", "Josue Peres"])
+    index = ContactIndex(path, str(tmp_path / "missing.db"), wc.normalize)
+    snapshot = index.snapshot()
+
+    exact = snapshot.partial_ratio_matches("jsoe perez", score_cutoff=70, budget=0)
+    assert [entry.name for entry, _ in exact] == ["Jose Perez", "Josue Peres"]
+    candidates, _ = snapshot.fuzzy_candidates("jsoe perez", budget=5)
+    assert len(candidates) <= 5
+    assert snapshot.partial_ratio_matches("jsoe perez", score_cutoff=70, budget=5) == exact
+    index.close()
@@ -0,0 +1,115 @@
+import gzip
+import json
+import os
+
+import pytest
+
+import export
+
+_ENCODE = export._encode
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(export, "FETCH_ROWS", 100)
+    monkeypatch.setattr(export, "CHUNK_ROWS", 700)
+    monkeypatch.setattr(export, "CHECKPOINT_ROWS", 500)
+
+def _read(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        return f.read()
+
+def _interrupt_after(monkeypatch, batches):
+    """Make the export fail while encoding batch number `batches` + 1."""
+    calls = []
+
+    def failing(records, format):
+        if len(calls) == batches:
+            raise KeyboardInterrupt
+        calls.append(len(records))
+        return _ENCODE(records, format)
+
+    monkeypatch.setattr(export, "_encode", failing)
+
+def test_export_writes_every_message_oldest_first(wc, tmp_path, small_chunks):
+    result = export.export_chat(str(tmp_path / "all.jsonl"))
+    rows = [json.loads(line) for line in _read(result.path).splitlines()]
+
+    count = wc.db.get_connection(wc.MESSAGES_DB_PATH).execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    assert result.rows == len(rows) == count
+    assert len({(row["chat_jid"], row["id"]) for row in rows}) == count
+    assert [row["timestamp"] for row in rows] == sorted(row["timestamp"] for row in rows)
+    assert not os.path.exists(result.path + ".checkpoint")
+
+@pytest.mark.parametrize("name", ["resumed.jsonl", "resumed.csv.gz"])
+def test_interrupted_export_resumes_from_checkpoint(wc, tmp_path, small_chunks, monkeypatch, name):
+    expected = export.export_chat(str(tmp_path / ("full-" + name)))
+
+    path = str(tmp_path / name)
+    _interrupt_after(monkeypatch, 12)
+    with pytest.raises(KeyboardInterrupt):
+        export.export_chat(path)
+    checkpoint = json.load(open(path + ".checkpoint"))
+    assert checkpoint["rows"] == 1000
+
+    monkeypatch.setattr(export, "_encode", _ENCODE)
+    result = export.export_chat(path)
+    assert result.resumed_from == 1000
+    assert result.rows == expected.rows
+    assert _read(path) == _read(expected.path)
+
+def test_changed_arguments_start_over(wc, tmp_path, small_chunks, monkeypatch):
+    path = str(tmp_path / "restart.jsonl")
+    _interrupt_after(monkeypatch, 6)
+    with pytest.raises(KeyboardInterrupt):
+        export.export_chat(path)
+    monkeypatch.setattr(export, "_encode", _ENCODE)
+
+    result = export.export_chat(path, after="2024-12-01")
+    assert result.resumed_from == 0
+
+def _ids(path):
+    return [json.loads(line)["id"] for line in _read(path).splitlines()]
+
+@pytest.mark.parametrize("ready_first", [False, True])
+def test_resume_across_a_sidecar_readiness_change(wc, tmp_path, small_chunks, monkeypatch, ready_first):
+    expected = export.export_chat(str(tmp_path / "full.jsonl"))
+    path = str(tmp_path / "switch.jsonl")
+
+    with monkeypatch.context() as patch:
+        if not ready_first:
+            patch.setattr(wc._sidecar, "is_ready", lambda name: False)
+        _interrupt_after(patch, 12)
+        with pytest.raises(KeyboardInterrupt):
+            export.export_chat(path)
+    assert json.load(open(path + ".checkpoint"))["order"] == ("ts" if ready_first else "timestamp")
+
+    with monkeypatch.context() as patch:
+        if ready_first:
+            patch.setattr(wc._sidecar, "is_ready", lambda name: False)
+        result = export.export_chat(path)
+    assert result.resumed_from == 1000
+    ids = _ids(path)
+    assert len(ids) == len(set(ids)) == expected.rows
+    assert sorted(ids) == sorted(_ids(expected.path))
+
+def test_export_filters_match_list_messages(wc, tmp_path):
+    chat_jid = wc.db.get_connection(wc.MESSAGES_DB_PATH).execute(
+        "SELECT chat_jid FROM messages GROUP BY chat_jid ORDER BY COUNT(*) DESC LIMIT 1"
+    ).fetchone()[0]
+    filters = {"chat_jid": chat_jid, "after": "2024-12-01T00:00:00-03:00", "before": "2024-12-20"}
+    result = export.export_chat(str(tmp_path / "filtered.jsonl"), **filters)
+
+    listed, cursor = [], None
+    while True:
+        page = wc.list_messages_page(limit=50, cursor=cursor, **filters)
+        listed.extend(message.id for message in page.messages)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+    assert result.rows > 0
+    assert _ids(result.path) == listed[::-1]
+
+def test_export_rejects_invalid_dates(wc, tmp_path):
+    with pytest.raises(ValueError, match="Invalid date format"):
+        export.export_chat(str(tmp_path / "bad.jsonl"), after="yesterday")
@@ -0,0 +1,126 @@
+import sqlite3
+
+import pytest
+
+def _page_through(wc, cursor=None, **filters):
+    """Follow next_cursor to the end; returns the messages and the cursors seen."""
+    messages, cursors = [], []
+    while True:
+        page = wc.list_messages_page(limit=50, cursor=cursor, **filters)
+        messages.extend(page.messages)
+        if page.next_cursor is None:
+            return messages, cursors
+        cursor = page.next_cursor
+        cursors.append(cursor)
+
+def _all_keys(wc, chat_jid=None):
+    conn = wc.db.get_connection(wc.MESSAGES_DB_PATH)
+    if chat_jid:
+        return conn.execute("SELECT chat_jid, id FROM messages WHERE chat_jid = ?", (chat_jid,)).fetchall()
+    return conn.execute("SELECT chat_jid, id FROM messages").fetchall()
+
+def _busiest_chat(wc):
+    return wc.db.get_connection(wc.MESSAGES_DB_PATH).execute(
+        "SELECT chat_jid FROM messages GROUP BY chat_jid ORDER BY COUNT(*) DESC LIMIT 1"
+    ).fetchone()[0]
+
+def _check_history(wc, messages, expected_keys):
+    keys = [(message.chat_jid, message.id) for message in messages]
+    assert len(keys) == len(set(keys))
+    assert sorted(keys) == sorted(expected_keys)
+    times = [message.timestamp for message in messages]
+    assert times == sorted(times, reverse=True)
+
+@pytest.fixture
+def unsynced_message(wc):
+    """A message newer than all others that the sidecar has not synced: its lock is held as a background pass would."""
+    chat_jid = _busiest_chat(wc)
+    conn = sqlite3.connect(wc.MESSAGES_DB_PATH)
+    with wc._sidecar._lock:
+        with conn:
+            conn.execute("""
+                INSERT INTO messages (id, chat_jid, sender, content, timestamp, is_from_me)
+                VALUES ('unsynced', ?, '5491100000001', 'mensaje recién llegado', '2030-01-01 12:00:00-03:00', 0)
+            """, (chat_jid,))
+        try:
+            yield chat_jid
+        finally:
+            with conn:
+                conn.execute("DELETE FROM messages WHERE id = 'unsynced'")
+            conn.close()
+
+@pytest.mark.parametrize("filters", [{"force_load": True}, {"chat": True}])
+def test_cursor_round_trip_in_epoch_order(wc, filters):
+    assert wc._time_order(wc.db.get_connection(wc.MESSAGES_DB_PATH)) is wc._TS_ORDER
+    chat_jid = _busiest_chat(wc) if filters.pop("chat", False) else None
+    messages, cursors = _page_through(wc, chat_jid=chat_jid, **filters)
+    assert cursors and all(wc._cursor_kind(cursor) == "ts" for cursor in cursors)
+    _check_history(wc, messages, _all_keys(wc, chat_jid))
+
+@pytest.mark.parametrize("filters", [{"force_load": True}, {"chat": True}])
+def test_cursor_round_trip_in_text_order(text_order, filters):
+    wc = text_order
+    chat_jid = _busiest_chat(wc) if filters.pop("chat", False) else None
+    messages, cursors = _page_through(wc, chat_jid=chat_jid, **filters)
+    assert cursors and all(wc._cursor_kind(cursor) == "timestamp" for cursor in cursors)
+    _check_history(wc, messages, _all_keys(wc, chat_jid))
+
+def test_text_cursor_keeps_text_order_once_ready(wc, monkeypatch):
+    with monkeypatch.context() as patch:
+        patch.setattr(wc._sidecar, "is_ready", lambda name: False)
+        first = wc.list_messages_page(force_load=True, limit=50)
+    rest, cursors = _page_through(wc, cursor=first.next_cursor, force_load=True)
+    assert all(wc._cursor_kind(cursor) == "timestamp" for cursor in cursors)
+    _check_history(wc, first.messages + rest, _all_keys(wc))
+
+def test_epoch_cursor_continues_in_text_order_when_not_ready(wc, monkeypatch):
+    first = wc.list_messages_page(force_load=True, limit=50)
+    assert wc._cursor_kind(first.next_cursor) == "ts"
+
+    monkeypatch.setattr(wc._sidecar, "is_ready", lambda name: False)
+    rest, cursors = _page_through(wc, cursor=first.next_cursor, force_load=True)
+    assert all(wc._cursor_kind(cursor) == "timestamp" for cursor in cursors)
+    _check_history(wc, first.messages + rest, _all_keys(wc))
+
+def test_stale_epoch_cursor_raises(text_order):
+    wc = text_order
+    cursor = wc._encode_cursor("ts", [0, 10 ** 9])
+    with pytest.raises(ValueError, match="Stale cursor"):
+        wc.list_messages_page(force_load=True, cursor=cursor)
+
+def test_invalid_cursor_raises(wc):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        wc.list_messages_page(force_load=True, cursor="not-a-cursor")
+    relevance = wc._encode_cursor("relevance", [50])
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        wc.list_messages_page(chat_jid=_busiest_chat(wc), cursor=relevance)
+
+def test_overlapping_context_windows_merge(wc):
+    chat_jid = _busiest_chat(wc)
+    hits = wc.list_messages(chat_jid=chat_jid, limit=3)
+    messages = wc.list_messages(chat_jid=chat_jid, limit=3, include_context=True, context_before=2, context_after=0)
+    # The three newest messages of a chat form one window, returned chronologically
+    assert [message.id for message in messages if not message.is_context] == [hit.id for hit in reversed(hits)]
+    assert len(messages) == 5
+    assert [message.timestamp for message in messages] == sorted(message.timestamp for message in messages)
+
+def test_contact_chats_match_the_plain_query(wc, monkeypatch):
+    conn = wc.db.get_connection(wc.MESSAGES_DB_PATH)
+    phones = [jid.split("@")[0] for jid, in conn.execute("SELECT jid FROM chats WHERE jid LIKE '%@s.whatsapp.net'")]
+    empty = {jid for jid, in conn.execute("SELECT jid FROM chats WHERE jid NOT IN (SELECT chat_jid FROM messages)")}
+    assert empty & {f"{phone}@s.whatsapp.net" for phone in phones}
+
+    chats = {phone: wc.get_contact_chats(phone) for phone in phones}
+    assert any(chat.contact_message_count for found in chats.values() for chat in found)
+    # Direct chats without messages are left out, as with the plain query
+    assert not {chat.jid for found in chats.values() for chat in found} & empty
+    monkeypatch.setattr(wc._sidecar, "is_ready", lambda name: False)
+    for phone, found in chats.items():
+        assert sorted(chat.jid for chat in found) == sorted(chat.jid for chat in wc.get_contact_chats(phone))
+
+def test_messages_past_the_sidecar_are_listed(wc, unsynced_message):
+    assert wc._sidecar.is_ready(wc.MESSAGE_TS.name)
+    for filters in ({"force_load": True}, {"chat_jid": unsynced_message}):
+        page = wc.list_messages_page(limit=5, **filters)
+        assert page.messages[0].id == "unsynced"
+        assert wc._cursor_kind(page.next_cursor) == "timestamp"
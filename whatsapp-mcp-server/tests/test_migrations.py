@@ -0,0 +1,36 @@
+import os
+import shutil
+import sqlite3
+import threading
+
+import pytest
+
+import migrations
+
+@pytest.fixture
+def unindexed_db(store_dir, tmp_path, monkeypatch):
+    """A copy of the test store's messages.db without the server's indexes."""
+    path = str(tmp_path / "messages.db")
+    shutil.copy(os.path.join(store_dir, "messages.db"), path)
+    conn = sqlite3.connect(path)
+    for name, _, _ in migrations.INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    conn.close()
+    # A fresh background starter for each test
+    monkeypatch.setattr(migrations, "_started", False)
+    monkeypatch.setattr(migrations, "_attempted", threading.Event())
+    return path
+
+def test_small_stores_are_indexed_in_the_background(unindexed_db, monkeypatch):
+    monkeypatch.setattr(migrations, "AUTO_INDEX_MAX_BYTES", os.path.getsize(unindexed_db))
+    assert migrations.ensure_indexes_in_background(unindexed_db).wait(30)
+    assert migrations.missing_indexes(unindexed_db) == []
+
+def test_large_stores_are_left_to_the_offline_cli(unindexed_db, monkeypatch, capsys):
+    monkeypatch.setattr(migrations, "AUTO_INDEX_MAX_BYTES", os.path.getsize(unindexed_db) - 1)
+    assert migrations.ensure_indexes_in_background(unindexed_db).wait(30)
+    assert migrations.missing_indexes(unindexed_db) == [name for name, _, _ in migrations.INDEXES]
+    assert "migrations.py" in capsys.readouterr().out
+
+    assert migrations.ensure_indexes(unindexed_db) == [name for name, _, _ in migrations.INDEXES]
+    assert migrations.missing_indexes(unindexed_db) == []
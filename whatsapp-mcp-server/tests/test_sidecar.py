@@ -0,0 +1,207 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import sidecar
+from sidecar import CHAT_SUMMARY, PARTICIPATION, Materialization, Sidecar, epoch_ms
+
+TABLES = {table.name: table for table in (CHAT_SUMMARY, PARTICIPATION)}
+
+# Each table recomputed from every message of messages.db
+EXACT = {
+    "chat_summary": """
+        WITH counts AS (
+            SELECT chat_jid,
+                   COUNT(*) AS message_count,
+                   SUM(is_from_me != 0) AS from_me_count,
+                   MAX(CASE WHEN is_from_me THEN timestamp END) AS last_from_me_time
+            FROM messages
+            GROUP BY chat_jid
+        )
+        SELECT counts.chat_jid, last.id, last.timestamp, last.content, last.sender, last.is_from_me,
+               counts.message_count, counts.from_me_count, counts.last_from_me_time,
+               (SELECT COUNT(*) FROM messages m
+                WHERE m.chat_jid = counts.chat_jid AND NOT m.is_from_me
+                AND m.timestamp > COALESCE(counts.last_from_me_time, ''))
+        FROM counts
+        JOIN messages last ON last.rowid = (
+            SELECT m.rowid FROM messages m
+            WHERE m.chat_jid = counts.chat_jid
+            ORDER BY m.timestamp DESC, m.id DESC
+            LIMIT 1
+        )
+    """,
+    # First and last seen by time, whatever the UTC offset they were written in
+    "participation": f"""
+        WITH pairs AS (
+            SELECT sender, chat_jid, COUNT(*) AS message_count
+            FROM messages
+            WHERE sender IS NOT NULL
+            GROUP BY sender, chat_jid
+        )
+        SELECT pairs.sender, pairs.chat_jid,
+               (SELECT m.timestamp FROM messages m
+                WHERE m.sender = pairs.sender AND m.chat_jid = pairs.chat_jid AND m.timestamp IS NOT NULL
+                ORDER BY {epoch_ms("m.timestamp")}, m.id LIMIT 1),
+               (SELECT m.timestamp FROM messages m
+                WHERE m.sender = pairs.sender AND m.chat_jid = pairs.chat_jid AND m.timestamp IS NOT NULL
+                ORDER BY {epoch_ms("m.timestamp")} DESC, m.id DESC LIMIT 1),
+               pairs.message_count
+        FROM pairs
+    """
+}
+
+def _materialization(base, batch_rows, sync=None):
+    return Materialization(base.name, base.schema, sync or base.sync, base.clear, batch_rows, base.version)
+
+def _rows(side, table):
+    return sorted(side._connection().execute(f"SELECT * FROM {table}").fetchall(), key=repr)
+
+def _recomputed(messages_db_path, table):
+    """The table as one exact recompute over every message builds it."""
+    conn = sqlite3.connect(messages_db_path)
+    rows = sorted(conn.execute(EXACT[table]).fetchall(), key=repr)
+    conn.close()
+    return rows
+
+@pytest.fixture
+def messages_db(store_dir, tmp_path):
+    """A copy of the test store's messages.db that tests may write to."""
+    path = str(tmp_path / "messages.db")
+    shutil.copy(os.path.join(store_dir, "messages.db"), path)
+    return path
+
+def _restore_messages(path, count):
+    """Re-store `count` messages the way the bridge does: INSERT OR REPLACE gives them new rowids."""
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO messages
+            SELECT * FROM messages WHERE rowid IN (SELECT rowid FROM messages ORDER BY random() LIMIT ?)
+        """, (count,))
+        # New messages: replies from me and from others, later than everything else
+        conn.execute("""
+            INSERT INTO messages (id, chat_jid, sender, content, timestamp, is_from_me)
+            SELECT 'new-' || id, chat_jid, sender, 'nuevo', '2025-01-02 10:00:00-03:00', NOT is_from_me
+            FROM messages WHERE rowid % 97 = 0
+        """)
+    conn.close()
+
+def _edit_messages(path):
+    """Re-store some messages with another time, sender and author, so their old values must be taken out.
+
+    Some times are written in UTC, so they sort against the others only by epoch.
+    """
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO messages (id, chat_jid, sender, content, timestamp, is_from_me)
+            SELECT id, chat_jid, CASE WHEN rowid % 2 THEN sender ELSE '5491100000001' END, 'editado',
+                   datetime(timestamp, '-1 day'), NOT is_from_me
+            FROM messages WHERE rowid % 53 = 0
+        """)
+        # Before the new messages by time, after them as text
+        conn.execute("""
+            INSERT INTO messages (id, chat_jid, sender, content, timestamp, is_from_me)
+            SELECT 'utc-' || id, chat_jid, sender, 'utc', '2025-01-02 12:00:00+00:00', is_from_me
+            FROM messages WHERE id LIKE 'new-%'
+        """)
+    conn.close()
+
+@pytest.mark.parametrize("table", sorted(TABLES))
+def test_batched_sync_matches_exact_recompute(messages_db, tmp_path, table):
+    side = Sidecar(messages_db, str(tmp_path / "side.db"), [_materialization(TABLES[table], 337)])
+    assert side.sync()
+    assert side.is_ready(table)
+    assert _rows(side, table) == _recomputed(messages_db, table)
+
+    # Re-stored messages replace the ones counted before instead of adding up
+    _restore_messages(messages_db, 200)
+    assert side.sync()
+    assert _rows(side, table) == _recomputed(messages_db, table)
+    _edit_messages(messages_db)
+    assert side.sync()
+    assert _rows(side, table) == _recomputed(messages_db, table)
+
+@pytest.mark.parametrize("table", sorted(TABLES))
+def test_interrupted_sync_resumes_after_restart(messages_db, tmp_path, table):
+    base = TABLES[table]
+    calls = []
+
+    def failing(conn, lower, upper):
+        if len(calls) == 4:
+            raise sqlite3.OperationalError("interrupted")
+        calls.append(upper)
+        base.sync(conn, lower, upper)
+
+    path = str(tmp_path / "side.db")
+    interrupted = _materialization(base, 500, sync=failing)
+    first = Sidecar(messages_db, path, [interrupted])
+    assert not first.sync()
+    assert not first.is_ready(table)
+    first.close()
+
+    # Rows added meanwhile are picked up from the stored watermark
+    _restore_messages(messages_db, 50)
+    restarted = Sidecar(messages_db, path, [_materialization(base, 500)])
+    assert restarted.sync()
+    assert _rows(restarted, table) == _recomputed(messages_db, table)
+
+def test_readiness_comes_from_the_stored_watermarks(messages_db, tmp_path):
+    path = str(tmp_path / "side.db")
+    first = Sidecar(messages_db, path, [_materialization(CHAT_SUMMARY, 1000)])
+    assert first.sync()
+    first.close()
+
+    restarted = Sidecar(messages_db, path, [_materialization(CHAT_SUMMARY, 1000)])
+    assert not restarted.is_ready(CHAT_SUMMARY.name)
+    assert restarted.sync()
+    assert restarted.is_ready(CHAT_SUMMARY.name)
+
+def test_reads_never_sync(messages_db, tmp_path, monkeypatch):
+    side = Sidecar(messages_db, str(tmp_path / "side.db"), [_materialization(CHAT_SUMMARY, 1000)])
+    monkeypatch.setattr(side, "start_background_sync", lambda *args, **kwargs: None)
+
+    side.ensure_fresh()
+    assert not side.is_ready(CHAT_SUMMARY.name)
+    assert side._connection().execute("SELECT COUNT(*) FROM chat_summary").fetchone()[0] == 0
+
+    assert side.sync()
+    synced = _rows(side, CHAT_SUMMARY.name)
+    _restore_messages(messages_db, 0)
+    side.ensure_fresh()
+    assert _rows(side, CHAT_SUMMARY.name) == synced
+    assert side.sync()
+    assert _rows(side, CHAT_SUMMARY.name) == _recomputed(messages_db, CHAT_SUMMARY.name)
+
+def test_a_table_far_behind_is_not_ready_while_it_catches_up(messages_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(sidecar, "CATCH_UP_ROWS", 10)
+    readiness = []
+
+    def sync(conn, lower, upper):
+        readiness.append(side.is_ready(CHAT_SUMMARY.name))
+        CHAT_SUMMARY.sync(conn, lower, upper)
+
+    side = Sidecar(messages_db, str(tmp_path / "side.db"), [_materialization(CHAT_SUMMARY, 1000, sync=sync)])
+    assert side.sync()
+    assert side.is_ready(CHAT_SUMMARY.name)
+    readiness.clear()
+    _restore_messages(messages_db, 0)
+    assert side.sync()
+    assert readiness and not any(readiness)
+    assert side.is_ready(CHAT_SUMMARY.name)
+
+def test_a_table_stored_by_an_older_version_is_rebuilt(messages_db, tmp_path):
+    side = Sidecar(messages_db, str(tmp_path / "side.db"), [_materialization(CHAT_SUMMARY, 1000)])
+    assert side.sync()
+    conn = side._connection()
+    with conn:
+        conn.execute("UPDATE chat_summary SET message_count = message_count * 2")
+        conn.execute("DELETE FROM sync_state WHERE name = 'chat_summary:version'")
+    side.close()
+
+    restarted = Sidecar(messages_db, side.path, [_materialization(CHAT_SUMMARY, 1000)])
+    assert restarted.sync()
+    assert _rows(restarted, CHAT_SUMMARY.name) == _recomputed(messages_db, CHAT_SUMMARY.name)
@@ -1,16 +1,29 @@
 import sqlite3
 from datetime import datetime, timedelta
 from dataclasses import dataclass
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Dict, Iterable, Any, Awaitable, Callable
 import os
 import os.path
 import requests
 import json
+import base64
+import heapq
 import audio
+import db
+import httpx
+from bridge import BridgeClient, BridgeUnavailable
+import asyncio
+from concurrency import AsyncTokenBucket, run_blocking, run_media
 import unicodedata
+from cache import TTLCache
+from records import LazyTimestamp, Record
+from media import MediaCache, MediaInfo, MediaMismatch, SingleFlight
+from contact_index import ContactIndex
+from sidecar import CHAT_SUMMARY, MESSAGE_TS, MESSAGES_FTS, PARTICIPATION, Sidecar, fts_query
+from migrations import ensure_indexes_in_background
 from dotenv import load_dotenv
 from unidecode import unidecode
-from fuzzywuzzy import process, fuzz
+from rapidfuzz.utils import default_process
 
 # Load environment variables
 load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env'))
@@ -27,29 +40,90 @@ WHATSAPP_API_PORT = os.getenv('WHATSAPP_API_PORT', '8080')
 WHATSAPP_API_BASE_URL = os.getenv('WHATSAPP_API_BASE_URL', f'http://{WHATSAPP_API_HOST}:{WHATSAPP_API_PORT}/api')
 MESSAGES_DB_NAME = os.getenv('MESSAGES_DB_NAME', 'messages.db')
 
+WHATSAPP_STORE_DIR = os.getenv('WHATSAPP_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'whatsapp-bridge', 'store'))
+
 # Database paths
-MESSAGES_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'whatsapp-bridge', 'store', MESSAGES_DB_NAME)
-WHATSAPP_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'whatsapp-bridge', 'store', 'whatsapp.db')
+MESSAGES_DB_PATH = os.path.join(WHATSAPP_STORE_DIR, MESSAGES_DB_NAME)
+WHATSAPP_DB_PATH = os.path.join(WHATSAPP_STORE_DIR, 'whatsapp.db')
+SIDECAR_DB_PATH = os.getenv('SIDECAR_DB_PATH', os.path.join(WHATSAPP_STORE_DIR, 'mcp_sidecar.db'))
 
-@dataclass
-class Message:
-    timestamp: datetime
-    sender: str
-    content: str
-    is_from_me: bool
-    chat_jid: str
-    id: str
-    chat_name: Optional[str] = None
-    media_type: Optional[str] = None
+# Shared client for the bridge's REST API
+_bridge = BridgeClient(WHATSAPP_API_BASE_URL)
 
-@dataclass
-class Chat:
-    jid: str
-    name: Optional[str]
-    last_message_time: Optional[datetime]
-    last_message: Optional[str] = None
-    last_sender: Optional[str] = None
-    last_is_from_me: Optional[bool] = None
+# send_messages_batch defaults: concurrent sends and sends per second
+SEND_BATCH_CONCURRENCY = int(os.getenv('SEND_BATCH_CONCURRENCY', '8'))
+SEND_RATE_PER_SECOND = float(os.getenv('SEND_RATE_PER_SECOND', '5'))
+
+# Downloaded media is moved out of the bridge's folders into this bounded cache
+MEDIA_CACHE_DIR = os.getenv('MEDIA_CACHE_DIR', os.path.join(WHATSAPP_STORE_DIR, 'mcp_media'))
+MEDIA_CACHE_MAX_BYTES = int(os.getenv('MEDIA_CACHE_MAX_BYTES', str(2 * 1024 * 1024 * 1024)))
+_media_cache = MediaCache(MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_BYTES)
+_downloads = SingleFlight()
+
+# Parallel bridge downloads per prefetch_media call, and its default size
+PREFETCH_CONCURRENCY = int(os.getenv('PREFETCH_CONCURRENCY', '4'))
+PREFETCH_LIMIT = 200
+
+class Message(Record):
+    """A message row; `timestamp` is parsed from `raw_timestamp` when read."""
+
+    __slots__ = ("raw_timestamp", "sender", "content", "is_from_me", "chat_jid", "id",
+                 "chat_name", "media_type", "is_context")
+    _fields = ("timestamp", "sender", "content", "is_from_me", "chat_jid", "id", "chat_name", "media_type",
+               "is_context")
+
+    timestamp = LazyTimestamp("raw_timestamp", fallback_now=True)
+
+    def __init__(self, timestamp, sender: str, content: str, is_from_me: bool, chat_jid: str, id: str,
+                 chat_name: Optional[str] = None, media_type: Optional[str] = None, is_context: bool = False):
+        self.raw_timestamp = timestamp
+        self.sender = sender
+        self.content = content
+        self.is_from_me = is_from_me
+        self.chat_jid = chat_jid
+        self.id = id
+        self.chat_name = chat_name
+        self.media_type = media_type
+        self.is_context = is_context
+
+    @classmethod
+    def from_row(cls, cursor, row) -> "Message":
+        """sqlite3 row factory for rows selected with MESSAGE_COLUMNS."""
+        timestamp, sender, chat_name, content, is_from_me, chat_jid, msg_id, media_type = row
+        return cls(timestamp, sender, content, bool(is_from_me), chat_jid, msg_id, chat_name, media_type)
+
+class Chat(Record):
+    """A chat row; its timestamps are parsed when read."""
+
+    __slots__ = ("jid", "name", "raw_last_message_time", "last_message", "last_sender", "last_is_from_me",
+                 "last_message_id", "message_count", "unanswered_count", "contact_message_count",
+                 "raw_contact_first_seen", "raw_contact_last_seen")
+    _fields = ("jid", "name", "last_message_time", "last_message", "last_sender", "last_is_from_me",
+               "last_message_id", "message_count", "unanswered_count", "contact_message_count",
+               "contact_first_seen", "contact_last_seen")
+
+    last_message_time = LazyTimestamp("raw_last_message_time")
+    # Activity of one contact in this chat (set by get_contact_chats)
+    contact_first_seen = LazyTimestamp("raw_contact_first_seen")
+    contact_last_seen = LazyTimestamp("raw_contact_last_seen")
+
+    def __init__(self, jid: str, name: Optional[str], last_message_time=None, last_message: Optional[str] = None,
+                 last_sender: Optional[str] = None, last_is_from_me: Optional[bool] = None,
+                 last_message_id: Optional[str] = None, message_count: Optional[int] = None,
+                 unanswered_count: Optional[int] = None, contact_message_count: Optional[int] = None,
+                 contact_first_seen=None, contact_last_seen=None):
+        self.jid = jid
+        self.name = name
+        self.raw_last_message_time = last_message_time
+        self.last_message = last_message
+        self.last_sender = last_sender
+        self.last_is_from_me = last_is_from_me
+        self.last_message_id = last_message_id
+        self.message_count = message_count
+        self.unanswered_count = unanswered_count
+        self.contact_message_count = contact_message_count
+        self.raw_contact_first_seen = contact_first_seen
+        self.raw_contact_last_seen = contact_last_seen
 
     @property
     def is_group(self) -> bool:
@@ -68,76 +142,195 @@ class MessageContext:
     before: List[Message]
     after: List[Message]
 
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "message": self.message.to_dict(),
+            "before": [message.to_dict() for message in self.before],
+            "after": [message.to_dict() for message in self.after]
+        }
+
+@dataclass
+class MessagePage:
+    messages: List[Message]
+    next_cursor: Optional[str] = None
+
+@dataclass
+class ChatPage:
+    chats: List[Chat]
+    next_cursor: Optional[str] = None
+
+def _encode_cursor(kind: str, position: list) -> str:
+    """Encode the sort position of the last returned row as an opaque cursor."""
+    payload = json.dumps({"k": kind, "p": position}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def _load_cursor(cursor: str) -> dict:
+    return json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+
+def _decode_cursor(cursor: str, kind: str) -> list:
+    """Decode a cursor produced by _encode_cursor for the same kind of listing."""
+    try:
+        payload = _load_cursor(cursor)
+        if payload["k"] != kind:
+            raise ValueError(kind)
+        return payload["p"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError(f"Invalid cursor: {cursor}. Pass the next_cursor of a previous call with the same sort.")
+
+def _cursor_kind(cursor: str) -> Optional[str]:
+    """Kind of listing a cursor was produced for, or None if it is not a cursor."""
+    try:
+        return _load_cursor(cursor)["k"]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+def keyset_clause(column: str, tiebreak: str, position: list, descending: bool, nullable: bool = False) -> Tuple[str, list]:
+    """
+    WHERE clause selecting the rows after `position` in ORDER BY column, tiebreak.
+
+    SQLite sorts NULLs first ascending and last descending; `nullable` keeps
+    those rows reachable when `column` can be NULL.
+    """
+    value, key = position
+    op = "<" if descending else ">"
+    if value is None:
+        if descending:
+            return f"({column} IS NULL AND {tiebreak} {op} ?)", [key]
+        return f"(({column} IS NULL AND {tiebreak} {op} ?) OR {column} IS NOT NULL)", [key]
+    clause = f"({column}, {tiebreak}) {op} (?, ?)"
+    if nullable and descending:
+        clause = f"({clause} OR {column} IS NULL)"
+    return clause, [value, key]
+
+# Índice de contactos residente; se recarga solo cuando cambian las BDs
+_contact_index = ContactIndex(WHATSAPP_DB_PATH, MESSAGES_DB_PATH, normalize)
+
+# Índices derivados de messages.db (búsqueda full-text, timestamps numéricos), en una BD propia
+_sidecar = Sidecar(MESSAGES_DB_PATH, SIDECAR_DB_PATH, [MESSAGE_TS, MESSAGES_FTS, CHAT_SUMMARY, PARTICIPATION])
+
+@dataclass(frozen=True)
+class TimeOrder:
+    """Where message time filters and ordering read from.
+
+    messages.db only has the text `timestamp` column (tiebreak: id); once
+    the sidecar's message_ts is ready, its integer `ts_ms` (tiebreak: the
+    shared rowid) is joined in as `ts` and range scans walk its indexes.
+    """
+    table: str
+    alias: str
+    join: str
+    time: str
+    key: str
+    cursor_kind: str
+    epoch: bool
+
+    def column(self, name: str) -> str:
+        return f"{self.alias}.{name}"
+
+    def bound(self, value: datetime):
+        """A date filter bound as compared by this order."""
+        return _epoch_ms(value) if self.epoch else value
+
+_TEXT_ORDER = TimeOrder("messages", "messages", "", "timestamp", "id", "timestamp", False)
+_TS_ORDER = TimeOrder("side.message_ts", "ts", "JOIN side.message_ts AS ts ON ts.rowid = messages.rowid",
+                       "ts_ms", "rowid", "ts", True)
+
+def _time_order(conn: sqlite3.Connection) -> TimeOrder:
+    """_TS_ORDER when message_ts is up to date and attached to `conn`, else _TEXT_ORDER."""
+    _sidecar.ensure_fresh()
+    if _sidecar.is_ready(MESSAGE_TS.name) and _sidecar.attach(conn):
+        return _TS_ORDER
+    return _TEXT_ORDER
+
+def time_order_after(conn: sqlite3.Connection, kind: Optional[str] = None,
+                     position: Optional[list] = None) -> Tuple[TimeOrder, Optional[list]]:
+    """
+    Time order to continue reading messages in, and where to continue from.
+
+    A position saved in one order (kind "timestamp" or "ts") keeps that
+    order when it can: text positions stay in text order once message_ts is
+    ready. A ts position while message_ts is not ready (e.g. the sidecar is
+    being rebuilt) is translated to the (timestamp, id) of the same
+    messages.db row.
+
+    Args:
+        conn (sqlite3.Connection): Pooled connection to messages.db
+        kind (str, optional): cursor_kind of the order `position` is in
+        position (list, optional): [time, key] of the last row read
+
+    Returns:
+        Tuple[TimeOrder, Optional[list]]: The order, and the position in it
+        (None when starting from the beginning)
+
+    Raises:
+        ValueError: If the row a ts position points to no longer exists
+    """
+    order = _time_order(conn)
+    if position is None:
+        return order, None
+    if kind == _TEXT_ORDER.cursor_kind:
+        return _TEXT_ORDER, position
+    if kind != _TS_ORDER.cursor_kind:
+        raise ValueError(f"Unknown time order: {kind}")
+    if order.epoch:
+        return order, position
+    row = conn.execute("SELECT timestamp, id FROM messages WHERE rowid = ?", (position[-1],)).fetchone()
+    if row is None:
+        raise ValueError("Stale cursor: the message it continues from is gone. Start again without it.")
+    return _TEXT_ORDER, list(row)
+
+def message_filters(order: TimeOrder, after=None, before=None, sender_phone_number: Optional[str] = None,
+                    chat_jid: Optional[str] = None) -> Tuple[List[str], list]:
+    """
+    WHERE clauses and parameters for the list_messages filters, in `order`'s time column.
+
+    Raises:
+        ValueError: If `after` or `before` is not an ISO-8601 date
+    """
+    where_clauses, params = [], []
+    if after:
+        where_clauses.append(f"{order.column(order.time)} > ?")
+        params.append(order.bound(_parse_date(after, "after")))
+    if before:
+        where_clauses.append(f"{order.column(order.time)} < ?")
+        params.append(order.bound(_parse_date(before, "before")))
+    if sender_phone_number:
+        where_clauses.append("messages.sender = ?")
+        params.append(sender_phone_number)
+    if chat_jid:
+        where_clauses.append(f"{order.column('chat_jid')} = ?")
+        params.append(chat_jid)
+    return where_clauses, params
+
+def _epoch_ms(value: datetime) -> int:
+    # Naive datetimes are local time, like the timestamps the bridge stores
+    return round(value.timestamp() * 1000)
+
+def _parse_date(value, name: str) -> datetime:
+    """Parse an `after`/`before` argument given as ISO-8601 text or a datetime."""
+    try:
+        return datetime.fromisoformat(value) if isinstance(value, str) else value
+    except ValueError:
+        raise ValueError(f"Invalid date format for '{name}': {value}. Please use ISO-8601 format.")
+
+def start_background_indexing():
+    """Create missing messages.db indexes and keep the sidecar in sync, off the request path."""
+    indexes_attempted = ensure_indexes_in_background(MESSAGES_DB_PATH)
+    # The sidecar backfill reads messages.db through those indexes
+    _sidecar.start_background_sync(wait_for=indexes_attempted)
+
 def get_all_contacts_with_names() -> List[Tuple[str, str, str]]:
     """Obtiene todos los contactos con sus nombres desde ambas BDs.
     Returns: Lista de tuplas (jid, display_name, source)
     """
-    contacts = []
-    contact_jids = set() # Usar un set para manejar duplicados eficientemente
+    return [(entry.jid, entry.name, entry.source) for entry in _contact_index.entries(include_groups=True)]
 
-    try:
-        # 1. Obtener nombres reales de WhatsApp DB (nombres personalizados)
-        if os.path.exists(WHATSAPP_DB_PATH):
-            whatsapp_conn = sqlite3.connect(WHATSAPP_DB_PATH)
-            whatsapp_cursor = whatsapp_conn.cursor()
-            
-            # Consulta corregida para buscar nombres de manera más robusta
-            whatsapp_cursor.execute("""
-                SELECT 
-                    their_jid,
-                    COALESCE(
-                        NULLIF(TRIM(full_name), ''),
-                        NULLIF(TRIM(first_name), ''),
-                        NULLIF(TRIM(push_name), '')
-                    ) as display_name
-                FROM whatsmeow_contacts
-                WHERE their_jid IS NOT NULL AND (
-                    (full_name IS NOT NULL AND TRIM(full_name) != '') OR
-                    (first_name IS NOT NULL AND TRIM(first_name) != '') OR
-                    (push_name IS NOT NULL AND TRIM(push_name) != '')
-                )
-            """)
-            
-            whatsapp_contacts = whatsapp_cursor.fetchall()
-            for jid, display_name in whatsapp_contacts:
-                if jid not in contact_jids:
-                    contacts.append((jid, display_name, 'whatsapp'))
-                    contact_jids.add(jid)
-            
-            whatsapp_conn.close()
-            
-    except Exception as e:
-        print(f"Error accessing WhatsApp contacts DB: {e}")
-    
-    try:
-        # 2. Obtener chats de Messages DB (nombres de chat/grupo)
-        if os.path.exists(MESSAGES_DB_PATH):
-            messages_conn = sqlite3.connect(MESSAGES_DB_PATH)
-            messages_cursor = messages_conn.cursor()
-            
-            messages_cursor.execute("""
-                SELECT DISTINCT 
-                    jid,
-                    name
-                FROM chats
-                WHERE jid != '0@s.whatsapp.net'
-                AND name IS NOT NULL 
-                AND TRIM(name) != ''
-            """)
-            
-            chat_contacts = messages_cursor.fetchall()
-            
-            for jid, name in chat_contacts:
-                if jid not in contact_jids: # Evitar duplicados de la fuente anterior
-                    contacts.append((jid, name, 'chat'))
-                    contact_jids.add(jid)
-            
-            messages_conn.close()
-            
-    except Exception as e:
-        print(f"Error accessing Messages DB: {e}")
-    
-    return contacts
+def _substring_score_bound(query_length: int, name_length: int) -> int:
+    """Máximo score posible en search_contacts para un nombre que contiene la query."""
+    if name_length == query_length:
+        return 100
+    extra = name_length - query_length
+    return max(95 - extra * 2, 83 - extra, 60)
 
 def search_contacts(query: str, limit: int = 25, include_groups: bool = False) -> List[Contact]:
     """Búsqueda optimizada de contactos usando nombres reales de WhatsApp."""
@@ -149,72 +342,57 @@ def search_contacts(query: str, limit: int = 25, include_groups: bool = False) -
         clean_query = query.strip()
         normalized_query = normalize(clean_query)
         
-        # Obtener todos los contactos con nombres
-        all_contacts = get_all_contacts_with_names()
-        
-        if not all_contacts:
+        # Una sola generación del índice para toda la búsqueda
+        snapshot = _contact_index.snapshot()
+        if not snapshot.select(include_groups):
             print("WARNING: No contacts found in databases")
             return []
         
-        # Filtrar grupos si no se incluyen
-        if not include_groups:
-            all_contacts = [(jid, name, source) for jid, name, source in all_contacts 
-                          if not jid.endswith('@g.us')]
-        
-        # Crear lista para búsqueda fuzzy
-        contact_dict = {}
-        search_targets = []
-        
-        for jid, name, source in all_contacts:
-            # Priorizar nombres de WhatsApp sobre nombres de chat
-            if jid in contact_dict and source == 'chat' and contact_dict[jid]['source'] == 'whatsapp':
-                continue
-                
-            contact_dict[jid] = {'name': name, 'source': source}
-            search_targets.append((jid, normalize(name), name))
-        
-        # Búsqueda exacta primero
+        # Búsqueda exacta primero: el índice entrega los nombres que contienen la
+        # query de más corto a más largo, así que se corta en cuanto ninguno de
+        # los restantes puede superar al peor de los `limit` mejores
         exact_matches = []
-        fuzzy_candidates = []
+        top_scores = []  # min-heap con los `limit` mejores scores
+        query_length = len(normalized_query)
         
-        for jid, normalized_name, original_name in search_targets:
+        for position, entry in snapshot.substring_matches(normalized_query, include_groups):
+            jid, normalized_name, original_name = entry.jid, entry.normalized, entry.name
+            if len(top_scores) >= limit and top_scores[0] > _substring_score_bound(query_length, len(normalized_name)):
+                break
             if normalized_query == normalized_name:
-                exact_matches.append((jid, original_name, 100))
-            elif normalized_query in normalized_name:
+                score = 100
+            else:
                 # Calcular score basado en posición y longitud
                 pos = normalized_name.find(normalized_query)
-                length_ratio = len(normalized_query) / len(normalized_name)
                 if pos == 0:  # Empieza con la query
                     score = 95 - (len(normalized_name) - len(normalized_query)) * 2
                 else:  # Contiene la query
                     score = 85 - pos * 2 - (len(normalized_name) - len(normalized_query))
                 score = max(score, 60)  # Mínimo 60
-                exact_matches.append((jid, original_name, score))
+            if len(top_scores) < limit:
+                heapq.heappush(top_scores, score)
+            elif score < top_scores[0]:
+                # Ya hay `limit` substrings mejores: este no puede salir
+                continue
             else:
-                fuzzy_candidates.append((jid, normalized_name, original_name))
+                heapq.heappushpop(top_scores, score)
+            exact_matches.append((position, jid, original_name, score))
+        
+        # Volver al orden del índice para que los empates se resuelvan como siempre
+        exact_matches.sort()
+        exact_matches = [(jid, name, score) for _, jid, name, score in exact_matches]
         
-        # Búsqueda fuzzy para candidatos restantes
+        # partial_ratio sobre todos los nombres que no contienen la query. Si ya hay
+        # `limit` substrings, un fuzzy por debajo del peor de ellos no puede entrar,
+        # así que se sube el corte
         fuzzy_matches = []
-        if fuzzy_candidates and len(normalized_query) >= 2:
-            # Extraer solo los nombres normalizados para fuzzywuzzy
-            candidate_names = [name for _, name, _ in fuzzy_candidates]
-            
-            # Usar fuzz.partial_ratio para mejor detección de coincidencias parciales
-            fuzzy_results = process.extract(
-                normalized_query, 
-                candidate_names, 
-                scorer=fuzz.partial_ratio,
-                limit=limit * 2
-            )
-            
-            # Mapear resultados de vuelta a contactos
-            for fuzzy_name, score in fuzzy_results:
-                if score >= 70:  # Umbral de similitud
-                    # Encontrar el contacto original
-                    for jid, norm_name, orig_name in fuzzy_candidates:
-                        if norm_name == fuzzy_name:
-                            fuzzy_matches.append((jid, orig_name, score))
-                            break
+        if len(normalized_query) >= 2:
+            score_cutoff = 70  # Umbral de similitud
+            if len(top_scores) >= limit:
+                score_cutoff = max(score_cutoff, top_scores[0])
+            for entry, score in snapshot.partial_ratio_matches(normalized_query, include_groups,
+                                                               score_cutoff, limit * 2):
+                fuzzy_matches.append((entry.jid, entry.name, score))
         
         # Combinar y ordenar resultados
         all_matches = exact_matches + fuzzy_matches
@@ -259,64 +437,30 @@ def smart_search_contacts(query: str, limit: int = 25, include_groups: bool = Fa
         clean_query = query.strip()
         normalized_query = normalize(clean_query)
         
-        # Obtener todos los contactos
-        all_contacts = get_all_contacts_with_names()
-        
-        if not all_contacts:
-            return []
-        
-        # Filtrar grupos si no se incluyen
-        if not include_groups:
-            all_contacts = [(jid, name, source) for jid, name, source in all_contacts 
-                          if not jid.endswith('@g.us')]
-        
-        # Preparar para búsqueda fuzzy
-        contact_dict = {}
-        search_targets = []
-        
-        for jid, name, source in all_contacts:
-            if jid in contact_dict and source == 'chat' and contact_dict[jid]['source'] == 'whatsapp':
-                continue
-                
-            contact_dict[jid] = {'name': name, 'source': source}
-            search_targets.append((jid, normalize(name), name))
-        
-        # Búsqueda fuzzy con umbral personalizable
-        candidate_names = [(jid, norm_name, orig_name) for jid, norm_name, orig_name in search_targets]
-        names_only = [norm_name for _, norm_name, _ in candidate_names]
-        
-        # Usar token_sort_ratio para mejor manejo de nombres con orden diferente
-        fuzzy_results = process.extract(
-            normalized_query,
-            names_only,
-            scorer=fuzz.token_sort_ratio,
-            limit=limit * 2
-        )
-        
         # Convertir umbral de 0.0-1.0 a 0-100
         threshold_score = similarity_threshold * 100
         
-        # Filtrar por umbral y mapear a contactos
+        # token_sort_ratio contra todos los contactos en una sola llamada, con corte
+        # temprano en el umbral; cada resultado ya trae su contacto (homónimos incluidos)
+        matches = _contact_index.snapshot().token_sort_matches(
+            default_process(normalized_query),
+            include_groups,
+            score_cutoff=threshold_score,
+            limit=limit
+        )
+        
         result = []
-        seen_jids = set()
+        for entry, score in matches:
+            phone_number = entry.jid.split('@')[0] if '@' in entry.jid else entry.jid
+            
+            contact = Contact(
+                phone_number=phone_number,
+                name=entry.name,
+                jid=entry.jid
+            )
+            result.append(contact)
         
-        for fuzzy_name, score in fuzzy_results:
-            if score >= threshold_score:
-                # Encontrar contacto original
-                for jid, norm_name, orig_name in candidate_names:
-                    if norm_name == fuzzy_name and jid not in seen_jids:
-                        seen_jids.add(jid)
-                        phone_number = jid.split('@')[0] if '@' in jid else jid
-                        
-                        contact = Contact(
-                            phone_number=phone_number,
-                            name=orig_name,
-                            jid=jid
-                        )
-                        result.append(contact)
-                        break
-        
-        return result[:limit]
+        return result
         
     except Exception as e:
         print(f"Error in smart_search_contacts: {e}")
@@ -326,85 +470,79 @@ def smart_search_contacts_enhanced(query: str, limit: int = 25, include_groups:
     """Alias para compatibilidad."""
     return smart_search_contacts(query, limit, include_groups, similarity_threshold)
 
-def get_real_contact_name(jid: str) -> Optional[str]:
-    """Get the real contact name from whatsapp.db"""
+# Funciones adicionales de mensajería y utilidades
+
+# Nombres resueltos desde whatsapp.db (también se cachean los no encontrados)
+SENDER_NAME_CACHE_SIZE = int(os.getenv('SENDER_NAME_CACHE_SIZE', '10000'))
+SENDER_NAME_TTL = float(os.getenv('SENDER_NAME_TTL', '300'))
+
+# Máximo de parámetros por consulta IN (...)
+NAME_QUERY_BATCH = 500
+
+_contact_names = TTLCache(SENDER_NAME_CACHE_SIZE, SENDER_NAME_TTL)
+
+def _best_contact_name(full_name: Optional[str], first_name: Optional[str], push_name: Optional[str]) -> Optional[str]:
+    """First non-empty name in order of preference: full_name, first_name, push_name."""
+    for name in (full_name, first_name, push_name):
+        if name and name.strip():
+            return name.strip()
+    return None
+
+def resolve_contact_names(jids: Iterable[str]) -> Dict[str, Optional[str]]:
+    """
+    Resolve the real contact names of many JIDs with one query per batch.
+
+    Names are served from a bounded LRU cache with a TTL (SENDER_NAME_TTL);
+    only JIDs that are not cached are looked up in whatsapp.db.
+
+    Returns:
+        dict: JID -> name, or None for JIDs without a stored name
+    """
+    names, missing = _contact_names.get_many(dict.fromkeys(jids))
+    if not missing:
+        return names
+    
     try:
-        conn = sqlite3.connect(WHATSAPP_DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT full_name, first_name, push_name
-            FROM whatsmeow_contacts
-            WHERE their_jid = ?
-            ORDER BY 
-                CASE WHEN full_name IS NOT NULL AND TRIM(full_name) != '' THEN 1 ELSE 0 END DESC,
-                CASE WHEN first_name IS NOT NULL AND TRIM(first_name) != '' THEN 1 ELSE 0 END DESC,
-                CASE WHEN push_name IS NOT NULL AND TRIM(push_name) != '' THEN 1 ELSE 0 END DESC
-            LIMIT 1
-        """, (jid,))
-        
-        result = cursor.fetchone()
-        
-        if result:
-            # Return the first non-empty name in order of preference: full_name, first_name, push_name
-            for name in result:
-                if name and name.strip():
-                    return name.strip()
-        
-        return None
+        conn = db.get_connection(WHATSAPP_DB_PATH)
+        for start in range(0, len(missing), NAME_QUERY_BATCH):
+            batch = missing[start:start + NAME_QUERY_BATCH]
+            cursor = conn.execute(f"""
+                SELECT their_jid, full_name, first_name, push_name
+                FROM whatsmeow_contacts
+                WHERE their_jid IN ({", ".join("?" * len(batch))})
+            """, batch)
+            
+            # Same preference as a single lookup: rows with a full_name first, then first_name, then push_name
+            best = {}
+            for jid, full_name, first_name, push_name in cursor:
+                rank = tuple(bool(name and name.strip()) for name in (full_name, first_name, push_name))
+                if jid not in best or rank > best[jid][0]:
+                    best[jid] = (rank, _best_contact_name(full_name, first_name, push_name))
+            
+            for jid in batch:
+                name = best[jid][1] if jid in best else None
+                _contact_names.put(jid, name)
+                names[jid] = name
         
-    except sqlite3.Error as e:
+    except (sqlite3.Error, OSError) as e:
         print(f"Database error while getting real contact name: {e}")
-        return None
-    finally:
-        if 'conn' in locals():
-            conn.close()
+        for jid in missing:
+            names.setdefault(jid, None)
+    
+    return names
 
-# Funciones adicionales de mensajería y utilidades
+def invalidate_contact_names(jid: Optional[str] = None):
+    """Forget cached contact names (all of them if no JID is given)."""
+    _contact_names.invalidate(jid)
 
 def get_real_contact_name(jid: str) -> Optional[str]:
     """Get the real contact name from whatsapp.db"""
-    try:
-        conn = sqlite3.connect(WHATSAPP_DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT full_name, first_name, push_name
-            FROM whatsmeow_contacts
-            WHERE their_jid = ?
-            ORDER BY 
-                CASE WHEN full_name IS NOT NULL AND TRIM(full_name) != '' THEN 1 ELSE 0 END DESC,
-                CASE WHEN first_name IS NOT NULL AND TRIM(first_name) != '' THEN 1 ELSE 0 END DESC,
-                CASE WHEN push_name IS NOT NULL AND TRIM(push_name) != '' THEN 1 ELSE 0 END DESC
-            LIMIT 1
-        """, (jid,))
-        
-        result = cursor.fetchone()
-        
-        if result:
-            # Return the first non-empty name in order of preference: full_name, first_name, push_name
-            for name in result:
-                if name and name.strip():
-                    return name.strip()
-        
-        return None
-        
-    except sqlite3.Error as e:
-        print(f"Database error while getting real contact name: {e}")
-        return None
-    finally:
-        if 'conn' in locals():
-            conn.close()
+    return resolve_contact_names([jid])[jid]
 
-def get_sender_name(sender: str) -> str:
-    """Get display name for a sender."""
-    if not sender or sender == "0":
-        return "Unknown"
-    
-    # Try to get real name from WhatsApp DB first
-    sender_jid = sender if "@" in sender else f"{sender}@s.whatsapp.net"
-    real_name = get_real_contact_name(sender_jid)
-    
+def _sender_jid(sender: str) -> str:
+    return sender if "@" in sender else f"{sender}@s.whatsapp.net"
+
+def _sender_display_name(sender: str, real_name: Optional[str]) -> str:
     if real_name:
         return real_name
     
@@ -412,36 +550,203 @@ def get_sender_name(sender: str) -> str:
     phone = sender.split("@")[0] if "@" in sender else sender
     return f"Contact ({phone})"
 
-def format_message(message: Message, show_chat_info: bool = True) -> str:
-    """Print a single message with consistent formatting."""
-    output = ""
+def get_sender_name(sender: str) -> str:
+    """Get display name for a sender."""
+    if not sender or sender == "0":
+        return "Unknown"
     
+    # Try to get real name from WhatsApp DB first
+    sender_jid = _sender_jid(sender)
+    return _sender_display_name(sender, get_real_contact_name(sender_jid))
+
+def get_sender_names(senders: Iterable[str]) -> Dict[str, str]:
+    """Get display names for many senders, resolving them in bulk."""
+    senders = [sender for sender in dict.fromkeys(senders) if sender and sender != "0"]
+    real_names = resolve_contact_names(_sender_jid(sender) for sender in senders)
+    names = {sender: _sender_display_name(sender, real_names[_sender_jid(sender)]) for sender in senders}
+    return names
+
+def format_message(message: Message, show_chat_info: bool = True, sender_name: Optional[str] = None) -> str:
+    """Print a single message with consistent formatting."""
+    parts = [f"[{message.timestamp:%Y-%m-%d %H:%M:%S}] "]
     if show_chat_info and message.chat_name:
-        output += f"[{message.timestamp:%Y-%m-%d %H:%M:%S}] Chat: {message.chat_name} "
-    else:
-        output += f"[{message.timestamp:%Y-%m-%d %H:%M:%S}] "
-        
+        parts.append(f"Chat: {message.chat_name} ")
+    
     content_prefix = ""
     if hasattr(message, 'media_type') and message.media_type:
         content_prefix = f"[{message.media_type} - Message ID: {message.id} - Chat JID: {message.chat_jid}] "
     
     try:
-        sender_name = get_sender_name(message.sender) if not message.is_from_me else "Me"
-        output += f"From: {sender_name}: {content_prefix}{message.content}\n"
+        if message.is_from_me:
+            sender_name = "Me"
+        elif sender_name is None:
+            sender_name = get_sender_name(message.sender)
+        parts.append(f"From: {sender_name}: {content_prefix}{message.content}\n")
     except Exception as e:
         print(f"Error formatting message: {e}")
-    return output
+    return "".join(parts)
 
 def format_messages_list(messages: List[Message], show_chat_info: bool = True) -> str:
     """Format a list of messages for display."""
-    output = ""
     if not messages:
-        output += "No messages to display."
-        return output
+        return "No messages to display."
     
-    for message in messages:
-        output += format_message(message, show_chat_info)
-    return output
+    # Resolve every distinct sender with one lookup instead of one per message
+    names = get_sender_names(message.sender for message in messages if not message.is_from_me)
+    return "".join(
+        format_message(message, show_chat_info, names.get(message.sender))
+        for message in messages
+    )
+
+# Columns of a Message row, in the order _message_from_row expects
+MESSAGE_COLUMNS = "messages.timestamp, messages.sender, chats.name, messages.content, messages.is_from_me, chats.jid, messages.id, messages.media_type"
+
+# Maximum anchor messages per context query (two parameters each)
+CONTEXT_QUERY_BATCH = 400
+
+def _message_from_row(row) -> Message:
+    """Build a Message from a row selected with MESSAGE_COLUMNS."""
+    return Message.from_row(None, row)
+
+def _fetch_context_windows(conn: sqlite3.Connection, anchors: List[Tuple[str, str]], before: int, after: int,
+                           order: TimeOrder = _TEXT_ORDER):
+    """
+    Fetch the messages around many anchor messages in one windowed query per batch.
+
+    For each anchor, two index seeks on (chat_jid, time) find the
+    messages `before` and `after` positions away in `order`;
+    every message between those bounds is selected once, however many
+    windows contain it, and numbered with ROW_NUMBER() per chat. Each window
+    is then a contiguous range of numbers around its anchor.
+
+    Args:
+        conn (sqlite3.Connection): Connection to messages.db
+        anchors (List[Tuple[str, str]]): (chat_jid, message_id) pairs
+        before (int): Messages to include before each anchor
+        after (int): Messages to include after each anchor
+        order (TimeOrder, optional): Time order of the messages
+
+    Returns:
+        Tuple[Dict[str, Dict[int, Message]], Dict[Tuple[str, str], int]]:
+            chat_jid -> {row number: message}, and (chat_jid, id) -> row number of each anchor found
+    """
+    by_chat: Dict[str, Dict[int, Message]] = {}
+    anchor_numbers: Dict[Tuple[str, str], int] = {}
+    
+    table, time, key = order.table, order.time, order.key
+    
+    # Bound of a window: the message `count` positions away, else the first/last of the chat
+    low_bound = high_bound = "targets.row_id"
+    if before > 0:
+        low_bound = f"""COALESCE(
+                    (SELECT m.rowid FROM {table} m
+                     WHERE m.chat_jid = targets.chat_jid AND (m.{time}, m.{key}) < (targets.sort_time, targets.sort_key)
+                     ORDER BY m.{time} DESC, m.{key} DESC LIMIT 1 OFFSET :before),
+                    (SELECT m.rowid FROM {table} m WHERE m.chat_jid = targets.chat_jid
+                     ORDER BY m.{time}, m.{key} LIMIT 1)
+                )"""
+    if after > 0:
+        high_bound = f"""COALESCE(
+                    (SELECT m.rowid FROM {table} m
+                     WHERE m.chat_jid = targets.chat_jid AND (m.{time}, m.{key}) > (targets.sort_time, targets.sort_key)
+                     ORDER BY m.{time}, m.{key} LIMIT 1 OFFSET :after),
+                    (SELECT m.rowid FROM {table} m WHERE m.chat_jid = targets.chat_jid
+                     ORDER BY m.{time} DESC, m.{key} DESC LIMIT 1)
+                )"""
+    
+    for start in range(0, len(anchors), CONTEXT_QUERY_BATCH):
+        batch = anchors[start:start + CONTEXT_QUERY_BATCH]
+        params = {"before": before - 1, "after": after - 1}
+        values = []
+        for i, (chat_jid, message_id) in enumerate(batch):
+            params[f"c{i}"], params[f"m{i}"] = chat_jid, message_id
+            values.append(f"(:c{i}, :m{i})")
+        
+        cursor = conn.execute(f"""
+            WITH anchors(chat_jid, id) AS (VALUES {", ".join(values)}),
+            targets AS MATERIALIZED (
+                SELECT messages.rowid AS row_id, messages.chat_jid,
+                       {order.column(time)} AS sort_time, {order.column(key)} AS sort_key
+                FROM anchors
+                JOIN messages ON messages.id = anchors.id AND messages.chat_jid = anchors.chat_jid
+                {order.join}
+            ),
+            bounds AS MATERIALIZED (
+                SELECT targets.chat_jid, {low_bound} AS low_id, {high_bound} AS high_id
+                FROM targets
+            ),
+            members AS (
+                SELECT DISTINCT m.rowid AS row_id
+                FROM bounds
+                JOIN {table} low ON low.rowid = bounds.low_id
+                JOIN {table} high ON high.rowid = bounds.high_id
+                JOIN {table} m ON m.chat_jid = bounds.chat_jid
+                    AND m.{time} BETWEEN low.{time} AND high.{time}
+                    AND (m.{time}, m.{key}) >= (low.{time}, low.{key})
+                    AND (m.{time}, m.{key}) <= (high.{time}, high.{key})
+            )
+            SELECT ROW_NUMBER() OVER (PARTITION BY messages.chat_jid ORDER BY {order.column(time)}, {order.column(key)}),
+                   {MESSAGE_COLUMNS}
+            FROM members
+            JOIN messages ON messages.rowid = members.row_id
+            {order.join}
+            JOIN chats ON messages.chat_jid = chats.jid
+        """, params)
+        
+        wanted = set(batch)
+        for row in cursor:
+            message = _message_from_row(row[1:])
+            by_chat.setdefault(message.chat_jid, {})[row[0]] = message
+            key = (message.chat_jid, message.id)
+            if key in wanted:
+                anchor_numbers[key] = row[0]
+    
+    return by_chat, anchor_numbers
+
+def _with_context(conn: sqlite3.Connection, hits: List[Message], before: int, after: int,
+                  order: TimeOrder = _TEXT_ORDER) -> List[Message]:
+    """
+    Expand matched messages with the messages around them.
+
+    Overlapping windows in a chat are merged, so every message
+    appears once. Each merged window is returned in chronological order, and
+    windows are ordered by their first match in `hits`. Context messages
+    have is_context=True.
+    """
+    before, after = max(before, 0), max(after, 0)
+    by_chat, anchor_numbers = _fetch_context_windows(conn, [(hit.chat_jid, hit.id) for hit in hits], before, after, order)
+    
+    # Merge the overlapping [n - before, n + after] ranges of each chat, remembering the first hit of each
+    intervals: Dict[str, List[List[int]]] = {}
+    for hit_order, hit in enumerate(hits):
+        number = anchor_numbers.get((hit.chat_jid, hit.id))
+        if number is not None:
+            intervals.setdefault(hit.chat_jid, []).append([number - before, number + after, hit_order])
+    
+    windows = []
+    for chat_jid, chat_intervals in intervals.items():
+        chat_intervals.sort()
+        merged = [chat_intervals[0]]
+        for low, high, hit_order in chat_intervals[1:]:
+            last = merged[-1]
+            if low <= last[1]:
+                last[1] = max(last[1], high)
+                last[2] = min(last[2], hit_order)
+            else:
+                merged.append([low, high, hit_order])
+        windows.extend((hit_order, chat_jid, low, high) for low, high, hit_order in merged)
+    windows.sort()
+    
+    hit_keys = {(hit.chat_jid, hit.id) for hit in hits}
+    result = []
+    for _, chat_jid, low, high in windows:
+        numbered = by_chat[chat_jid]
+        for number in range(low, high + 1):
+            message = numbered.get(number)
+            if message is not None:
+                message.is_context = (message.chat_jid, message.id) not in hit_keys
+                result.append(message)
+    return result
 
 def list_messages(
     after: Optional[str] = None,
@@ -455,214 +760,284 @@ def list_messages(
     context_before: int = 1,
     context_after: int = 1,
     max_results: int = 100,
-    force_load: bool = False
+    force_load: bool = False,
+    sort_by: str = "timestamp",
+    cursor: Optional[str] = None
 ) -> List[Message]:
-    """Get messages matching the specified criteria with optional context."""
+    """Get messages matching the specified criteria with optional context.
+
+    `query` is matched against the full-text index once it is built (words
+    are prefix-matched, "quoted text" is an exact phrase) and falls back to a
+    substring scan until then. With `sort_by="relevance"` full-text matches
+    are ranked by bm25 instead of newest first.
+
+    Use list_messages_page to also get the cursor of the next page.
+    """
+    return list_messages_page(
+        after=after,
+        before=before,
+        sender_phone_number=sender_phone_number,
+        chat_jid=chat_jid,
+        query=query,
+        limit=limit,
+        page=page,
+        include_context=include_context,
+        context_before=context_before,
+        context_after=context_after,
+        max_results=max_results,
+        force_load=force_load,
+        sort_by=sort_by,
+        cursor=cursor
+    ).messages
+
+def list_messages_page(
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    sender_phone_number: Optional[str] = None,
+    chat_jid: Optional[str] = None,
+    query: Optional[str] = None,
+    limit: int = 20,
+    page: int = 0,
+    include_context: bool = False,
+    context_before: int = 1,
+    context_after: int = 1,
+    max_results: int = 100,
+    force_load: bool = False,
+    sort_by: str = "timestamp",
+    cursor: Optional[str] = None
+) -> MessagePage:
+    """Get a page of messages plus the cursor of the following page.
+
+    Pass the returned `next_cursor` back as `cursor` to continue after the
+    last message instead of using `page`: the page then starts from the
+    last (timestamp, id) seen, so deep pages cost the same as the first one.
+    `next_cursor` is None on the last page.
+
+    With `include_context`, each match comes with `context_before` and
+    `context_after` messages of its chat (flagged is_context), fetched in a
+    single query; overlapping windows are merged and returned chronologically.
+
+    Raises ValueError for an invalid date, a cursor from another listing or
+    a cursor whose message is gone, rather than returning an empty page.
+    """
     try:
         # Check if at least one filter is specified or load is forced
         if not any([after, before, sender_phone_number, chat_jid, query, force_load]):
             print("WARNING: No filters specified and force_load=False. No messages will be loaded.")
-            return []
+            return MessagePage([])
         
         # Quick connection test - if DB doesn't exist, return empty
         if not os.path.exists(MESSAGES_DB_PATH):
             print(f"WARNING: Database not found at {MESSAGES_DB_PATH}")
-            return []
+            return MessagePage([])
         
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
+        conn = db.get_connection(MESSAGES_DB_PATH)
+        
+        # Integer timestamps from the sidecar once they are up to date; a
+        # cursor keeps the order its earlier pages used
+        kind = _cursor_kind(cursor) if cursor else None
+        position = None
+        if kind in (_TEXT_ORDER.cursor_kind, _TS_ORDER.cursor_kind):
+            position = _decode_cursor(cursor, kind)
+        order, position = time_order_after(conn, kind, position)
+        
+        # Full-text search through the sidecar index when it is up to date
+        match = None
+        if query:
+            if _sidecar.is_ready(MESSAGES_FTS.name) and _sidecar.attach(conn):
+                match = fts_query(query)
         
         # Build base query with optimized indexes
-        query_parts = ["SELECT messages.timestamp, messages.sender, chats.name, messages.content, messages.is_from_me, chats.jid, messages.id, messages.media_type FROM messages"]
+        query_parts = [f"SELECT {MESSAGE_COLUMNS} FROM messages"]
         query_parts.append("JOIN chats ON messages.chat_jid = chats.jid")
+        if order.join:
+            query_parts.append(order.join)
         where_clauses = []
         params = []
         
+        if match:
+            query_parts.append("JOIN side.messages_fts AS fts ON fts.rowid = messages.rowid")
+            where_clauses.append("fts.messages_fts MATCH ?")
+            params.append(match)
+        
         # Add filters with proper indexing
-        if after:
-            try:
-                after_date = datetime.fromisoformat(after) if isinstance(after, str) else after
-            except ValueError:
-                raise ValueError(f"Invalid date format for 'after': {after}. Please use ISO-8601 format.")
-            
-            where_clauses.append("messages.timestamp > ?")
-            params.append(after_date)
-
-        if before:
-            try:
-                before_date = datetime.fromisoformat(before) if isinstance(before, str) else before
-            except ValueError:
-                raise ValueError(f"Invalid date format for 'before': {before}. Please use ISO-8601 format.")
+        filter_clauses, filter_params = message_filters(order, after, before, sender_phone_number, chat_jid)
+        where_clauses.extend(filter_clauses)
+        params.extend(filter_params)
             
-            where_clauses.append("messages.timestamp < ?")
-            params.append(before_date)
-
-        if sender_phone_number:
-            where_clauses.append("messages.sender = ?")
-            params.append(sender_phone_number)
-            
-        if chat_jid:
-            where_clauses.append("messages.chat_jid = ?")
-            params.append(chat_jid)
-            
-        if query:
+        if query and not match:
             where_clauses.append("LOWER(messages.content) LIKE LOWER(?)")
             params.append(f"%{query}%")
             
+        # Keyset pagination: continue after the last row of the previous page.
+        # bm25 ranks shift as the index grows, so relevance pages keep an offset.
+        by_relevance = bool(match) and sort_by == "relevance"
+        kind = "relevance" if by_relevance else order.cursor_kind
+        time_column, key_column = order.column(order.time), order.column(order.key)
+        offset = page * limit
+        if cursor and by_relevance:
+            offset, = _decode_cursor(cursor, kind)
+        elif cursor:
+            clause, values = keyset_clause(time_column, key_column, position or _decode_cursor(cursor, kind),
+                                            descending=True)
+            where_clauses.append(clause)
+            params.extend(values)
+            offset = 0
+            
         if where_clauses:
             query_parts.append("WHERE " + " AND ".join(where_clauses))
             
         # Add pagination with stricter limits for performance
-        offset = page * limit
         actual_limit = min(limit, max_results, 50)  # Hard cap at 50 for performance
-        query_parts.append("ORDER BY messages.timestamp DESC")
+        if by_relevance:
+            query_parts.append(f"ORDER BY fts.rank, {time_column} DESC")
+        else:
+            query_parts.append(f"ORDER BY {time_column} DESC, {key_column} DESC")
+        # One extra row tells whether there is a next page
         query_parts.append("LIMIT ? OFFSET ?")
-        params.extend([actual_limit, offset])
+        params.extend([actual_limit + 1, offset])
         
-        cursor.execute(" ".join(query_parts), tuple(params))
-        messages = cursor.fetchall()
+        cursor = conn.cursor()
+        cursor.row_factory = Message.from_row
+        result = cursor.execute(" ".join(query_parts), tuple(params)).fetchall()
+        
+        next_cursor = None
+        if len(result) > actual_limit > 0:
+            result = result[:actual_limit]
+            if by_relevance:
+                next_cursor = _encode_cursor(kind, [offset + actual_limit])
+            elif order.epoch:
+                next_cursor = _encode_cursor(kind, list(conn.execute(
+                    "SELECT ts_ms, rowid FROM side.message_ts WHERE rowid = "
+                    "(SELECT rowid FROM messages WHERE id = ? AND chat_jid = ?)",
+                    (result[-1].id, result[-1].chat_jid)
+                ).fetchone()))
+            else:
+                next_cursor = _encode_cursor(kind, [result[-1].raw_timestamp, result[-1].id])
         
-        # Convert to Message objects
-        result = []
-        for msg in messages:
-            timestamp, sender, chat_name, content, is_from_me, chat_jid, msg_id, media_type = msg
-            
-            # Parse timestamp - handle both string and datetime
-            if isinstance(timestamp, str):
-                try:
-                    timestamp = datetime.fromisoformat(timestamp)
-                except ValueError:
-                    timestamp = datetime.now()
-            
-            message_obj = Message(
-                timestamp=timestamp,
-                sender=sender,
-                content=content,
-                is_from_me=bool(is_from_me),
-                chat_jid=chat_jid,
-                id=msg_id,
-                chat_name=chat_name,
-                media_type=media_type
-            )
-            result.append(message_obj)
+        # Surrounding messages for every match, fetched in one windowed query
+        if include_context and result and (context_before > 0 or context_after > 0):
+            result = _with_context(conn, result, context_before, context_after, order)
         
-        conn.close()
-        return result
+        return MessagePage(result, next_cursor)
         
+    except ValueError:
+        # Bad cursor or date: an empty page would read as the end of the history
+        raise
     except Exception as e:
         print(f"Error in list_messages: {e}")
-        return []
+        return MessagePage([])
 
 def get_message_context(message_id: str, before: int = 5, after: int = 5) -> Optional[MessageContext]:
     """Get context around a specific message."""
+    return get_message_contexts([message_id], before, after).get(message_id)
+
+def get_message_contexts(message_ids: List[str], before: int = 5, after: int = 5) -> Dict[str, MessageContext]:
+    """
+    Get the context around many messages at once.
+
+    Targets are resolved with one query and all their windows with another
+    (see _fetch_context_windows); messages shared by overlapping windows are
+    the same Message objects.
+
+    Args:
+        message_ids (List[str]): IDs of the target messages
+        before (int, optional): Messages to include before each target
+        after (int, optional): Messages to include after each target
+
+    Returns:
+        Dict[str, MessageContext]: Contexts keyed by message ID; unknown IDs are omitted
+    """
     try:
         if not os.path.exists(MESSAGES_DB_PATH):
             print(f"WARNING: Database not found at {MESSAGES_DB_PATH}")
-            return None
-        
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
-        
-        # First, find the target message
-        cursor.execute("""
-            SELECT messages.timestamp, messages.sender, chats.name, messages.content, 
-                   messages.is_from_me, chats.jid, messages.id, messages.media_type
-            FROM messages
-            JOIN chats ON messages.chat_jid = chats.jid
-            WHERE messages.id = ?
-        """, (message_id,))
-        
-        target_result = cursor.fetchone()
-        if not target_result:
-            conn.close()
-            return None
-        
-        # Create target message object
-        timestamp, sender, chat_name, content, is_from_me, chat_jid, msg_id, media_type = target_result
-        if isinstance(timestamp, str):
-            timestamp = datetime.fromisoformat(timestamp)
-        
-        target_message = Message(
-            timestamp=timestamp,
-            sender=sender,
-            content=content,
-            is_from_me=bool(is_from_me),
-            chat_jid=chat_jid,
-            id=msg_id,
-            chat_name=chat_name,
-            media_type=media_type
+            return {}
+        
+        message_ids = list(dict.fromkeys(message_ids))
+        if not message_ids:
+            return {}
+        
+        conn = db.get_connection(MESSAGES_DB_PATH)
+        
+        # Find the chat of every target message
+        anchors = {}
+        for start in range(0, len(message_ids), CONTEXT_QUERY_BATCH):
+            batch = message_ids[start:start + CONTEXT_QUERY_BATCH]
+            cursor = conn.execute(f"""
+                SELECT messages.id, messages.chat_jid
+                FROM messages
+                WHERE messages.id IN ({", ".join("?" * len(batch))})
+            """, batch)
+            for msg_id, chat_jid in cursor:
+                anchors.setdefault(msg_id, chat_jid)
+        
+        before, after = max(before, 0), max(after, 0)
+        by_chat, anchor_numbers = _fetch_context_windows(
+            conn, [(chat_jid, msg_id) for msg_id, chat_jid in anchors.items()], before, after, _time_order(conn)
         )
         
-        # Get messages before
-        cursor.execute("""
-            SELECT messages.timestamp, messages.sender, chats.name, messages.content,
-                   messages.is_from_me, chats.jid, messages.id, messages.media_type
-            FROM messages
-            JOIN chats ON messages.chat_jid = chats.jid
-            WHERE messages.chat_jid = ? AND messages.timestamp < ?
-            ORDER BY messages.timestamp DESC
-            LIMIT ?
-        """, (chat_jid, timestamp, before))
-        
-        before_messages = []
-        for msg in cursor.fetchall():
-            ts, sender, chat_name, content, is_from_me, chat_jid, msg_id, media_type = msg
-            if isinstance(ts, str):
-                ts = datetime.fromisoformat(ts)
-            
-            before_messages.append(Message(
-                timestamp=ts,
-                sender=sender,
-                content=content,
-                is_from_me=bool(is_from_me),
-                chat_jid=chat_jid,
-                id=msg_id,
-                chat_name=chat_name,
-                media_type=media_type
-            ))
-        
-        before_messages.reverse()  # Reverse to get chronological order
-        
-        # Get messages after
-        cursor.execute("""
-            SELECT messages.timestamp, messages.sender, chats.name, messages.content,
-                   messages.is_from_me, chats.jid, messages.id, messages.media_type
-            FROM messages
-            JOIN chats ON messages.chat_jid = chats.jid
-            WHERE messages.chat_jid = ? AND messages.timestamp > ?
-            ORDER BY messages.timestamp ASC
-            LIMIT ?
-        """, (chat_jid, timestamp, after))
-        
-        after_messages = []
-        for msg in cursor.fetchall():
-            ts, sender, chat_name, content, is_from_me, chat_jid, msg_id, media_type = msg
-            if isinstance(ts, str):
-                ts = datetime.fromisoformat(ts)
-            
-            after_messages.append(Message(
-                timestamp=ts,
-                sender=sender,
-                content=content,
-                is_from_me=bool(is_from_me),
-                chat_jid=chat_jid,
-                id=msg_id,
-                chat_name=chat_name,
-                media_type=media_type
-            ))
-        
-        conn.close()
-        
-        return MessageContext(
-            message=target_message,
-            before=before_messages,
-            after=after_messages
-        )
+        contexts = {}
+        for msg_id in message_ids:
+            key = (anchors.get(msg_id), msg_id)
+            number = anchor_numbers.get(key)
+            if number is None:
+                continue
+            numbered = by_chat[key[0]]
+            contexts[msg_id] = MessageContext(
+                message=numbered[number],
+                before=[numbered[n] for n in range(number - before, number) if n in numbered],
+                after=[numbered[n] for n in range(number + 1, number + after + 1) if n in numbered]
+            )
+        return contexts
         
     except Exception as e:
-        print(f"Error in get_message_context: {e}")
+        print(f"Error in get_message_contexts: {e}")
+        return {}
+
+def _send_result(response) -> Tuple[bool, str]:
+    """Interpret the bridge's reply to /send (requests or httpx response)."""
+    # Check if the request was successful
+    if response.status_code == 200:
+        try:
+            result = response.json()
+        except json.JSONDecodeError:
+            return False, f"Error parsing response: {response.text}"
+        return result.get("success", False), result.get("message", "Unknown response")
+    else:
+        return False, f"Error: HTTP {response.status_code} - {response.text}"
+
+def _download_result(response) -> Optional[str]:
+    """Interpret the bridge's reply to /download, returning the file path."""
+    if response.status_code == 200:
+        try:
+            result = response.json()
+        except json.JSONDecodeError:
+            print(f"Error parsing response: {response.text}")
+            return None
+        if result.get("success", False):
+            path = result.get("path")
+            print(f"Media downloaded successfully: {path}")
+            return path
+        else:
+            print(f"Download failed: {result.get('message', 'Unknown error')}")
+            return None
+    else:
+        print(f"Error: HTTP {response.status_code} - {response.text}")
         return None
 
+def _check_media(recipient: str, media_path: str) -> Optional[str]:
+    """Validate the arguments of a media send, returning an error message if invalid."""
+    if not recipient:
+        return "Recipient must be provided"
+    
+    if not media_path:
+        return "Media path must be provided"
+    
+    if not os.path.isfile(media_path):
+        return f"Media file not found: {media_path}"
+    
+    return None
+
 def send_message(recipient: str, message: str) -> Tuple[bool, str]:
     """Send a WhatsApp message to a person or group."""
     try:
@@ -670,60 +1045,43 @@ def send_message(recipient: str, message: str) -> Tuple[bool, str]:
         if not recipient:
             return False, "Recipient must be provided"
         
-        url = f"{WHATSAPP_API_BASE_URL}/send"
         payload = {
             "recipient": recipient,
             "message": message,
         }
         
-        response = requests.post(url, json=payload)
-        
-        # Check if the request was successful
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "Unknown response")
-        else:
-            return False, f"Error: HTTP {response.status_code} - {response.text}"
+        response = _bridge.post("send", payload)
+        return _send_result(response)
             
+    except BridgeUnavailable as e:
+        return False, str(e)
     except requests.RequestException as e:
         return False, f"Request error: {str(e)}"
-    except json.JSONDecodeError:
-        return False, f"Error parsing response: {response.text}"
     except Exception as e:
         return False, f"Unexpected error: {str(e)}"
 
-def send_file(recipient: str, media_path: str) -> Tuple[bool, str]:
-    """Send a file via WhatsApp."""
+def send_file(recipient: str, media_path: str, caption: str = "") -> Tuple[bool, str]:
+    """Send a file via WhatsApp, optionally with a caption."""
     try:
         # Validate input
-        if not recipient:
-            return False, "Recipient must be provided"
-        
-        if not media_path:
-            return False, "Media path must be provided"
+        error = _check_media(recipient, media_path)
+        if error:
+            return False, error
         
-        if not os.path.isfile(media_path):
-            return False, f"Media file not found: {media_path}"
-        
-        url = f"{WHATSAPP_API_BASE_URL}/send"
         payload = {
             "recipient": recipient,
             "media_path": media_path
         }
+        if caption:
+            payload["message"] = caption
         
-        response = requests.post(url, json=payload)
-        
-        # Check if the request was successful
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "Unknown response")
-        else:
-            return False, f"Error: HTTP {response.status_code} - {response.text}"
+        response = _bridge.post("send", payload)
+        return _send_result(response)
             
+    except BridgeUnavailable as e:
+        return False, str(e)
     except requests.RequestException as e:
         return False, f"Request error: {str(e)}"
-    except json.JSONDecodeError:
-        return False, f"Error parsing response: {response.text}"
     except Exception as e:
         return False, f"Unexpected error: {str(e)}"
 
@@ -731,106 +1089,497 @@ def send_audio_message(recipient: str, media_path: str) -> Tuple[bool, str]:
     """Send an audio file as a WhatsApp audio message."""
     try:
         # Validate input
-        if not recipient:
-            return False, "Recipient must be provided"
-        
-        if not media_path:
-            return False, "Media path must be provided"
-        
-        if not os.path.isfile(media_path):
-            return False, f"Media file not found: {media_path}"
+        error = _check_media(recipient, media_path)
+        if error:
+            return False, error
 
-        if not media_path.endswith(".ogg"):
-            try:
-                media_path = audio.convert_to_opus_ogg_temp(media_path)
-            except Exception as e:
-                return False, f"Error converting file to opus ogg. You likely need to install ffmpeg: {str(e)}"
+        try:
+            media_path = audio.prepare_voice_note(media_path)
+        except Exception as e:
+            return False, f"Error converting file to opus ogg. You likely need to install ffmpeg: {str(e)}"
         
-        url = f"{WHATSAPP_API_BASE_URL}/send"
         payload = {
             "recipient": recipient,
             "media_path": media_path
         }
         
-        response = requests.post(url, json=payload)
-        
-        # Check if the request was successful
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "Unknown response")
-        else:
-            return False, f"Error: HTTP {response.status_code} - {response.text}"
+        response = _bridge.post("send", payload)
+        return _send_result(response)
             
+    except BridgeUnavailable as e:
+        return False, str(e)
     except requests.RequestException as e:
         return False, f"Request error: {str(e)}"
-    except json.JSONDecodeError:
-        return False, f"Error parsing response: {response.text}"
     except Exception as e:
         return False, f"Unexpected error: {str(e)}"
 
+def get_media_info(message_id: str, chat_jid: str) -> Optional[MediaInfo]:
+    """Media metadata the bridge stored for a message, or None if it has none."""
+    try:
+        conn = db.get_connection(MESSAGES_DB_PATH)
+        row = conn.execute("""
+            SELECT media_type, filename, file_sha256, file_length
+            FROM messages
+            WHERE id = ? AND chat_jid = ?
+        """, (message_id, chat_jid)).fetchone()
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        return None
+    if row is None or not row[0]:
+        return None
+    return MediaInfo(
+        message_id=message_id,
+        chat_jid=chat_jid,
+        media_type=row[0],
+        filename=row[1],
+        file_sha256=bytes(row[2]) if row[2] else None,
+        file_length=row[3]
+    )
+
 def download_media(message_id: str, chat_jid: str) -> Optional[str]:
-    """Download media from a message and return the local file path."""
+    """
+    Download media from a message and return the local file path.
+
+    Files are served from the media cache when present; concurrent calls for
+    the same message share a single bridge download.
+    """
+    info = get_media_info(message_id, chat_jid)
+    if info is not None:
+        path = _media_cache.get(info)
+        if path:
+            return path
+    return _downloads.do((message_id, chat_jid), lambda: _download_to_cache(message_id, chat_jid, info))
+
+def _download_to_cache(message_id: str, chat_jid: str, info: Optional[MediaInfo]) -> Optional[str]:
+    # A download that finished just before this flight started is already cached
+    if info is not None:
+        path = _media_cache.get(info)
+        if path:
+            return path
+
+    # Second attempt: the bad file was deleted, so the bridge fetches it again
+    for _ in range(2):
+        path = _request_download(message_id, chat_jid)
+        if path is None or info is None:
+            return path
+        try:
+            return _media_cache.put(info, path)
+        except MediaMismatch as e:
+            print(str(e))
+        except OSError as e:
+            print(f"Error caching media: {e}")
+            return path
+    return None
+
+def _request_download(message_id: str, chat_jid: str) -> Optional[str]:
     try:
-        url = f"{WHATSAPP_API_BASE_URL}/download"
         payload = {
             "message_id": message_id,
             "chat_jid": chat_jid
         }
         
-        response = requests.post(url, json=payload)
-        
-        if response.status_code == 200:
-            result = response.json()
-            if result.get("success", False):
-                path = result.get("path")
-                print(f"Media downloaded successfully: {path}")
-                return path
-            else:
-                print(f"Download failed: {result.get('message', 'Unknown error')}")
-                return None
-        else:
-            print(f"Error: HTTP {response.status_code} - {response.text}")
-            return None
+        response = _bridge.post("download", payload)
+        return _download_result(response)
             
+    except BridgeUnavailable as e:
+        print(str(e))
+        return None
     except requests.RequestException as e:
         print(f"Request error: {str(e)}")
         return None
-    except json.JSONDecodeError:
-        print(f"Error parsing response: {response.text}")
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        return None
+
+async def send_message_async(recipient: str, message: str) -> Tuple[bool, str]:
+    """Async send_message over the shared bridge client."""
+    try:
+        # Validate input
+        if not recipient:
+            return False, "Recipient must be provided"
+        
+        response = await _bridge.apost("send", {
+            "recipient": recipient,
+            "message": message,
+        })
+        return _send_result(response)
+            
+    except BridgeUnavailable as e:
+        return False, str(e)
+    except httpx.HTTPError as e:
+        return False, f"Request error: {str(e)}"
+    except Exception as e:
+        return False, f"Unexpected error: {str(e)}"
+
+async def send_file_async(recipient: str, media_path: str, caption: str = "") -> Tuple[bool, str]:
+    """Async send_file over the shared bridge client."""
+    try:
+        # Validate input
+        error = _check_media(recipient, media_path)
+        if error:
+            return False, error
+        
+        payload = {
+            "recipient": recipient,
+            "media_path": media_path
+        }
+        if caption:
+            payload["message"] = caption
+        
+        response = await _bridge.apost("send", payload)
+        return _send_result(response)
+            
+    except BridgeUnavailable as e:
+        return False, str(e)
+    except httpx.HTTPError as e:
+        return False, f"Request error: {str(e)}"
+    except Exception as e:
+        return False, f"Unexpected error: {str(e)}"
+
+async def send_audio_message_async(recipient: str, media_path: str) -> Tuple[bool, str]:
+    """Async send_audio_message; the ffmpeg conversion runs on the media pool."""
+    try:
+        # Validate input
+        error = _check_media(recipient, media_path)
+        if error:
+            return False, error
+
+        try:
+            media_path = await run_media(audio.prepare_voice_note, media_path)
+        except Exception as e:
+            return False, f"Error converting file to opus ogg. You likely need to install ffmpeg: {str(e)}"
+        
+        response = await _bridge.apost("send", {
+            "recipient": recipient,
+            "media_path": media_path
+        })
+        return _send_result(response)
+            
+    except BridgeUnavailable as e:
+        return False, str(e)
+    except httpx.HTTPError as e:
+        return False, f"Request error: {str(e)}"
+    except Exception as e:
+        return False, f"Unexpected error: {str(e)}"
+
+async def download_media_async(message_id: str, chat_jid: str) -> Optional[str]:
+    """Async download_media over the shared bridge client."""
+    info = await run_blocking(get_media_info, message_id, chat_jid)
+    if info is not None:
+        path = _media_cache.get(info)
+        if path:
+            return path
+    return await _downloads.ado((message_id, chat_jid), lambda: _adownload_to_cache(message_id, chat_jid, info))
+
+async def _adownload_to_cache(message_id: str, chat_jid: str, info: Optional[MediaInfo]) -> Optional[str]:
+    if info is not None:
+        path = _media_cache.get(info)
+        if path:
+            return path
+
+    for _ in range(2):
+        path = await _arequest_download(message_id, chat_jid)
+        if path is None or info is None:
+            return path
+        try:
+            # Hashing a large video would stall the event loop
+            return await run_media(_media_cache.put, info, path)
+        except MediaMismatch as e:
+            print(str(e))
+        except OSError as e:
+            print(f"Error caching media: {e}")
+            return path
+    return None
+
+async def _arequest_download(message_id: str, chat_jid: str) -> Optional[str]:
+    try:
+        response = await _bridge.apost("download", {
+            "message_id": message_id,
+            "chat_jid": chat_jid
+        })
+        return _download_result(response)
+            
+    except BridgeUnavailable as e:
+        print(str(e))
+        return None
+    except httpx.HTTPError as e:
+        print(f"Request error: {str(e)}")
         return None
     except Exception as e:
         print(f"Unexpected error: {str(e)}")
         return None
 
+def list_media_messages(
+    chat_jid: Optional[str] = None,
+    media_type: Optional[str] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = PREFETCH_LIMIT
+) -> List[MediaInfo]:
+    """
+    Media messages matching the filters, newest first.
+
+    Args:
+        chat_jid (str, optional): Only this chat
+        media_type (str, optional): "image", "video", "audio" or "document"
+        after (str, optional): ISO-8601 date; only messages after it
+        before (str, optional): ISO-8601 date; only messages before it
+        limit (int, optional): Maximum number of messages
+
+    Returns:
+        List[MediaInfo]: Metadata of each media message
+    """
+    after_date = _parse_date(after, "after") if after else None
+    before_date = _parse_date(before, "before") if before else None
+
+    try:
+        conn = db.get_connection(MESSAGES_DB_PATH)
+        order = _time_order(conn)
+        time_column = order.column(order.time)
+        where_clauses = ["messages.media_type IS NOT NULL", "messages.media_type != ''"]
+        params = []
+        if chat_jid:
+            where_clauses.append(f"{order.column('chat_jid')} = ?")
+            params.append(chat_jid)
+        if media_type:
+            where_clauses.append("messages.media_type = ?")
+            params.append(media_type)
+        if after_date:
+            where_clauses.append(f"{time_column} > ?")
+            params.append(order.bound(after_date))
+        if before_date:
+            where_clauses.append(f"{time_column} < ?")
+            params.append(order.bound(before_date))
+        params.append(limit)
+
+        rows = conn.execute(f"""
+            SELECT messages.id, messages.chat_jid, messages.media_type, messages.filename,
+                   messages.file_sha256, messages.file_length
+            FROM messages
+            {order.join}
+            WHERE {" AND ".join(where_clauses)}
+            ORDER BY {time_column} DESC, {order.column(order.key)} DESC
+            LIMIT ?
+        """, params).fetchall()
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        return []
+
+    return [
+        MediaInfo(
+            message_id=row[0],
+            chat_jid=row[1],
+            media_type=row[2],
+            filename=row[3],
+            file_sha256=bytes(row[4]) if row[4] else None,
+            file_length=row[5]
+        )
+        for row in rows
+    ]
+
+async def prefetch_media(
+    chat_jid: Optional[str] = None,
+    media_type: Optional[str] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = PREFETCH_LIMIT,
+    concurrency: Optional[int] = None,
+    progress: Optional[Callable[[int, int], Awaitable[None]]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Download the media of many messages into the media cache.
+
+    Files already in the cache are skipped, so an interrupted prefetch can
+    simply be run again.
+
+    Args:
+        chat_jid, media_type, after, before, limit: Filters, as in list_media_messages
+        concurrency (int, optional): Parallel bridge downloads (default PREFETCH_CONCURRENCY)
+        progress (callable, optional): Awaited with (done, total) after each item
+
+    Returns:
+        List[Dict[str, Any]]: One {"message_id", "chat_jid", "media_type", "status",
+        "file_path"} per message, newest first; status is "cached", "downloaded"
+        or "failed"
+    """
+    infos = await run_blocking(list_media_messages, chat_jid, media_type, after, before, limit)
+    semaphore = asyncio.Semaphore(max(1, concurrency or PREFETCH_CONCURRENCY))
+    total = len(infos)
+    done = 0
+
+    async def fetch(info: MediaInfo) -> Dict[str, Any]:
+        nonlocal done
+        path = _media_cache.get(info)
+        status = "cached"
+        if not path:
+            async with semaphore:
+                path = await _downloads.ado((info.message_id, info.chat_jid),
+                                            lambda: _adownload_to_cache(info.message_id, info.chat_jid, info))
+            status = "downloaded" if path else "failed"
+        done += 1
+        if progress is not None:
+            await progress(done, total)
+        return {
+            "message_id": info.message_id,
+            "chat_jid": info.chat_jid,
+            "media_type": info.media_type,
+            "status": status,
+            "file_path": path
+        }
+
+    return list(await asyncio.gather(*(fetch(info) for info in infos)))
+
+def _recipient_key(recipient: str) -> str:
+    """Same key for a phone number and its user JID, so both share one send queue."""
+    recipient = recipient.strip()
+    if recipient.endswith("@s.whatsapp.net"):
+        return recipient[:-len("@s.whatsapp.net")]
+    return recipient
+
+async def _send_batch_item(item: Dict[str, Any]) -> Tuple[bool, str]:
+    recipient = item.get("recipient") or ""
+    message = item.get("message") or ""
+    media_path = item.get("media_path")
+    if media_path:
+        if item.get("as_audio"):
+            return await send_audio_message_async(recipient, media_path)
+        return await send_file_async(recipient, media_path, caption=message)
+    if not message:
+        return False, "Item needs a message or a media_path"
+    return await send_message_async(recipient, message)
+
+async def send_messages_batch(
+    items: List[Dict[str, Any]],
+    concurrency: Optional[int] = None,
+    rate_per_second: Optional[float] = None
+) -> List[Dict[str, Any]]:
+    """
+    Send many messages through the bridge, several recipients at a time.
+
+    Items for the same recipient are sent one after another in list order;
+    different recipients proceed concurrently, at most `concurrency` sends
+    in flight and `rate_per_second` sends started per second overall.
+
+    Args:
+        items (List[Dict[str, Any]]): Dicts with "recipient" and "message"
+            and/or "media_path" (the message becomes the caption), plus
+            optional "as_audio" to send the media as a voice message
+        concurrency (int, optional): Maximum sends in flight
+            (default SEND_BATCH_CONCURRENCY)
+        rate_per_second (float, optional): Maximum sends started per second,
+            0 for no limit (default SEND_RATE_PER_SECOND)
+
+    Returns:
+        List[Dict[str, Any]]: One {"index", "recipient", "success", "message"}
+        per item, in input order
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency or SEND_BATCH_CONCURRENCY))
+    bucket = AsyncTokenBucket(SEND_RATE_PER_SECOND if rate_per_second is None else rate_per_second)
+    results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+
+    queues: Dict[str, List[int]] = {}
+    for index, item in enumerate(items):
+        queues.setdefault(_recipient_key(item.get("recipient") or ""), []).append(index)
+
+    async def drain(indices: List[int]):
+        for index in indices:
+            async with semaphore:
+                await bucket.acquire()
+                success, status_message = await _send_batch_item(items[index])
+            results[index] = {
+                "index": index,
+                "recipient": items[index].get("recipient"),
+                "success": success,
+                "message": status_message
+            }
+
+    await asyncio.gather(*(drain(indices) for indices in queues.values()))
+    return results
+
+def _chat_columns(conn: sqlite3.Connection, include_last_message: bool = True) -> Tuple[str, str]:
+    """
+    SELECT columns and JOIN for chat rows, in the order _chat_from_row expects.
+
+    The last message and counters come from the sidecar chat_summary table
+    once it has caught up (one primary-key lookup per chat); until then the
+    last message is joined from messages and the counters are NULL.
+    """
+    columns = "chats.jid, chats.name, chats.last_message_time"
+    if not include_last_message:
+        return columns + ", NULL, NULL, NULL, NULL, NULL, NULL", ""
+    
+    _sidecar.ensure_fresh()
+    if _sidecar.is_ready(CHAT_SUMMARY.name) and _sidecar.attach(conn):
+        return (
+            columns + """,
+                chat_summary.last_content, chat_summary.last_sender, chat_summary.last_is_from_me,
+                chat_summary.last_message_id, chat_summary.message_count, chat_summary.unanswered_count""",
+            "LEFT JOIN side.chat_summary AS chat_summary ON chat_summary.chat_jid = chats.jid"
+        )
+    return (
+        columns + """,
+            messages.content, messages.sender, messages.is_from_me,
+            messages.id, NULL, NULL""",
+        """LEFT JOIN messages ON chats.jid = messages.chat_jid
+            AND chats.last_message_time = messages.timestamp"""
+    )
+
+def _chat_from_row(row) -> Chat:
+    """Build a Chat from a row selected with _chat_columns."""
+    jid, name, last_message_time, last_message, last_sender, last_is_from_me, last_message_id, message_count, unanswered_count = row
+    
+    return Chat(
+        jid=jid,
+        name=name,
+        last_message_time=last_message_time,
+        last_message=last_message,
+        last_sender=last_sender,
+        last_is_from_me=bool(last_is_from_me) if last_is_from_me is not None else None,
+        last_message_id=last_message_id,
+        message_count=message_count,
+        unanswered_count=unanswered_count
+    )
+
 def list_chats(
     query: Optional[str] = None,
     limit: int = 20,
     page: int = 0,
     include_last_message: bool = True,
-    sort_by: str = "last_active"
+    sort_by: str = "last_active",
+    cursor: Optional[str] = None
 ) -> List[Chat]:
-    """Get chats matching the specified criteria."""
+    """Get chats matching the specified criteria.
+
+    Use list_chats_page to also get the cursor of the next page.
+    """
+    return list_chats_page(
+        query=query,
+        limit=limit,
+        page=page,
+        include_last_message=include_last_message,
+        sort_by=sort_by,
+        cursor=cursor
+    ).chats
+
+def list_chats_page(
+    query: Optional[str] = None,
+    limit: int = 20,
+    page: int = 0,
+    include_last_message: bool = True,
+    sort_by: str = "last_active",
+    cursor: Optional[str] = None
+) -> ChatPage:
+    """Get a page of chats plus the cursor of the following page.
+
+    The cursor holds the last (last_message_time, jid) or (name, jid) seen,
+    so passing it back as `cursor` costs O(limit) at any depth.
+    """
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
+        conn = db.get_connection(MESSAGES_DB_PATH)
         
         # Build base query
-        query_parts = ["""
-            SELECT 
-                chats.jid,
-                chats.name,
-                chats.last_message_time,
-                messages.content as last_message,
-                messages.sender as last_sender,
-                messages.is_from_me as last_is_from_me
-            FROM chats
-        """]
-        
-        if include_last_message:
-            query_parts.append("""
-                LEFT JOIN messages ON chats.jid = messages.chat_jid 
-                AND chats.last_message_time = messages.timestamp
-            """)
+        columns, join = _chat_columns(conn, include_last_message)
+        query_parts = [f"SELECT {columns} FROM chats", join]
             
         where_clauses = []
         params = []
@@ -838,96 +1587,65 @@ def list_chats(
         if query:
             where_clauses.append("(LOWER(chats.name) LIKE LOWER(?) OR chats.jid LIKE ?)")
             params.extend([f"%{query}%", f"%{query}%"])
+        
+        # Keyset pagination: continue after the last chat of the previous page
+        by_activity = sort_by == "last_active"
+        sort_column = "chats.last_message_time" if by_activity else "chats.name"
+        offset = page * limit
+        if cursor:
+            clause, values = keyset_clause(sort_column, "chats.jid", _decode_cursor(cursor, sort_by),
+                                            descending=by_activity, nullable=True)
+            where_clauses.append(clause)
+            params.extend(values)
+            offset = 0
             
         if where_clauses:
             query_parts.append("WHERE " + " AND ".join(where_clauses))
             
         # Add sorting
-        order_by = "chats.last_message_time DESC" if sort_by == "last_active" else "chats.name"
+        order_by = "chats.last_message_time DESC, chats.jid DESC" if by_activity else "chats.name, chats.jid"
         query_parts.append(f"ORDER BY {order_by}")
         
-        # Add pagination
-        offset = page * limit
+        # Add pagination; one extra row tells whether there is a next page
         query_parts.append("LIMIT ? OFFSET ?")
-        params.extend([limit, offset])
+        params.extend([limit + 1, offset])
+        
+        chats = conn.execute(" ".join(query_parts), tuple(params)).fetchall()
         
-        cursor.execute(" ".join(query_parts), tuple(params))
-        chats = cursor.fetchall()
+        next_cursor = None
+        if len(chats) > limit > 0:
+            chats = chats[:limit]
+            last_jid, last_name, last_time = chats[-1][:3]
+            next_cursor = _encode_cursor(sort_by, [last_time if by_activity else last_name, last_jid])
         
         # Convert to Chat objects
-        result = []
-        for chat_data in chats:
-            jid, name, last_message_time, last_message, last_sender, last_is_from_me = chat_data
-            
-            # Parse timestamp
-            if isinstance(last_message_time, str):
-                try:
-                    last_message_time = datetime.fromisoformat(last_message_time)
-                except ValueError:
-                    last_message_time = None
-            
-            chat = Chat(
-                jid=jid,
-                name=name,
-                last_message_time=last_message_time,
-                last_message=last_message,
-                last_sender=last_sender,
-                last_is_from_me=bool(last_is_from_me) if last_is_from_me is not None else None
-            )
-            result.append(chat)
+        result = [_chat_from_row(row) for row in chats]
         
-        conn.close()
-        return result
+        return ChatPage(result, next_cursor)
         
     except Exception as e:
         print(f"Error in list_chats: {e}")
-        return []
+        return ChatPage([])
 
 def get_chat(jid: str) -> Optional[Chat]:
     """Get a specific chat by JID."""
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
+        conn = db.get_connection(MESSAGES_DB_PATH)
         cursor = conn.cursor()
         
-        cursor.execute("""
-            SELECT 
-                chats.jid,
-                chats.name,
-                chats.last_message_time,
-                messages.content as last_message,
-                messages.sender as last_sender,
-                messages.is_from_me as last_is_from_me
+        columns, join = _chat_columns(conn)
+        cursor.execute(f"""
+            SELECT {columns}
             FROM chats
-            LEFT JOIN messages ON chats.jid = messages.chat_jid 
-                AND chats.last_message_time = messages.timestamp
+            {join}
             WHERE chats.jid = ?
         """, (jid,))
         
         result = cursor.fetchone()
         if not result:
-            conn.close()
             return None
         
-        jid, name, last_message_time, last_message, last_sender, last_is_from_me = result
-        
-        # Parse timestamp
-        if isinstance(last_message_time, str):
-            try:
-                last_message_time = datetime.fromisoformat(last_message_time)
-            except ValueError:
-                last_message_time = None
-        
-        chat = Chat(
-            jid=jid,
-            name=name,
-            last_message_time=last_message_time,
-            last_message=last_message,
-            last_sender=last_sender,
-            last_is_from_me=bool(last_is_from_me) if last_is_from_me is not None else None
-        )
-        
-        conn.close()
-        return chat
+        return _chat_from_row(result)
         
     except Exception as e:
         print(f"Error in get_chat: {e}")
@@ -940,42 +1658,65 @@ def get_direct_chat_by_contact(phone_number: str) -> Optional[Chat]:
     return get_chat(jid)
 
 def get_contact_chats(phone_number: str) -> List[Chat]:
-    """Get all chats (including groups) where a contact participates."""
+    """Get all chats (including groups) where a contact participates.
+
+    Once the sidecar participation table has caught up, each chat also
+    carries how many messages the contact sent there and when they first
+    and last did (contact_message_count, contact_first_seen, contact_last_seen).
+    """
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
+        conn = db.get_connection(MESSAGES_DB_PATH)
         cursor = conn.cursor()
         
-        # Find chats where the contact has sent messages
-        cursor.execute("""
-            SELECT DISTINCT 
-                chats.jid,
-                chats.name,
-                chats.last_message_time
-            FROM chats
-            JOIN messages ON chats.jid = messages.chat_jid
-            WHERE messages.sender = ? OR chats.jid = ?
-            ORDER BY chats.last_message_time DESC
-        """, (phone_number, f"{phone_number}@s.whatsapp.net"))
+        _sidecar.ensure_fresh()
+        if _sidecar.is_ready(PARTICIPATION.name) and _sidecar.attach(conn):
+            # Chats where the contact has sent messages, from the participation
+            # table, plus the direct chat if it has any message
+            cursor.execute("""
+                SELECT
+                    chats.jid,
+                    chats.name,
+                    chats.last_message_time,
+                    participation.message_count,
+                    participation.first_seen,
+                    participation.last_seen
+                FROM chats
+                LEFT JOIN side.participation AS participation
+                    ON participation.chat_jid = chats.jid AND participation.sender = ?
+                WHERE chats.jid IN (SELECT chat_jid FROM side.participation WHERE sender = ?)
+                OR (chats.jid = ? AND EXISTS (SELECT 1 FROM messages WHERE messages.chat_jid = chats.jid))
+                ORDER BY chats.last_message_time DESC
+            """, (phone_number, phone_number, f"{phone_number}@s.whatsapp.net"))
+        else:
+            # Find chats where the contact has sent messages
+            cursor.execute("""
+                SELECT DISTINCT 
+                    chats.jid,
+                    chats.name,
+                    chats.last_message_time,
+                    NULL,
+                    NULL,
+                    NULL
+                FROM chats
+                JOIN messages ON chats.jid = messages.chat_jid
+                WHERE messages.sender = ? OR chats.jid = ?
+                ORDER BY chats.last_message_time DESC
+            """, (phone_number, f"{phone_number}@s.whatsapp.net"))
         
         results = cursor.fetchall()
         chats = []
         
-        for jid, name, last_message_time in results:
-            # Parse timestamp
-            if isinstance(last_message_time, str):
-                try:
-                    last_message_time = datetime.fromisoformat(last_message_time)
-                except ValueError:
-                    last_message_time = None
-            
+        for jid, name, last_message_time, message_count, first_seen, last_seen in results:
             chat = Chat(
                 jid=jid,
                 name=name,
-                last_message_time=last_message_time
+                last_message_time=last_message_time,
+                contact_message_count=message_count,
+                contact_first_seen=first_seen,
+                contact_last_seen=last_seen
             )
             chats.append(chat)
         
-        conn.close()
         return chats
         
     except Exception as e: